@@ -1,19 +1,17 @@
 import os
+import sys
 import streamlit as st
-import requests
 import pandas as pd
 import time
-import random
 import concurrent.futures
-import urllib.parse
 import json
-import socket
-import subprocess
-import itertools
-import uuid
 import textwrap
+import hashlib
+import sqlite3
+import threading
+import re
+import uuid
 from datetime import datetime
-from bs4 import BeautifulSoup
 
 # 新增：OpenAI SDK 用于调用 DeepSeek
 try:
@@ -21,12 +19,6 @@ try:
 except ImportError:
     OpenAI = None
 
-# 尝试导入 PyYAML
-try:
-    import yaml
-except ImportError:
-    yaml = None
-
 # ================= 配置页面与自定义 CSS =================
 st.set_page_config(
     page_title="DeepSearch Pro",
@@ -101,570 +93,499 @@ if OpenAI and DEEPSEEK_API_KEY:
 else:
     ds_client = None
 
-# ================= 常量配置 =================
-NATURE_JOURNALS_MAP = {
-    "Nature Machine Intelligence": "natmachintell",
-    "Nature Computational Science": "natcomputsci",
-    "Nature Communications": "ncomms",
-    "Nature Methods": "nmeth",
-    "Nature Chemistry": "nchem",
-    "Nature": "nature",
-    "Nature Biotechnology": "nbt",
-    "Nature Biomedical Engineering": "natbiomedeng"
-}
+# ================= 检索引擎 =================
+# 检索逻辑在 search_engine.py (不依赖 Streamlit, 也可作为命令行批量运行)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from search_engine import (
+    API_JOURNALS_LIST, CACHE_DIR, NATURE_JOURNALS_MAP, ClashAPI, ProxyManager, SearchRun,
+    add_translate_key, build_queries, clash_scheduler_for, compile_filter, deduplicate_dataframe,
+    enrich_on_view, find_matched_terms, harvest_bulk, job_manager, paper_id_series,
+    prepare_api_tasks, prepare_nature_tasks, proxy_pool, unique_keys,
+)
 
-API_JOURNALS_LIST = [
-    "IEEE Transactions on Pattern Analysis and Machine Intelligence", 
-    "IEEE Transactions on Neural Networks and Learning Systems",      
-    "IEEE Transactions on Knowledge and Data Engineering",
-    "IEEE Transactions on Image Processing",
-    "Science Advances",
-    "Science",
-    "NeurIPS",
-    "ICLR",
-    "ICML",
-    "CVPR",
-    "ICCV",
-    "ECCV",
-    "ACL",
-    "Findings of the Association for Computational Linguistics",
-    "EMNLP",
-    "Findings of the Association for Computational Linguistics: EMNLP",
-    "COLING",
-    "NAACL",
-    "AAAI",
-    "IJCAI",
-    "Bioinformatics",
-    "ArXiv"
-]
+if 'clash_api' not in st.session_state: st.session_state.clash_api = ClashAPI()
+if 'proxy_manager' not in st.session_state: st.session_state.proxy_manager = ProxyManager()
+# 后台任务归属: 令牌保存在 URL (?owner=) 中, 刷新页面后仍能看到并管理自己的任务; 运行上限与任务列表按令牌区分
+if 'owner' not in st.query_params: st.query_params["owner"] = uuid.uuid4().hex[:12]
+job_owner = st.query_params["owner"]
 
-JOURNAL_DISPLAY_ABBR = {
-    "Nature Machine Intelligence": "Nature MI",
-    "Nature Computational Science": "Nature Comp. Sci",
-    "Nature Communications": "Nature Comm",
-    "Nature Methods": "Nature Methods",
-    "Nature Chemistry": "Nature Chem",
-    "IEEE Transactions on Pattern Analysis and Machine Intelligence": "IEEE TPAMI",
-    "IEEE Transactions on Neural Networks and Learning Systems": "IEEE TNNLS",
-    "IEEE Transactions on Knowledge and Data Engineering": "IEEE TKDE",
-    "Science Advances": "Science Adv",
-    "Association for Computational Linguistics": "ACL",
-    "Findings of the Association for Computational Linguistics": "Findings of ACL",
-    "Empirical Methods in Natural Language Processing": "EMNLP",
-    "Findings of the Association for Computational Linguistics: EMNLP": "Findings of EMNLP",
-    "International Conference on Computational Linguistics": "COLING",
-    "North American Chapter of the Association for Computational Linguistics": "NAACL",
-    "Association for the Advancement of Artificial Intelligence": "AAAI",
-    "International Joint Conference on Artificial Intelligence": "IJCAI"
-}
+# ================= 翻译逻辑 =================
+TRANSLATE_MODEL = "deepseek-chat"
+
+def abstract_digest(text, model=TRANSLATE_MODEL):
+    """Stable key for a translation: sha256 of model + whitespace-normalized abstract."""
+    if not isinstance(text, str) or text.strip() in ["", "暂无摘要"]: return None
+    norm = " ".join(text.split())
+    return hashlib.sha256(f"{model}\n{norm}".encode()).hexdigest()
+
+class TranslationStore:
+    """SQLite store of abstract translations shared by every session, user and process."""
+    def __init__(self, path):
+        if path != ":memory:": os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS translations (digest TEXT PRIMARY KEY, model TEXT, translation TEXT, created_at REAL)")
+        self._conn.commit()
+
+    def get(self, digest):
+        return self.get_many([digest]).get(digest) if digest else None
+
+    def get_many(self, digests):
+        digests = list(digests)
+        found = {}
+        with self._lock:
+            for i in range(0, len(digests), 500):
+                chunk = digests[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT digest, translation FROM translations WHERE digest IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                found.update(rows)
+        return found
+
+    def put(self, digest, translation, model=TRANSLATE_MODEL):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO translations VALUES (?,?,?,?)", (digest, model, translation, time.time()))
+            self._conn.commit()
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+
+@st.cache_resource
+def get_translation_store():
+    try:
+        return TranslationStore(os.path.join(CACHE_DIR, "translations.sqlite"))
+    except (OSError, sqlite3.Error):
+        return TranslationStore(":memory:")
 
-def deduplicate_dataframe(df):
-    """Drop duplicates using a stable key of title + journal + year."""
-    if df.empty: return df
-    df = df.copy()
-    title = df['Title'].fillna('').astype(str).str.strip().str.lower() if 'Title' in df else ""
-    journal = df['Journal'].fillna('').astype(str).str.strip().str.lower() if 'Journal' in df else ""
-    year = df['Year'].fillna('').astype(str) if 'Year' in df else ""
-    df['_dedup_key'] = title + "|" + journal + "|" + year
-    df = df.drop_duplicates(subset=['_dedup_key'])
-    return df.drop(columns=['_dedup_key'])
-
-def find_matched_terms(title_txt, abs_txt, filter_struct):
-    """Return list of matched keywords (one per group) based on provided filter_struct."""
-    if not filter_struct: return []
-    content = (title_txt + " " + abs_txt).lower()
-    matched = []
-    for group in filter_struct:
-        hit = None
-        for k in group:
-            clean_k = k.replace('"', '').replace("'", "").lower()
-            if clean_k and clean_k in content:
-                hit = clean_k
-                break
-        if hit: matched.append(hit)
-    return matched
-
-def item_key(obj, prefix="item"):
-    """Create a stable key from a mapping-like row."""
-    if obj is None: return prefix
-    if isinstance(obj, dict):
-        t = obj.get('Title')
-        j = obj.get('Journal')
-        y = obj.get('Year')
-        u = obj.get('URL')
-        k = obj.get('TranslateKey')
-    else:
-        t = obj['Title'] if 'Title' in obj else None
-        j = obj['Journal'] if 'Journal' in obj else None
-        y = obj['Year'] if 'Year' in obj else None
-        u = obj['URL'] if 'URL' in obj else None
-        k = obj['TranslateKey'] if 'TranslateKey' in obj else None
-    if k: return str(k)
-    return f"{prefix}_{hash(str(t))}_{hash(str(j))}_{hash(str(y))}_{hash(str(u))}"
-
-def add_translate_key(df, prefix):
-    """Add a stable translation key column for session translations."""
-    df = df.copy()
-    df['TranslateKey'] = [f"{prefix}_{idx}_{hash(str(title))}" for idx, title in zip(df.index, df['Title'])]
-    return df
+translation_store = get_translation_store()
 
 def apply_cn_column(df):
-    """Populate Abstract_CN from existing column or session translations."""
+    """Populate Abstract_CN from the existing column or, in bulk, from the persistent translation store."""
     if df.empty: return df
     df = df.copy()
-    def _get_cn(row):
-        # existing CN value in CSV
-        if 'Abstract_CN' in row and pd.notna(row['Abstract_CN']) and str(row['Abstract_CN']).strip():
-            return row['Abstract_CN']
-        key = row.get('TranslateKey')
-        if key and key in st.session_state.get('translations', {}):
-            return st.session_state['translations'][key]
-        return None
-    df['Abstract_CN'] = df.apply(_get_cn, axis=1)
+    existing = df['Abstract_CN'] if 'Abstract_CN' in df else pd.Series(None, index=df.index, dtype=object)
+    has_cn = existing.notna() & existing.astype(str).str.strip().ne('')
+    abstracts = df['Abstract'] if 'Abstract' in df else pd.Series(None, index=df.index, dtype=object)
+    digests = df['AbstractDigest'] if 'AbstractDigest' in df else abstracts.map(abstract_digest)
+    digests = digests.where(~has_cn)
+    found = translation_store.get_many(digests.dropna().unique())
+    df['Abstract_CN'] = existing.where(has_cn, digests.map(found))
     return df
 
-def batch_translate(df, max_workers=1000):
-    """Translate all abstracts missing CN and store into session + df column."""
-    if df.empty or 'Abstract' not in df: return df, 0
-    to_translate = []
-    for idx, row in df.iterrows():
-        key = row.get('TranslateKey')
-        cn_val = row.get('Abstract_CN')
-        abst = row.get('Abstract')
-        if (not key) or (not abst) or str(abst).strip() in ["", "暂无摘要"]: 
-            continue
-        if cn_val and str(cn_val).strip(): 
-            continue
-        if key in st.session_state.get('translations', {}):
-            continue
-        to_translate.append((key, str(abst)))
-    if not to_translate: 
-        return df, 0
-    workers = min(max_workers, len(to_translate))
-    with st.spinner(f"批量翻译中... {len(to_translate)} 篇"):
-        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as exc:
-            futures = {exc.submit(translate_text_deepseek, text): key for key, text in to_translate}
-            for fut in concurrent.futures.as_completed(futures):
-                res = fut.result()
-                k = futures[fut]
-                st.session_state['translations'][k] = res
-    df = apply_cn_column(df)
-    return df, len(to_translate)
 
-# ================= 翻译逻辑 =================
 def translate_text_deepseek(text):
     if not ds_client: return "请先安装 openai 库: pip install openai"
     if not text or len(text) < 10: return "摘要过短，无需翻译。"
+    digest = abstract_digest(text)
+    cached = translation_store.get(digest)
+    if cached: return cached
     sys_prompt = "你是一位专业的学术论文翻译助手。请将用户的英文摘要翻译成通顺、准确的中文。保留专业术语的准确性。"
     try:
         response = ds_client.chat.completions.create(
-            model="deepseek-chat",
+            model=TRANSLATE_MODEL,
             messages=[{"role": "system", "content": sys_prompt}, {"role": "user", "content": text}],
             stream=False, temperature=0.3
         )
-        return response.choices[0].message.content
+        result = response.choices[0].message.content
     except Exception as e: return f"翻译失败: {str(e)}"
+    if digest and result: translation_store.put(digest, result)
+    return result
+
+# 打包翻译：每个请求携带多篇摘要，共享一次 system prompt
+TRANSLATE_PACK_SIZE = 8
+TRANSLATE_PACK_CHARS = 12000
+TRANSLATE_MAX_CONCURRENCY = 16
+TRANSLATE_MAX_ROUNDS = 3
+PACK_MARKER_RE = re.compile(r"\[\[(\d+)\]\]")
+
+class AdaptiveConcurrency:
+    """AIMD concurrency limit: +1 slot after a success, halved after a failure."""
+    def __init__(self, initial, maximum, minimum=1):
+        self.limit = initial
+        self.maximum = maximum
+        self.minimum = minimum
+        self.active = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self.active >= self.limit: self._cond.wait()
+            self.active += 1
+
+    def release(self, ok):
+        with self._cond:
+            self.active -= 1
+            if ok: self.limit = min(self.maximum, self.limit + 1)
+            else: self.limit = max(self.minimum, self.limit // 2)
+            self._cond.notify_all()
+
+def pack_abstracts(items, pack_size=TRANSLATE_PACK_SIZE, max_chars=TRANSLATE_PACK_CHARS):
+    """Group (digest, text) pairs into packs bounded by count and total characters."""
+    packs, cur, cur_len = [], [], 0
+    for digest, text in items:
+        if cur and (len(cur) >= pack_size or cur_len + len(text) > max_chars):
+            packs.append(cur)
+            cur, cur_len = [], 0
+        cur.append((digest, text))
+        cur_len += len(text)
+    if cur: packs.append(cur)
+    return packs
+
+def translate_pack_deepseek(pack):
+    """Translate several abstracts in one request; return {digest: translation} for the items that parsed."""
+    sys_prompt = (
+        "你是一位专业的学术论文翻译助手。请将用户的英文摘要翻译成通顺、准确的中文。保留专业术语的准确性。"
+        "用户会给出若干篇以 [[编号]] 开头的摘要，请逐篇翻译，每篇译文前原样保留对应的 [[编号]] 标记，不要输出其他内容。"
+    )
+    user_msg = "\n\n".join(f"[[{i}]]\n{text}" for i, (_, text) in enumerate(pack, start=1))
+    response = ds_client.chat.completions.create(
+        model=TRANSLATE_MODEL,
+        messages=[{"role": "system", "content": sys_prompt}, {"role": "user", "content": user_msg}],
+        stream=False, temperature=0.3
+    )
+    content = response.choices[0].message.content or ""
+    parts = PACK_MARKER_RE.split(content)
+    out = {}
+    for num, body in zip(parts[1::2], parts[2::2]):
+        idx = int(num) - 1
+        if 0 <= idx < len(pack) and body.strip(): out[pack[idx][0]] = body.strip()
+    if len(pack) == 1 and not out and content.strip(): out[pack[0][0]] = content.strip()
+    return out
+
+def batch_translate(df, max_workers=TRANSLATE_MAX_CONCURRENCY):
+    """Translate every distinct abstract missing CN exactly once, packed several per request.
+
+    Packs run under an adaptive concurrency limit; items missing from a reply
+    (or from a failed request) are re-packed into smaller packs and retried.
+    Translations are written to the store and shown as they arrive.
+    """
+    if df.empty or 'Abstract' not in df: return df, 0
+    df = apply_cn_column(df)
+    pending = df.loc[df['Abstract_CN'].isna(), 'Abstract']
+    to_translate = {}
+    for abst in pending:
+        digest = abstract_digest(abst)
+        if digest and len(str(abst)) >= 10: to_translate.setdefault(digest, str(abst))
+    if not to_translate:
+        return df, 0
+    if not ds_client:
+        st.error("请先安装 openai 库并配置 DEEPSEEK_API_KEY")
+        return df, 0
 
-# ================= Clash API 控制器 =================
-class ClashAPI:
-    def __init__(self, base_url="http://127.0.0.1:9090", secret=""):
-        self.base_url = base_url.rstrip('/')
-        self.secret = secret
-        self.connected = False
-    
-    def _get_headers(self):
-        headers = {}
-        if self.secret: headers["Authorization"] = f"Bearer {self.secret}"
-        return headers
+    limiter = AdaptiveConcurrency(min(4, max_workers), max_workers)
+    def _run(pack):
+        limiter.acquire()
+        try:
+            res = translate_pack_deepseek(pack)
+        except Exception:
+            limiter.release(False)
+            return {}
+        limiter.release(len(res) == len(pack))
+        return res
+
+    total = len(to_translate)
+    done = 0
+    prog = st.progress(0.0, text=f"批量翻译中... 0 / {total}")
+    live = st.empty()
+    remaining = list(to_translate.items())
+    pack_size = TRANSLATE_PACK_SIZE
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as exc:
+        for _ in range(TRANSLATE_MAX_ROUNDS):
+            if not remaining: break
+            futures = {exc.submit(_run, pack): pack for pack in pack_abstracts(remaining, pack_size)}
+            failed = []
+            for fut in concurrent.futures.as_completed(futures):
+                res = fut.result()
+                for digest, text in futures[fut]:
+                    if digest in res:
+                        translation_store.put(digest, res[digest])
+                        done += 1
+                        live.info(res[digest][:300])
+                    else:
+                        failed.append((digest, text))
+                prog.progress(done / total, text=f"批量翻译中... {done} / {total}")
+            remaining = failed
+            pack_size = max(1, pack_size // 4)
+    prog.empty()
+    live.empty()
+    if remaining: st.warning(f"{len(remaining)} 篇摘要翻译失败，可稍后重试")
+    df = apply_cn_column(df)
+    return df, done
 
-    def _get_session(self):
-        session = requests.Session()
-        session.trust_env = False
-        return session
+# ================= 结果视图准备 =================
+def results_digest(results):
+    """Content digest of a result list; the cache key for everything derived from it."""
+    return hashlib.sha256(json.dumps(results, sort_keys=True, default=str, ensure_ascii=False).encode()).hexdigest()
 
-    def test_connection(self):
-        try:
-            s = self._get_session()
-            r = s.get(f"{self.base_url}/configs", headers=self._get_headers(), timeout=2)
-            if r.status_code == 200:
-                self.connected = True
-                return True, "✅ 连接成功"
-            elif r.status_code == 401: return False, "❌ 401 Unauthorized"
-            else: return False, f"❌ HTTP {r.status_code}"
-        except Exception as e: return False, f"❌ 无法连接: {str(e)}"
-
-    def get_configs(self):
-        try:
-            s = self._get_session()
-            r = s.get(f"{self.base_url}/configs", headers=self._get_headers(), timeout=2)
-            return r.json() if r.status_code == 200 else {}
-        except: return {}
+@st.cache_data(max_entries=8, show_spinner=False)
+def prepare_online_df(digest, filter_struct, strict, _results):
+    """Filter, normalize, dedup, key and sort online results once per (results, filter) pair.
 
-    def patch_mode(self, mode):
-        try:
-            s = self._get_session()
-            s.patch(f"{self.base_url}/configs", json={"mode": mode}, headers=self._get_headers(), timeout=2)
-            return True
-        except: return False
-    
-    def get_proxies(self):
-        try:
-            s = self._get_session()
-            r = s.get(f"{self.base_url}/proxies", headers=self._get_headers(), timeout=2)
-            return r.json()['proxies'] if r.status_code == 200 else {}
-        except: return {}
-        
-    def select_proxy(self, group_name, proxy_name):
+    Returns (df, n_results, n_after_filter, n_dedup_removed).
+    """
+    df_raw = pd.DataFrame(_results)
+    n_total = len(df_raw)
+    kf = compile_filter(filter_struct) if strict else None
+    if kf and not df_raw.empty: df_raw = df_raw[kf.mask(df_raw)].copy()
+    n_filtered = len(df_raw)
+    if df_raw.empty: return df_raw, n_total, n_filtered, 0
+    if 'Journal' not in df_raw.columns and 'venue' in df_raw.columns:
+        df_raw['Journal'] = df_raw['venue']
+    if 'Journal' in df_raw.columns and 'venue' in df_raw.columns:
+        # Replace empty/placeholder Journal with venue when available
+        mask_unknown = df_raw['Journal'].astype(str).str.strip().isin(['', 'Unknown', 'nan'])
+        df_raw.loc[mask_unknown, 'Journal'] = df_raw.loc[mask_unknown, 'venue']
+    if 'Journal' in df_raw.columns:
+        df_raw['Journal'] = df_raw['Journal'].fillna('Unknown').astype(str)
+    if 'FullJournal' not in df_raw.columns and 'Journal' in df_raw.columns:
+        df_raw['FullJournal'] = df_raw['Journal']
+    df_raw['SortYear'] = pd.to_numeric(df_raw['Year'], errors='coerce').fillna(0)
+
+    df = deduplicate_dataframe(df_raw)
+    dedup_removed = len(df_raw) - len(df)
+    df = add_translate_key(df, "online")
+    df['AbstractDigest'] = df['Abstract'].map(abstract_digest)
+    df = df.sort_values(by=['SortYear', 'DisplayDate'], ascending=[False, False])
+    return df, n_total, n_filtered, dedup_removed
+
+# 统一字段 <- 原始导出中的别名 (Semantic Scholar 原始字段)
+PREVIEW_COLUMN_ALIASES = {
+    "Journal": ["venue"], "Year": ["year"], "Title": ["title"], "Citations": ["citationCount"],
+    "Abstract": ["abstract"], "URL": ["url"], "DisplayDate": ["publicationDate"],
+}
+PREVIEW_COLUMNS = [
+    "PaperID", "Year", "DisplayDate", "Journal", "FullJournal", "Title", "Citations", "URL", "Abstract", "Abstract_CN",
+    "MatchKeyword", "Source", "paperId", "DOI", "OpenAccessPdf", "PublicationDate",
+]
+PREVIEW_CATEGORICAL = ["Journal", "FullJournal", "Source", "MatchKeyword"]
+PREVIEW_CHUNK_ROWS = 50_000
+
+def normalize_preview_chunk(chunk):
+    """Apply the column mapping once and coerce to the compact preview schema."""
+    for canon, aliases in PREVIEW_COLUMN_ALIASES.items():
+        for alias in aliases:
+            if alias not in chunk.columns: continue
+            if canon not in chunk.columns: chunk[canon] = chunk[alias]
+            else: chunk[canon] = chunk[canon].fillna(chunk[alias])
+    if 'venue' in chunk.columns and 'Journal' in chunk.columns:
+        # Replace empty/placeholder Journal with venue when available
+        mask_unknown = chunk['Journal'].astype(str).str.strip().isin(['', 'Unknown', 'nan'])
+        chunk.loc[mask_unknown, 'Journal'] = chunk.loc[mask_unknown, 'venue']
+    chunk = chunk[[c for c in PREVIEW_COLUMNS if c in chunk.columns]].copy()
+    for col in ["Title", "Journal"]:
+        if col not in chunk.columns: chunk[col] = None
+    chunk['Journal'] = chunk['Journal'].fillna('Unknown').astype(str)
+    if 'FullJournal' in chunk.columns: chunk['FullJournal'] = chunk['FullJournal'].fillna(chunk['Journal'])
+    else: chunk['FullJournal'] = chunk['Journal']
+    # Normalize numeric fields for filtering/sorting
+    chunk['Year'] = pd.to_numeric(chunk['Year'], errors='coerce').fillna(0).astype('int16') if 'Year' in chunk.columns else 0
+    if 'Citations' in chunk.columns:
+        chunk['Citations'] = pd.to_numeric(chunk['Citations'], errors='coerce').round().astype('Int32')
+    chunk['PaperID'] = paper_id_series(chunk)
+    for col in PREVIEW_CATEGORICAL:
+        if col in chunk.columns: chunk[col] = chunk[col].astype('category')
+    return chunk
+
+def concat_preview_chunks(chunks):
+    """Concatenate chunks, unioning categoricals so they stay categorical."""
+    if len(chunks) == 1: return chunks[0].reset_index(drop=True)
+    # 列顺序取所有分块的并集: 只在后面文件中出现的列 (如 Abstract_CN) 也要保留
+    cols = list(dict.fromkeys(c for ch in chunks for c in ch.columns))
+    cat_cols = [c for c in cols if all(c in ch.columns and isinstance(ch[c].dtype, pd.CategoricalDtype) for ch in chunks)]
+    df = pd.concat([ch.drop(columns=cat_cols) for ch in chunks], ignore_index=True)
+    for col in cat_cols:
+        df[col] = pd.Categorical(pd.api.types.union_categoricals([ch[col] for ch in chunks], ignore_order=True))
+    return df[cols]
+
+@st.cache_data(max_entries=4, show_spinner="读取文件中...")
+def load_preview_df(files_key, _files):
+    """Read any number of CSV / Parquet uploads chunk by chunk into one compact, deduplicated frame.
+
+    Returns (df, errors, n_dedup_removed). Near-duplicate merging runs once per
+    set of files here, not on every filter / sort change.
+    """
+    chunks, errors = [], []
+    for uf in _files:
         try:
-            s = self._get_session()
-            safe_group = urllib.parse.quote(group_name)
-            s.put(f"{self.base_url}/proxies/{safe_group}", json={"name": proxy_name}, headers=self._get_headers(), timeout=2)
-            return True
-        except: return False
+            uf.seek(0)
+            if uf.name.lower().endswith(".parquet"):
+                chunks.append(normalize_preview_chunk(pd.read_parquet(uf)))
+            else:
+                for chunk in pd.read_csv(uf, chunksize=PREVIEW_CHUNK_ROWS, low_memory=False):
+                    chunks.append(normalize_preview_chunk(chunk))
+        except Exception as e:
+            errors.append(f"文件 {uf.name} 读取失败: {e}")
+    if not chunks: return None, errors, 0
+    df = concat_preview_chunks(chunks)
+    deduped = deduplicate_dataframe(df).reset_index(drop=True)
+    deduped['TranslateKey'] = unique_keys("local", deduped['PaperID'])
+    return deduped, errors, len(df) - len(deduped)
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def prepare_preview_df(files_key, journals, years, filter_struct, sort_by, _df):
+    """Journal/year/keyword filter and sort the (already deduplicated and keyed) preview corpus."""
+    df_filtered = _df[
+        (_df['Journal'].isin(journals)) &
+        (_df['Year'] >= years[0]) &
+        (_df['Year'] <= years[1])
+    ]
+    kf = compile_filter(filter_struct)
+    if kf: df_filtered = df_filtered[kf.mask(df_filtered)]
 
-if 'clash_api' not in st.session_state: st.session_state.clash_api = ClashAPI()
+    if sort_by == "引用":
+        if 'Citations' in df_filtered.columns:
+            df_filtered = df_filtered.assign(Citations_Num=pd.to_numeric(df_filtered['Citations'], errors='coerce').fillna(0))
+            df_filtered = df_filtered.sort_values(by='Citations_Num', ascending=False)
+    else:
+        df_filtered = df_filtered.sort_values(by='Year', ascending=False)
 
-# ================= 代理池管理器 =================
-class ProxyManager:
-    def __init__(self): self.proxies = []
-    def load_manual_proxies(self, text_input):
-        if not text_input: return 0
-        raw_list = text_input.replace('\n', ';').split(';')
-        valid_proxies = []
-        for p in raw_list:
-            p = p.strip()
-            if not p: continue
-            if not p.startswith("http"): p = f"http://{p}"
-            valid_proxies.append(p)
-        self.proxies = valid_proxies
-        return len(self.proxies)
+    df_filtered = df_filtered.copy()
+    df_filtered['AbstractDigest'] = df_filtered['Abstract'].map(abstract_digest) if 'Abstract' in df_filtered else None
+    return df_filtered
 
-if 'proxy_manager' not in st.session_state: st.session_state.proxy_manager = ProxyManager()
+def csv_export(df, complete=None):
+    """Zero-arg callable for st.download_button: the CSV is only built when the user clicks.
 
-# ================= 浏览器伪装 =================
-def get_browser_headers(manual_cookie=""):
-    user_agents = [
-        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36",
-        "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36"
-    ]
-    headers = {
-        "User-Agent": random.choice(user_agents),
-        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8",
-        "Referer": "https://www.nature.com/",
-        "Cache-Control": "max-age=0",
-        "Upgrade-Insecure-Requests": "1"
-    }
-    if manual_cookie: headers["Cookie"] = manual_cookie
-    return headers
-
-def test_proxy_connection(proxy_url):
-    proxies = {"http": proxy_url, "https": proxy_url}
-    try:
-        start_t = time.time()
-        r = requests.get("https://www.nature.com", proxies=proxies, timeout=10, headers=get_browser_headers())
-        latency = (time.time() - start_t) * 1000
-        if r.status_code == 200: return True, f"✅ 连接成功 ({latency:.0f}ms)"
-        elif r.status_code in [303, 403]: return False, f"⚠️ 连通但被拦截 (Status {r.status_code})"
-        else: return False, f"⚠️ Status {r.status_code}"
-    except Exception as e: return False, f"❌ 连接失败: {str(e)}"
-
-# ================= 辅助功能 =================
-def fetch_google_scholar_citation(title, proxies):
-    url = "https://scholar.google.com/scholar"
-    params = {"q": title, "hl": "en", "as_sdt": "0,5"}
-    try:
-        time.sleep(random.uniform(1.0, 3.0))
-        s = requests.Session()
-        s.headers.update(get_browser_headers())
-        r = s.get(url, params=params, proxies=proxies, timeout=10)
-        if r.status_code == 200:
-            soup = BeautifulSoup(r.text, 'html.parser')
-            res = soup.find("div", class_="gs_ri")
-            if not res: return "0"
-            for link in res.find_all("a"):
-                txt = link.get_text()
-                if "Cited by" in txt: return txt.replace("Cited by", "").strip()
-                if "被引用次数" in txt: return txt.replace("被引用次数：", "").strip()
-            return "0"
-        elif r.status_code == 429: return "429(Busy)"
-        return f"Err{r.status_code}"
-    except: return "Error"
-
-def fetch_nature_full_abstract(article_url, session):
-    try:
-        time.sleep(random.uniform(0.5, 1.5))
-        r = session.get(article_url, timeout=15)
-        if r.status_code == 200:
-            soup = BeautifulSoup(r.text, 'html.parser')
-            abs_div = soup.find("div", id="Abs1-content")
-            if abs_div: return abs_div.get_text(strip=True)
-            sections = soup.find_all("div", class_="c-article-section__content")
-            for sec in sections:
-                t = sec.get_text(strip=True)
-                if len(t) > 200: return t
-            meta = soup.find("meta", attrs={"name": "description"})
-            if meta: return meta.get("content", "").strip()
-    except: pass
-    return None
-
-def switch_clash_node_worker(api_url, secret, group, nodes):
-    try:
-        if not nodes: return None
-        target = random.choice(nodes)
-        headers = {}
-        if secret: headers["Authorization"] = f"Bearer {secret}"
-        safe_group = urllib.parse.quote(group)
-        requests.put(f"{api_url}/proxies/{safe_group}", json={"name": target}, headers=headers, timeout=1)
-        return target
-    except: return None
-
-# ================= Nature Worker =================
-def process_nature_article_enrichment(item, session, proxies, enable_full_abstract, enable_scholar, filter_kws_structured, strict_filter):
-    logs = []
-    if enable_full_abstract:
-        full = fetch_nature_full_abstract(item['URL'], session)
-        if full: 
-            item['Abstract'] = full
-            logs.append("Full Abs Fetched")
-    
-    if strict_filter and filter_kws_structured:
-        content = (item['Title'] + " " + item['Abstract']).lower()
-        is_match = True
-        missing_groups = []
-        for group in filter_kws_structured:
-            group_match = False
-            for k in group:
-                clean_k = k.replace('"', '').replace("'", "").lower()
-                if clean_k in content:
-                    group_match = True
-                    break
-            if not group_match:
-                is_match = False
-                missing_groups.append(group)
-                break 
-        if not is_match:
-            logs.append(f"Skipped")
-            return None, logs
-
-    if enable_scholar:
-        cite = fetch_google_scholar_citation(item['Title'], proxies)
-        item['Citations'] = cite
-        logs.append(f"Scholar: {cite}")
+    `complete` (frame -> frame) runs first, e.g. to fetch abstracts still deferred to view.
+    """
+    def build():
+        out = complete(df) if complete else df
+        cols = [c for c in out.columns if c not in ('AbstractDigest', 'SortYear', 'Citations_Num', 'TranslateKey', 'AbstractPending')]
+        return out[cols].to_csv(index=False).encode('utf-8-sig')
+    return build
+
+# ================= 按需补全 =================
+def apply_lazy_enrichment(df, enriched):
+    """Overlay fields fetched on view (PaperID -> fields, from enrich_on_view) onto a result frame."""
+    if df.empty or not enriched: return df
+    hit = df['PaperID'].isin(enriched.keys())
+    if not hit.any(): return df
+    df = df.copy()
+    old_abs = df.loc[hit, 'Abstract'].copy() if 'Abstract' in df else None
+    for col in ("Abstract", "Citations", "AbstractPending"):
+        vals = df.loc[hit, 'PaperID'].map(lambda pid: enriched[pid].get(col))
+        vals = vals[vals.notna()]
+        if vals.empty: continue
+        if col not in df: df[col] = None
+        elif df[col].dtype != object: df[col] = df[col].astype(object)
+        df.loc[vals.index, col] = vals
+    if old_abs is not None:
+        changed = old_abs.index[df.loc[hit, 'Abstract'].ne(old_abs)]
+        df.loc[changed, 'AbstractDigest'] = df.loc[changed, 'Abstract'].map(abstract_digest)
+        if 'Abstract_CN' in df: df.loc[changed, 'Abstract_CN'] = None
+    return df
+
+def complete_pending(df, enriched, proxies, cookie):
+    """Fetch every abstract of `df` still deferred to view (before export / translation) and overlay it."""
+    if df.empty or 'AbstractPending' not in df: return df
+    need = df['AbstractPending'].eq(True) & ~df['PaperID'].isin(enriched.keys())
+    if need.any(): enriched.update(enrich_on_view(df[need].to_dict('records'), proxies, cookie))
+    return apply_lazy_enrichment(df, enriched)
+
+def enrich_visible(page, enriched, proxies, cookie, citations):
+    """Fetch deferred abstracts (and citations) for the rows on screen, once per row and session."""
+    if page.empty: return page
+    need = page['AbstractPending'].eq(True) if 'AbstractPending' in page else pd.Series(False, index=page.index)
+    if citations and 'Citations' in page: need |= page['Citations'].astype(str).isin(["N/A", "", "None", "nan"])
+    need &= ~page['PaperID'].isin(enriched.keys())
+    if need.any():
+        with st.spinner(f"按需补全 {int(need.sum())} 篇..."):
+            enriched.update(enrich_on_view(page[need].to_dict('records'), proxies, cookie, citations))
+    return apply_cn_column(apply_lazy_enrichment(page, enriched))
+
+# ================= 结果卡片渲染 =================
+PAGE_SIZE_OPTIONS = [20, 50, 100, 200]
+
+def paginate_frame(df, state_key, page_size):
+    """Server-side cursor: render pager controls and return only the rows of the current page.
+
+    The page index lives in st.session_state[state_key], so it survives reruns
+    and is clamped when the underlying frame shrinks (filtering / deletion).
+    """
+    n_pages = max(1, -(-len(df) // page_size))
+    if st.session_state.get(state_key, 1) > n_pages: st.session_state[state_key] = n_pages
+    if n_pages > 1:
+        c_prev, c_num, c_next, c_info = st.columns([1, 2, 1, 4])
+        if c_prev.button("◀", key=f"{state_key}_prev", disabled=st.session_state.get(state_key, 1) <= 1):
+            st.session_state[state_key] -= 1
+        if c_next.button("▶", key=f"{state_key}_next", disabled=st.session_state.get(state_key, 1) >= n_pages):
+            st.session_state[state_key] += 1
+        c_num.number_input("页码", 1, n_pages, key=state_key, label_visibility="collapsed")
+        page = st.session_state[state_key]
+        c_info.caption(f"第 {page} / {n_pages} 页 · 共 {len(df)} 篇")
+    else:
+        page = 1
+    start = (page - 1) * page_size
+    return df.iloc[start:start + page_size]
+
+def render_paper_cards(sub, selected, removed, filter_struct, key_prefix=""):
+    """Render paper cards for one page; widget keys derive from TranslateKey so they are stable across pages."""
+    for idx, r in sub.iterrows():
+        # 复合键解决 Duplicate Key
+        key = r['TranslateKey'] if 'TranslateKey' in r else f"{key_prefix}{r['PaperID']}"
+        cite_val = r['Citations'] if 'Citations' in r else "N/A"
+        if str(cite_val) in ["N/A", "0", "0.0", "nan", "None", "", "<NA>"]:
+            cite_badge = '<span class="badge badge-cite" style="background:linear-gradient(135deg,#9ca3af,#6b7280)">Cite: Unknown</span>'
+        else:
+            cite_badge = f'<span class="badge badge-cite">🔥 Cite: {cite_val}</span>'
         
-    return item, logs
-
-def scrape_nature_worker(task_args):
-    q_str, j_name, j_code, start_y, end_y, use_proxy, proxies_list, cookie, clash_cfg, en_scholar, en_full_abs, filter_kws_struct, max_pages, strict_filter = task_args
-    papers = []
-    logs = []
-    base_url = "https://www.nature.com/search"
-    max_retries = 3 if use_proxy else 1
-    
-    for page_num in range(1, max_pages + 1):
-        params = {"q": q_str, "journal": j_code, "order": "date_desc", "page": page_num}
-        page_success = False
-        for attempt in range(max_retries):
-            switched = None
-            if clash_cfg and clash_cfg.get('enabled') and clash_cfg.get('nodes'):
-                switched = switch_clash_node_worker(clash_cfg['url'], clash_cfg['secret'], clash_cfg['group'], clash_cfg['nodes'])
-                time.sleep(0.5)
-            
-            sess = requests.Session()
-            sess.headers.update(get_browser_headers(cookie))
-            proxies = None
-            if use_proxy and proxies_list:
-                p = proxies_list[0]
-                proxies = {"http": p, "https": p}
+        # --- 美化后的卡片式布局 ---
+        with st.container():
+            card_html = textwrap.dedent(f"""
+                <div class="paper-card">
+                    <h4>{r['Title']}</h4>
+                    <div style="margin-bottom: 10px;">
+                        <span class="badge badge-year">{r['Year']}</span>
+                        <span class="badge badge-journal">{r['Journal']}</span>
+                        {cite_badge}
+                        <span style="color: gray; font-size: 0.9em; margin-left: 5px;">📅 {r.get('DisplayDate', r['Year'])}</span>
+                    </div>
+                </div>
+            """).strip()
+            st.markdown(card_html, unsafe_allow_html=True)
             
-            log_prefix = f"[{datetime.now().strftime('%H:%M:%S')}] {j_name} P{page_num} (Try {attempt+1})"
-            if switched: logs.append(f"{log_prefix} | Switched: {switched}")
+            c1, c2 = st.columns([0.05, 0.95])
+            with c1:
+                sel_val = st.checkbox("", key=f"sel_{key_prefix}{key}", value=(key in selected), label_visibility="collapsed")
+                if sel_val: selected.add(key)
+                else: selected.discard(key)
             
-            try:
-                resp = sess.get(base_url, params=params, proxies=proxies, timeout=15, allow_redirects=True)
-                if "idp.nature.com" in resp.url or "authorize" in resp.url:
-                    logs.append("  -> ⚠️ Blocked")
-                    if attempt < max_retries-1: continue
-                    break 
+            with c2:
+                abst = r['Abstract'] if 'Abstract' in r and pd.notna(r['Abstract']) and r['Abstract'] else "暂无摘要"
+                cn_txt = r.get('Abstract_CN')
                 
-                if resp.status_code == 200:
-                    soup = BeautifulSoup(resp.text, 'html.parser')
-                    arts = soup.find_all("li", class_="app-article-list-row__item") or soup.find_all("article", class_="u-full-height")
-                    if not arts:
-                        logs.append("  -> No items.")
-                        page_success = True 
-                        break 
-                    logs.append(f"  -> Found {len(arts)} items")
-                    
-                    prelim_papers = []
-                    for art in arts:
-                        try:
-                            title_tag = art.find("a", class_="c-card__link")
-                            if not title_tag: continue
-                            title = title_tag.get_text().strip()
-                            link = "https://www.nature.com" + title_tag['href'] if title_tag['href'].startswith("/") else title_tag['href']
-                            date_tag = art.find("time")
-                            py = 0
-                            p_date = ""
-                            if date_tag:
-                                p_date = date_tag.get_text().strip()
-                                if len(p_date) >= 4: py = int(p_date[-4:])
-                            abs_txt = "暂无摘要"
-                            sum_div = art.find("div", class_="c-card__summary")
-                            if sum_div: abs_txt = sum_div.get_text().strip()
-                            
-                            if start_y <= py <= end_y:
-                                prelim_papers.append({
-                                    "Year": py, "DisplayDate": p_date, "Journal": JOURNAL_DISPLAY_ABBR.get(j_name, j_name),
-                                    "FullJournal": j_name, "Title": title, "Citations": "N/A", "URL": link,
-                                    "Abstract": abs_txt, "MatchKeyword": q_str, "Source": "Nature Official"
-                                })
-                        except: continue
-                    
-                    if prelim_papers:
-                        # 内部并行处理详情
-                        with concurrent.futures.ThreadPoolExecutor(max_workers=5) as exc:
-                            futures = {exc.submit(process_nature_article_enrichment, p, sess, proxies, en_full_abs, en_scholar, filter_kws_struct, strict_filter): p for p in prelim_papers}
-                            for fut in concurrent.futures.as_completed(futures):
-                                try:
-                                    p_res, p_logs = fut.result()
-                                    if p_res: papers.append(p_res)
-                                    if p_logs: logs.extend([f"    {l}" for l in p_logs])
-                                except: pass
-                    
-                    page_success = True
-                    break 
-                if attempt < max_retries-1: continue
-            except Exception as e:
-                logs.append(f"  -> Err: {str(e)}")
-                if attempt < max_retries-1: continue
-        if not page_success: logs.append("  -> Page failed.")
-            
-    return papers, None, logs
-
-# ================= API Worker =================
-def search_api_worker(task_args):
-    q_str, start, end, limit, venues_chunk, proxies, filter_kws_struct, strict_filter, ignore_venue_filter = task_args
-    url = "https://api.semanticscholar.org/graph/v1/paper/search"
-    
-    params = {
-        "query": q_str, "year": f"{start}-{end}", "limit": limit,
-        "fields": "paperId,title,url,venue,year,abstract,citationCount,openAccessPdf,publicationDate"
-    }
-    if not ignore_venue_filter and venues_chunk:
-        params["venue"] = ",".join(venues_chunk)
-        
-    logs = []
-    max_retries = 3
-    for attempt in range(max_retries):
-        try:
-            time.sleep(random.uniform(1.0, 3.0)) 
-            r = requests.get(url, params=params, headers={"User-Agent": "ResearchTool/Pro"}, proxies=proxies, timeout=20)
-            if r.status_code == 200:
-                raw_data = r.json().get("data", [])
-                filtered_data = []
-                for p in raw_data:
-                    if strict_filter and filter_kws_struct:
-                        txt = (p.get("title","") + " " + (p.get("abstract") or "")).lower()
-                        is_match = True
-                        for group in filter_kws_struct:
-                            group_match = False
-                            for k in group:
-                                clean_k = k.replace('"', '').replace("'", "").lower()
-                                if clean_k in txt:
-                                    group_match = True
-                                    break
-                            if not group_match:
-                                is_match = False
-                                break
-                        if not is_match: continue
-                    filtered_data.append(p)
-                return filtered_data, None, logs
-            elif r.status_code == 429:
-                logs.append(f"⚠️ API 429 (Retry {attempt+1})")
-                time.sleep(2 ** (attempt + 1))
-                continue
-            else:
-                msg = f"Status {r.status_code}"
-                logs.append(msg)
-                return [], msg, logs
-        except Exception as e:
-            msg = str(e)
-            logs.append(msg)
-            if attempt < max_retries-1: 
-                time.sleep(2)
-                continue
-            return [], msg, logs
-    return [], "Max Retries", logs
-
-def normalize_api_result(p, query_kw):
-    """Map Semantic Scholar fields into the unified schema used by the UI."""
-    venue_raw = p.get("venue")
-    venue = str(venue_raw).strip() if venue_raw else "Unknown"
-    pub_date = p.get("publicationDate") or ""
-    display_date = pub_date.split("T")[0] if isinstance(pub_date, str) else ""
-    year_val = p.get("year") or 0
-    cite_val = p.get("citationCount")
-    cite_val = cite_val if cite_val is not None else "N/A"
-    
-    open_pdf = p.get("openAccessPdf")
-    pdf_url = open_pdf.get("url") if isinstance(open_pdf, dict) else None
-    url_val = pdf_url or p.get("url") or None
-    if (not url_val) and p.get("paperId"):
-        url_val = f"https://www.semanticscholar.org/p/{p['paperId']}"
-    url_val = str(url_val).strip() if url_val else None
-
-    abs_txt = p.get("abstract") or "暂无摘要"
-    title_txt = p.get("title") or "Untitled"
-
-    return {
-        "Year": year_val,
-        "DisplayDate": display_date,
-        "Journal": venue,
-        "FullJournal": venue,
-        "venue": venue,
-        "Title": title_txt,
-        "Citations": cite_val,
-        "URL": url_val,
-        "Abstract": abs_txt,
-        "MatchKeyword": query_kw,
-        "Source": "Semantic Scholar API",
-        # Extra raw fields for reference
-        "paperId": p.get("paperId"),
-        "API_URL": p.get("url"),
-        "OpenAccessPdf": open_pdf,
-        "PublicationDate": pub_date
-    }
-
-# ================= 任务准备函数 =================
-def prepare_nature_tasks(query_list, selected_map, start, end, use_proxy, proxies_list, cookie, clash_cfg, en_scholar, en_full_abs, filter_kws_struct, max_pages, strict_filter):
-    tasks = []
-    if clash_cfg and clash_cfg['nodes']:
-        clash_cfg['nodes'] = [n for n in clash_cfg['nodes'] if 'DIRECT' not in n and 'REJECT' not in n]
-    for q in query_list:
-        if not q.strip(): continue
-        for j_name, j_code in selected_map.items():
-            tasks.append((q, j_name, j_code, start, end, use_proxy, proxies_list, cookie, clash_cfg, en_scholar, en_full_abs, filter_kws_struct, max_pages, strict_filter))
-    return tasks
-
-def prepare_api_tasks(query_list, start, end, limit, target_venues_list, use_proxy, proxies_list, filter_kws_struct, strict_filter, ignore_venue_filter):
-    proxies = None
-    if use_proxy and proxies_list:
-        p = proxies_list[0]
-        proxies = {"http": p, "https": p}
-    tasks = []
-    if ignore_venue_filter:
-        for q in query_list:
-            if not q.strip(): continue
-            tasks.append((q, start, end, limit, None, proxies, filter_kws_struct, strict_filter, True))
-    else:
-        # Chunk size = 5 to reduce API calls
-        chunk_size = 5
-        venue_chunks = [target_venues_list[i:i + chunk_size] for i in range(0, len(target_venues_list), chunk_size)]
-        for q in query_list:
-            if not q.strip(): continue
-            for chunk in venue_chunks:
-                tasks.append((q, start, end, limit, chunk, proxies, filter_kws_struct, strict_filter, False))
-    return tasks
+                # 摘要区域
+                if pd.notna(cn_txt) and str(cn_txt).strip():
+                    st.info(cn_txt)
+                    with st.expander("📄 查看英文原文"): st.write(abst)
+                else:
+                    with st.expander("📄 查看摘要", expanded=False):
+                        st.write(abst)
+                        if abst != "暂无摘要":
+                            if st.button("🌐 翻译", key=f"btn_{key_prefix}{key}"):
+                                with st.spinner("Translating..."):
+                                    res = translate_text_deepseek(abst)
+                                if translation_store.get(abstract_digest(abst)): st.rerun()
+                                else: st.warning(res)
+                
+                # 底部操作栏
+                col_meta1, col_meta2 = st.columns([4, 1])
+                with col_meta1:
+                    match_list = find_matched_terms(str(r['Title']), str(abst), filter_struct)
+                    match_disp = ", ".join(match_list) if match_list else r.get('MatchKeyword', 'N/A')
+                    st.caption(f"Match: {match_disp} | Src: {r.get('Source', 'Local')}")
+                with col_meta2:
+                    col_lnk, col_del = st.columns(2)
+                    with col_lnk:
+                        url_val = r.get('URL') if 'URL' in r else None
+                        if pd.notna(url_val) and str(url_val).strip():
+                            st.link_button("🔗", str(url_val), help="Read Paper")
+                    with col_del:
+                        if st.button("🗑️", key=f"del_{key_prefix}{key}", help="Remove Item"):
+                            removed.add(key)
+                            st.rerun()
 
 # ================= UI =================
 with st.sidebar:
@@ -675,7 +596,7 @@ apply_theme(st.session_state["ui_theme"])
 
 st.title("🔥 DeepSearch Pro")
 st.caption("终极并行版 | Nature & Semantic Scholar | DeepSeek Translation")
-app_mode = st.sidebar.selectbox("🎯 选择模式", ["🚀 在线检索", "📂 结果分析(Preview)"])
+app_mode = st.sidebar.selectbox("🎯 选择模式", ["🚀 在线检索", "📂 结果分析(Preview)", "📦 批量采集(Harvest)"])
 
 with st.container():
     total_cached = len(st.session_state.get('last_results', []) or [])
@@ -688,12 +609,11 @@ with st.container():
         <div style="display:grid; grid-template-columns: repeat(auto-fit, minmax(160px,1fr)); gap:12px; margin-top:10px;">
             <div class="metric-box"><div class="muted">缓存结果</div><div style="font-size:24px; font-weight:800;">{total_cached}</div></div>
             <div class="metric-box"><div class="muted">年份范围</div><div style="font-size:24px; font-weight:800;">{2022} - {datetime.now().year+1}</div></div>
-            <div class="metric-box"><div class="muted">翻译缓存</div><div style="font-size:24px; font-weight:800;">{len(st.session_state.get('translations', {}))}</div></div>
+            <div class="metric-box"><div class="muted">翻译缓存</div><div style="font-size:24px; font-weight:800;">{translation_store.count()}</div></div>
         </div>
     </div>
     """, unsafe_allow_html=True)
 
-if 'translations' not in st.session_state: st.session_state['translations'] = {}
 
 # ================= 模式 1: 在线检索 =================
 if app_mode == "🚀 在线检索":
@@ -724,7 +644,7 @@ if app_mode == "🚀 在线检索":
                 if ok: st.success(msg)
                 else: st.error(msg)
                 
-            auto_rotate = st.checkbox("🔄 自动轮换 IP", value=False)
+            auto_rotate = st.checkbox("🔄 自动轮换 IP", value=False, help="按延迟排序节点，仅在当前节点被拦截/失败时统一切换")
             rot_grp = "Proxy"
             avail_nodes = []
             if api.connected or api.test_connection()[0]:
@@ -733,6 +653,13 @@ if app_mode == "🚀 在线检索":
                     grps = [k for k, v in d.items() if v['type'] == 'Selector']
                     rot_grp = st.selectbox("轮换分组", grps, index=grps.index('Proxy') if 'Proxy' in grps else 0)
                     if rot_grp in d: avail_nodes = d[rot_grp]['all']
+            if auto_rotate and avail_nodes:
+                node_sched = clash_scheduler_for({"enabled": True, "url": clash_url.rstrip('/'), "secret": clash_sec, "group": rot_grp, "nodes": avail_nodes})
+                if st.button("📶 节点测速", use_container_width=True):
+                    with st.spinner("测速中..."): node_sched.refresh()
+                if node_sched.delays:
+                    st.caption(f"已切换 {node_sched.switches} 次")
+                    st.dataframe(pd.DataFrame(node_sched.snapshot()), hide_index=True, use_container_width=True, height=200)
 
         with st.expander("📡 代理地址", expanded=False):
             col1, col2 = st.columns(2)
@@ -743,6 +670,12 @@ if app_mode == "🚀 在线检索":
             man_proxy = st.text_area("手动输入", value="http://127.0.0.1:7890", height=68, label_visibility="collapsed")
             if man_proxy: st.session_state.proxy_manager.load_manual_proxies(man_proxy)
             use_proxy = st.checkbox("🚀 开启代理", value=True)
+            loaded = st.session_state.proxy_manager.proxies
+            if loaded:
+                if st.button("🩺 检测代理", use_container_width=True):
+                    with concurrent.futures.ThreadPoolExecutor(max_workers=min(8, len(loaded))) as ex:
+                        for p, (ok, msg) in zip(loaded, ex.map(proxy_pool.probe, loaded)): st.caption(f"{p}: {msg}")
+                st.dataframe(pd.DataFrame(proxy_pool.snapshot(loaded)), hide_index=True, use_container_width=True)
 
         st.divider()
         st.markdown("**🔍 检索设置**")
@@ -755,144 +688,127 @@ if app_mode == "🚀 在线检索":
         s_y = c1.number_input("年份起", 2022)
         e_y = c2.number_input("年份止", 2025)
         lim = st.slider("API Limit", 20, 100, 100)
+        full_api = st.checkbox("📑 API 完整翻页 (按年份切片)", value=True, help="按结果总数拆分年份区间并翻页，避免被单次 Limit 截断")
         
         nat_pages = st.slider("Nature 爬取页数", 1, 5, 2)
         
         col_opt1, col_opt2 = st.columns(2)
-        en_sch = col_opt1.checkbox("Scholar 引用", False)
-        en_abs = col_opt2.checkbox("补全摘要", True)
+        en_sch = col_opt1.checkbox("引用补全 (S2)", False, help="浏览时通过 Semantic Scholar /paper/batch 补全当前页论文的引用数")
+        en_abs = col_opt2.checkbox("补全摘要", True, help="检索时只为过滤判断需要的文章抓取全文摘要，其余在浏览到时按页抓取")
         
         st.divider()
         run = st.button("🚀 开始检索", type="primary", use_container_width=True)
 
     if run:
-        raw_kws = [k.strip() for k in kw_in.split(';') if k.strip()]
-        if not raw_kws: st.warning("请输入关键词")
+        q_list_nat, q_list_api, filter_kws_struct = build_queries(kw_in, advanced="AND" in s_mode)
+        if not q_list_nat: st.warning("请输入关键词")
         else:
-            results = []
-            filter_kws_struct = []
-            for k_grp in raw_kws:
-                or_terms = [t.strip() for t in k_grp.split('/') if t.strip()]
-                if or_terms: filter_kws_struct.append(or_terms)
-
-            if "AND" in s_mode:
-                nat_parts = []
-                api_term_groups = []
-                for group in filter_kws_struct:
-                    group_terms_nat = []
-                    for t in group:
-                        if " " in t: group_terms_nat.append(f'"{t}"')
-                        else: group_terms_nat.append(t)
-                    if len(group_terms_nat) > 1: nat_parts.append("(" + " OR ".join(group_terms_nat) + ")")
-                    else: nat_parts.append(group_terms_nat[0])
-                    
-                    group_terms_api = []
-                    for t in group:
-                        if " " in t: group_terms_api.append(f'"{t}"')
-                        else: group_terms_api.append(t)
-                    api_term_groups.append(group_terms_api)
-                
-                q_list_nat = [" ".join(nat_parts)]
-                # API 组合逻辑: (A|B) + (C|D) -> A C, A D, B C, B D
-                product_tuples = list(itertools.product(*api_term_groups))
-                q_list_api = [" ".join(t) for t in product_tuples]
-                st.info(f"🔍 高级模式: Nature '{q_list_nat[0]}'; API 组合 {len(q_list_api)} 次")
-                
-            else:
-                q_list_nat = []
-                q_list_api = []
-                filter_kws_struct = None 
-                for group in raw_kws:
-                    terms = [t.strip() for t in group.split('/') if t.strip()]
-                    processed = [f'"{t}"' if " " in t else t for t in terms]
-                    if len(processed) > 1: nat_q = "(" + " OR ".join(processed) + ")"
-                    else: nat_q = processed[0]
-                    q_list_nat.append(nat_q)
-                    q_list_api.extend(processed)
-                st.info(f"🔍 普通模式: Nature {len(q_list_nat)} 组; API {len(q_list_api)} 词")
+            if "AND" in s_mode: st.info(f"🔍 高级模式: Nature '{q_list_nat[0]}'; API 组合 {len(q_list_api)} 次")
+            else: st.info(f"🔍 普通模式: Nature {len(q_list_nat)} 组; API {len(q_list_api)} 词")
 
             clash_cfg = {"enabled": auto_rotate, "url": clash_url.rstrip('/'), "secret": clash_sec, "group": rot_grp, "nodes": avail_nodes}
             prox_list = st.session_state.proxy_manager.proxies if use_proxy else []
             
-            stat = st.status("正在检索...", expanded=True)
-            all_logs = []
-            nat_res = []
-            api_res = []
-            
             # 1. 准备任务
             nature_tasks = []
             if sel_nat_map:
-                nature_tasks = prepare_nature_tasks(q_list_nat, sel_nat_map, s_y, e_y, use_proxy, prox_list, user_cookie, clash_cfg, en_sch, en_abs, filter_kws_struct, nat_pages, strict_filter)
+                nature_tasks = prepare_nature_tasks(q_list_nat, sel_nat_map, s_y, e_y, use_proxy, prox_list, user_cookie, clash_cfg, "lazy" if en_abs else False, filter_kws_struct, nat_pages, strict_filter)
             
             api_tasks = []
             if ignore_venue_filter or sel_api:
-                api_tasks = prepare_api_tasks(q_list_api, s_y, e_y, lim, sel_api, use_proxy, prox_list, filter_kws_struct, strict_filter, ignore_venue_filter)
+                # 两阶段检索: 先取轻量字段按标题过滤, 只为标题无法判定的论文批量获取摘要, 其余在浏览 / 导出时补全
+                api_tasks = prepare_api_tasks(q_list_api, s_y, e_y, lim, sel_api, use_proxy, prox_list, filter_kws_struct, strict_filter, ignore_venue_filter, "lazy")
+
+            # 2. 提交后台任务: 按来源调度, 结果边到边显示; 刷新页面可通过 ?job= 重新连接
+            # 引用数与延后的全文摘要在浏览时按页补全 (enrich_visible), 不再为所有结果预先请求
+            api_proxies = list(prox_list) or None
+            job_label = f"{'; '.join(q_list_nat or q_list_api)[:60]} ({s_y}-{e_y})"
+            job_id = job_manager.submit(SearchRun(nature_tasks, api_tasks, full_api, False, api_proxies, filter_kws_struct, job_label, owner=job_owner))
+            st.query_params["job"] = job_id
+
+    # --- 后台任务: 当前任务由 URL ?job= 决定, 刷新后自动重新连接 ---
+    job_id = st.query_params.get("job")
+    if job_id and st.session_state.get('job_id') != job_id:
+        st.session_state['job_id'] = job_id
+        st.session_state['published_job'] = None
+        st.session_state['last_results'] = []
+        st.session_state['last_results_digest'] = None
+        st.session_state['last_logs'] = []
+        st.session_state['last_filter_struct'] = None
+        st.session_state['lazy_enriched'] = {}
+
+    job_list = job_manager.list_jobs(owner=job_owner)
+    if job_list:
+        status_icon = {"queued": "⏳", "running": "🔄", "done": "✅", "partial": "🟠", "cancelled": "⛔", "failed": "❌", "interrupted": "⚠️"}
+        n_active = sum(m['status'] in ("queued", "running") for m in job_list)
+        with st.expander(f"🗂️ 后台任务 ({n_active} 进行中 / 共 {len(job_list)})", expanded=False):
+            for m in job_list:
+                c_info, c_view, c_act = st.columns([6, 1, 1])
+                cur = " 👈" if m['job_id'] == job_id else ""
+                if m.get('external'): cur += " <span style='color:gray;font-size:0.8em'>(其他进程运行中)</span>"
+                c_info.markdown(f"{status_icon.get(m['status'], '')} `{m['job_id']}` {m['label']} — {m['n_rows']} 篇 "
+                                f"<span style='color:gray;font-size:0.8em'>Nature {m['nat_done']}/{m['nat_total']} · API {m['api_done']}/{m['api_total']}</span>{cur}",
+                                unsafe_allow_html=True)
+                if c_view.button("查看", key=f"job_view_{m['job_id']}"):
+                    st.query_params["job"] = m['job_id']
+                    st.rerun()
+                if m.get('external'): continue  # 由命令行等其他进程运行, 只能查看
+                if m['status'] in ("queued", "running"):
+                    if c_act.button("取消", key=f"job_cancel_{m['job_id']}"):
+                        job_manager.cancel(m['job_id'])
+                        st.rerun()
+                elif m['status'] != "done" and c_act.button("继续", key=f"job_resume_{m['job_id']}"):
+                    job_manager.resume(m['job_id'], user_cookie, clash_sec)
+                    st.session_state['published_job'] = None
+                    st.query_params["job"] = m['job_id']
+                    st.rerun()
 
-            # 2. 进度条 UI
+    # --- 检索进度 (后台运行时每秒刷新) ---
+    def live_search_panel():
+        search = job_manager.get(st.session_state.get('job_id'))
+        if search is None or st.session_state.get('published_job') == search.job_id: return
+        st.session_state['last_filter_struct'] = search.filter_struct
+        if search.status == "queued":
+            st.info(f"⏳ 任务 `{search.job_id}` 排队中，前面的检索完成后自动开始")
+            return
+        nat_p, api_p = search.progress()
+        if not search.done:
             st.markdown("#### 🚀 检索进度")
             col_p1, col_p2 = st.columns(2)
             with col_p1:
                 st.markdown("**Nature 官网**")
-                nat_prog = st.progress(0)
-                nat_txt = st.empty()
+                st.progress(nat_p)
+                st.markdown(f"<div style='text-align:right; color:gray; font-size:0.8em'>{search.nat_label}</div>", unsafe_allow_html=True)
             with col_p2:
                 st.markdown("**IEEE/Science API**")
-                api_prog = st.progress(0)
-                api_txt = st.empty()
-            
-            # 3. 统一线程池执行
-            total_workers = 15
-            with concurrent.futures.ThreadPoolExecutor(max_workers=total_workers) as executor:
-                future_to_type = {}
-                
-                # Submit Nature
-                nat_total = len(nature_tasks)
-                nat_done = 0
-                for task in nature_tasks:
-                    fut = executor.submit(scrape_nature_worker, task)
-                    future_to_type[fut] = ('nature', task)
-                
-                # Submit API
-                api_total = len(api_tasks)
-                api_done = 0
-                for task in api_tasks:
-                    fut = executor.submit(search_api_worker, task)
-                    future_to_type[fut] = ('api', task)
-                
-                # As Completed Loop
-                for future in concurrent.futures.as_completed(future_to_type):
-                    t_type, t_info = future_to_type[future]
-                    try:
-                        r_list, err, l_list = future.result()
-                        if l_list: all_logs.extend(l_list)
-                        if r_list:
-                            if t_type == 'nature': nat_res.extend(r_list)
-                            else:
-                                q_kw = t_info[0]  # query string used for this API call
-                                api_res.extend([normalize_api_result(p, q_kw) for p in r_list])
-                        
-                        if t_type == 'nature':
-                            nat_done += 1
-                            if nat_total > 0: 
-                                nat_prog.progress(nat_done/nat_total)
-                                nat_txt.markdown(f"<div style='text-align:right; color:gray; font-size:0.8em'>{t_info[1]}</div>", unsafe_allow_html=True)
-                        else:
-                            api_done += 1
-                            if api_total > 0: 
-                                api_prog.progress(api_done/api_total)
-                                v_disp = "Global" if t_info[8] else (t_info[4][0][:15]+"..." if t_info[4] else "All")
-                                api_txt.markdown(f"<div style='text-align:right; color:gray; font-size:0.8em'>{v_disp}</div>", unsafe_allow_html=True)
-                    except Exception as e:
-                        all_logs.append(f"Main Loop Err: {e}")
-
-            nat_prog.progress(1.0)
-            api_prog.progress(1.0)
-            
-            results = nat_res + api_res
+                st.progress(api_p)
+                st.markdown(f"<div style='text-align:right; color:gray; font-size:0.8em'>{search.api_label}</div>", unsafe_allow_html=True)
+        results = search.snapshot()
+        if st.session_state.get('live_version') != (search.job_id, search.version):
+            st.session_state['live_version'] = (search.job_id, search.version)
             st.session_state['last_results'] = results
-            st.session_state['last_logs'] = all_logs
-            st.session_state['last_filter_struct'] = filter_kws_struct
-            stat.update(label="完成", state="complete", expanded=False)
+            st.session_state['last_results_digest'] = results_digest(results)
+            with search.lock: st.session_state['last_logs'] = list(search.logs)
+        if search.done:
+            # 完成后整页刷新一次, 结果区切换为最终结果
+            st.session_state['published_job'] = search.job_id
+            st.rerun()
+        label = "引用补全中..." if search.enriching else "正在检索..."
+        st.caption(f"⏳ {label} 已获取 {len(results)} 篇 — 下方结果可先筛选/翻译，新结果到达后刷新页面即可看到")
+        if results:
+            live_cols = [c for c in ["Year", "Journal", "Title", "Citations"] if c in results[0]]
+            st.dataframe(pd.DataFrame(results[-200:])[live_cols].iloc[::-1], hide_index=True, use_container_width=True, height=240)
+
+    current_job = job_manager.get(st.session_state.get('job_id'))
+    live_running = current_job is not None and st.session_state.get('published_job') != current_job.job_id
+    st.fragment(run_every=1.0 if live_running else None)(live_search_panel)()
+    if current_job is not None and current_job.status in ("interrupted", "partial", "cancelled", "failed"):
+        c_warn, c_btn = st.columns([5, 1])
+        c_warn.warning(f"任务 `{current_job.job_id}` 未完成（{current_job.status}），以下为已完成部分的结果")
+        if c_btn.button("▶️ 继续", key="job_resume_current", use_container_width=True):
+            job_manager.resume(current_job.job_id, user_cookie, clash_sec)
+            st.session_state['published_job'] = None
+            st.rerun()
 
     # --- 结果展示 ---
     if 'last_results' in st.session_state and st.session_state['last_results']:
@@ -906,30 +822,10 @@ if app_mode == "🚀 在线检索":
         removed = st.session_state['removed_items']
         selected = st.session_state['selected_items']
         
-        # 本地过滤 (Strict)
+        digest = st.session_state.get('last_results_digest') or results_digest(results)
+        df, n_total, n_filtered, dedup_removed = prepare_online_df(digest, filter_struct, bool(strict_filter), results)
         if strict_filter and filter_struct:
-            filtered_results = []
-            for p in results:
-                content = (p['Title'] + " " + (p['Abstract'] or "")).lower()
-                is_match = True
-                for group in filter_struct:
-                    group_match = False
-                    for k in group:
-                        clean_k = k.replace('"', '').replace("'", "").lower()
-                        if clean_k in content:
-                            group_match = True
-                            break
-                    if not group_match:
-                        is_match = False
-                        break
-                if is_match: filtered_results.append(p)
-            display_results = filtered_results
-            st.caption(f"🔍 严格过滤: {len(results)} -> {len(display_results)}")
-        else:
-            display_results = results
-
-        # 本地删除过滤
-        display_results = [p for p in display_results if item_key(p) not in removed]
+            st.caption(f"🔍 严格过滤: {n_total} -> {n_filtered}")
 
         if logs:
             with st.expander("📝 运行日志", expanded=False):
@@ -939,36 +835,28 @@ if app_mode == "🚀 在线检索":
                     elif "Redirected" in l or "Error" in l or "Status" in l: st.markdown(f":red[{l}]")
                     else: st.text(l)
 
-        df_raw = pd.DataFrame(display_results)
-        if not df_raw.empty:
-            if 'Journal' not in df_raw.columns and 'venue' in df_raw.columns:
-                df_raw['Journal'] = df_raw['venue']
-            if 'Journal' in df_raw.columns and 'venue' in df_raw.columns:
-                # Replace empty/placeholder Journal with venue when available
-                mask_unknown = df_raw['Journal'].astype(str).str.strip().isin(['', 'Unknown', 'nan'])
-                df_raw.loc[mask_unknown, 'Journal'] = df_raw.loc[mask_unknown, 'venue']
-            if 'Journal' in df_raw.columns:
-                df_raw['Journal'] = df_raw['Journal'].fillna('Unknown').astype(str)
-            if 'FullJournal' not in df_raw.columns and 'Journal' in df_raw.columns:
-                df_raw['FullJournal'] = df_raw['Journal']
-            df_raw['SortYear'] = pd.to_numeric(df_raw['Year'], errors='coerce').fillna(0)
-
-            df = deduplicate_dataframe(df_raw)
-            dedup_removed = len(df_raw) - len(df)
-            df = add_translate_key(df, "online")
-            df = apply_cn_column(df)
-            df = df.sort_values(by=['SortYear', 'DisplayDate'], ascending=[False, False])
+        if not df.empty:
+            # 本地删除过滤; 叠加浏览时补全的摘要 / 引用, 导出与翻译也使用补全后的内容
+            enriched = st.session_state.setdefault('lazy_enriched', {})
+            df = df[~df['TranslateKey'].isin(removed)]
+            df = apply_cn_column(apply_lazy_enrichment(df, enriched))
             
             msg = f"🎉 共找到 {len(df)} 篇论文"
             if dedup_removed > 0: msg += f"（已自动去重 {dedup_removed} 篇）"
             st.success(msg)
+            savings_slot = st.empty()  # 渲染完当前页 (按需抓取之后) 再填写
             
+            view_proxies = st.session_state.proxy_manager.proxies if use_proxy else []
             col_act1, col_act2, col_act3 = st.columns(3)
             with col_act1:
-                st.download_button("📥 导出 CSV", df.to_csv(index=False).encode('utf-8-sig'), "papers_final.csv", use_container_width=True)
+                # 导出 / 翻译前补全所有延后的摘要 (S2 每 500 篇一次批量请求, Nature 按文章页)
+                st.download_button("📥 导出 CSV", csv_export(df, lambda d: complete_pending(d, enriched, view_proxies, user_cookie)),
+                                   "papers_final.csv", mime="text/csv", use_container_width=True)
             with col_act2:
                 if st.button("🌐 批量翻译摘要", key="batch_translate_online", use_container_width=True):
-                    df, count = batch_translate(df, max_workers=1000)
+                    with st.spinner("补全延后的摘要..."):
+                        df = complete_pending(df, enriched, view_proxies, user_cookie)
+                    df, count = batch_translate(df)
                     if count == 0: st.info("暂无需要翻译的摘要")
                     else:
                         st.success(f"翻译完成 {count} 篇摘要")
@@ -980,77 +868,20 @@ if app_mode == "🚀 在线检索":
                         selected.clear()
                         st.rerun()
             
-            journals = sorted(df['Journal'].unique())
-            tabs = st.tabs([f"{j} ({len(df[df['Journal']==j])})" for j in journals])
+            page_size = st.selectbox("每页显示", PAGE_SIZE_OPTIONS, key="page_size_online")
+            journal_groups = list(df.groupby('Journal', sort=True))
+            tabs = st.tabs([f"{j} ({len(sub)})" for j, sub in journal_groups])
             
-            for i, j_name in enumerate(journals):
-                with tabs[i]:
-                    sub = df[df['Journal'] == j_name]
-                    for idx, r in sub.iterrows():
-                        # 复合键解决 Duplicate Key
-                        key = r['TranslateKey'] if 'TranslateKey' in r else f"online_{idx}_{hash(r['Title'])}"
-                        cite_val = r['Citations'] if 'Citations' in r else "N/A"
-                        if str(cite_val) in ["N/A", "0", "0.0", "nan", "None", "", "None"]:
-                            cite_badge = '<span class="badge badge-cite" style="background:linear-gradient(135deg,#9ca3af,#6b7280)">Cite: Unknown</span>'
-                        else:
-                            cite_badge = f'<span class="badge badge-cite">🔥 Cite: {cite_val}</span>'
-                        
-                        # --- 美化后的卡片式布局 ---
-                        with st.container():
-                            card_html = textwrap.dedent(f"""
-                                <div class="paper-card">
-                                    <h4>{r['Title']}</h4>
-                                    <div style="margin-bottom: 10px;">
-                                        <span class="badge badge-year">{r['Year']}</span>
-                                        <span class="badge badge-journal">{r['Journal']}</span>
-                                        {cite_badge}
-                                        <span style="color: gray; font-size: 0.9em; margin-left: 5px;">📅 {r['DisplayDate']}</span>
-                                    </div>
-                                </div>
-                            """).strip()
-                            st.markdown(card_html, unsafe_allow_html=True)
-                            
-                            c1, c2 = st.columns([0.05, 0.95])
-                            with c1:
-                                sel_val = st.checkbox("", key=f"sel_{key}", value=(key in selected), label_visibility="collapsed")
-                                if sel_val: selected.add(key)
-                                else: selected.discard(key)
-                            
-                            with c2:
-                                abst = r['Abstract']
-                                if not abst: abst = "暂无摘要"
-                                cn_txt = r.get('Abstract_CN')
-                                
-                                # 摘要区域
-                                if cn_txt and str(cn_txt).strip():
-                                    st.info(cn_txt)
-                                    with st.expander("📄 查看英文原文"): st.write(abst)
-                                else:
-                                    with st.expander("📄 查看摘要", expanded=False):
-                                        st.write(abst)
-                                        if abst != "暂无摘要":
-                                            if st.button("🌐 翻译", key=f"btn_{key}"):
-                                                with st.spinner("Translating..."):
-                                                    res = translate_text_deepseek(abst)
-                                                    st.session_state['translations'][key] = res
-                                                    st.rerun()
-                                
-                                # 底部操作栏
-                                col_meta1, col_meta2 = st.columns([4, 1])
-                                with col_meta1:
-                                    match_list = find_matched_terms(str(r['Title']), str(r['Abstract']) if r['Abstract'] else "", filter_struct if strict_filter else None)
-                                    match_disp = ", ".join(match_list) if match_list else r.get('MatchKeyword', 'N/A')
-                                    st.caption(f"Match: {match_disp} | Src: {r['Source']}")
-                                with col_meta2:
-                                    col_lnk, col_del = st.columns(2)
-                                    with col_lnk:
-                                        url_val = r.get('URL') if 'URL' in r else None
-                                        if pd.notna(url_val) and str(url_val).strip():
-                                            st.link_button("🔗", str(url_val), help="Read Paper")
-                                    with col_del:
-                                        if st.button("🗑️", key=f"del_{key}", help="Remove Item"):
-                                            st.session_state['removed_items'].add(key)
-                                            st.rerun()
+            for tab, (j_name, sub) in zip(tabs, journal_groups):
+                with tab:
+                    page = paginate_frame(sub, f"page_online_{j_name}", page_size)
+                    page = enrich_visible(page, enriched, view_proxies, user_cookie, en_sch)
+                    render_paper_cards(page, selected, removed, filter_struct if strict_filter else None)
+
+            n_deferred = sum(r.get('AbstractPending') is True for r in results)
+            if n_deferred:
+                n_viewed = sum(v.get('AbstractPending') is False for v in enriched.values())
+                savings_slot.caption(f"📉 {n_deferred} 篇摘要 (Nature 全文 / S2 轻量检索) 延后到浏览时获取，已获取 {n_viewed} 篇，{n_deferred - n_viewed} 篇尚未请求")
         else:
             st.warning("⚠️ 暂无搜索结果")
 
@@ -1059,68 +890,19 @@ elif app_mode == "📂 结果分析(Preview)":
     df = None
     with st.sidebar:
         st.divider()
-        uploaded_file = st.file_uploader("📂 上传 CSV 1", type="csv")
-        uploaded_file2 = st.file_uploader("📂 上传 CSV 2 (可选)", type="csv")
-        dfs = []
-        for idx, uf in enumerate([uploaded_file, uploaded_file2], start=1):
-            if uf:
-                try:
-                    tmp_df = pd.read_csv(uf)
-                    dfs.append(tmp_df)
-                except Exception as e:
-                    st.error(f"文件 {idx} 读取失败: {e}")
-        if dfs:
-            df = pd.concat(dfs, ignore_index=True)
-            if len(dfs) > 1:
-                st.info(f"已合并 {len(dfs)} 个文件，共 {len(df)} 条记录")
+        files = st.file_uploader("📂 上传 CSV / Parquet (可多选)", type=["csv", "parquet"], accept_multiple_files=True) or []
+        files_key = tuple((uf.file_id, uf.size) for uf in files)
+        if files:
+            df, load_errors, dedup_removed = load_preview_df(files_key, files)
+            for err in load_errors: st.error(err)
+            if df is not None and len(files) > 1:
+                st.info(f"已合并 {len(files)} 个文件，共 {len(df)} 条记录")
 
         if df is not None:
             if 'removed_items_preview' not in st.session_state:
                 st.session_state['removed_items_preview'] = set()
             if 'selected_items_preview' not in st.session_state:
                 st.session_state['selected_items_preview'] = set()
-            if 'Journal' not in df.columns and 'venue' in df.columns:
-                df['Journal'] = df['venue']
-            if 'Year' not in df.columns and 'year' in df.columns:
-                df['Year'] = df['year']
-            if 'Title' not in df.columns and 'title' in df.columns:
-                df['Title'] = df['title']
-            if 'Citations' not in df.columns and 'citationCount' in df.columns:
-                df['Citations'] = df['citationCount']
-            if 'Abstract' not in df.columns and 'abstract' in df.columns:
-                df['Abstract'] = df['abstract']
-            if 'URL' not in df.columns and 'url' in df.columns:
-                df['URL'] = df['url']
-            if 'DisplayDate' not in df.columns and 'publicationDate' in df.columns:
-                df['DisplayDate'] = df['publicationDate']
-            # Backfill missing values row-wise when both columns exist
-            if 'Journal' in df.columns and 'venue' in df.columns:
-                df['Journal'] = df['Journal'].fillna(df['venue'])
-                mask_unknown = df['Journal'].astype(str).str.strip().isin(['', 'Unknown', 'nan'])
-                df.loc[mask_unknown, 'Journal'] = df.loc[mask_unknown, 'venue']
-            if 'FullJournal' in df.columns and 'Journal' in df.columns:
-                df['FullJournal'] = df['FullJournal'].fillna(df['Journal'])
-            if 'Title' in df.columns and 'title' in df.columns:
-                df['Title'] = df['Title'].fillna(df['title'])
-            if 'Year' in df.columns and 'year' in df.columns:
-                df['Year'] = df['Year'].fillna(df['year'])
-            if 'Citations' in df.columns and 'citationCount' in df.columns:
-                df['Citations'] = df['Citations'].fillna(df['citationCount'])
-            if 'Abstract' in df.columns and 'abstract' in df.columns:
-                df['Abstract'] = df['Abstract'].fillna(df['abstract'])
-            if 'URL' in df.columns and 'url' in df.columns:
-                df['URL'] = df['URL'].fillna(df['url'])
-            if 'DisplayDate' in df.columns and 'publicationDate' in df.columns:
-                df['DisplayDate'] = df['DisplayDate'].fillna(df['publicationDate'])
-            if 'Journal' in df.columns:
-                df['Journal'] = df['Journal'].fillna('Unknown').astype(str)
-            if 'FullJournal' not in df.columns and 'Journal' in df.columns:
-                df['FullJournal'] = df['Journal']
-            # Normalize numeric fields for filtering/sorting
-            if 'Year' in df.columns:
-                df['Year'] = pd.to_numeric(df['Year'], errors='coerce').fillna(0).astype(int)
-            if 'Citations' in df.columns:
-                df['Citations'] = pd.to_numeric(df['Citations'], errors='coerce')
             
             sort_opt = st.radio("排序方式", ["年份", "引用"])
             all_journals = sorted(df['Journal'].astype(str).unique())
@@ -1137,56 +919,27 @@ elif app_mode == "📂 结果分析(Preview)":
         if 'removed_items_preview' not in st.session_state:
             st.session_state['removed_items_preview'] = set()
         filter_struct = None
-        df_filtered = df[
-            (df['Journal'].isin(sel_journals)) & 
-            (df['Year'] >= sel_years[0]) & 
-            (df['Year'] <= sel_years[1])
-        ]
-        
         if strict_mode and txt_filter:
             filter_struct = []
             for grp in txt_filter.split(';'):
                 terms = [t.strip().replace('"', '').replace("'", "") for t in grp.split('/') if t.strip()]
                 if terms: filter_struct.append(terms)
-            
-            if filter_struct:
-                filtered_indices = []
-                for idx, row in df_filtered.iterrows():
-                    title_txt = str(row['Title']) if pd.notna(row['Title']) else ""
-                    abs_txt = str(row['Abstract']) if pd.notna(row['Abstract']) else ""
-                    content = (title_txt + " " + abs_txt).lower()
-                    is_match = True
-                    for group in filter_struct:
-                        if not any(k.lower() in content for k in group):
-                            is_match = False
-                            break 
-                    if is_match: filtered_indices.append(idx)
-                df_filtered = df_filtered.loc[filtered_indices]
-
-        if "引用" in sort_opt:
-            if 'Citations' in df_filtered.columns:
-                df_filtered['Citations_Num'] = pd.to_numeric(df_filtered['Citations'], errors='coerce').fillna(0)
-                df_filtered = df_filtered.sort_values(by='Citations_Num', ascending=False)
-        else:
-            df_filtered = df_filtered.sort_values(by='Year', ascending=False)
 
-        pre_dedup_len = len(df_filtered)
-        df_filtered = deduplicate_dataframe(df_filtered)
-        dedup_removed = pre_dedup_len - len(df_filtered)
-        df_filtered = add_translate_key(df_filtered, "local")
-        df_filtered = apply_cn_column(df_filtered)
+        sort_by = "引用" if "引用" in sort_opt else "年份"
+        df_filtered = prepare_preview_df(files_key, tuple(sel_journals), tuple(sel_years), filter_struct, sort_by, df)
         # 删除过滤
-        df_filtered = df_filtered[~df_filtered.apply(lambda r: item_key(r, prefix="local") in st.session_state['removed_items_preview'], axis=1)]
+        df_filtered = df_filtered[~df_filtered['TranslateKey'].isin(st.session_state['removed_items_preview'])]
+        df_filtered = apply_cn_column(df_filtered)
         
         # Header area
         st.markdown(f"### 📂 共找到 {len(df_filtered)} 篇论文" + (f" <span style='font-size:0.6em;color:gray'>（去重 {dedup_removed}）</span>" if dedup_removed > 0 else ""), unsafe_allow_html=True)
         
         col_act1, col_act2, col_act3 = st.columns(3)
         with col_act1:
-            st.download_button("📥 导出筛选结果", df_filtered.to_csv(index=False).encode('utf-8-sig'), "papers_preview_filtered.csv", use_container_width=True)
+            st.download_button("📥 导出筛选结果", csv_export(df_filtered), "papers_preview_filtered.csv", mime="text/csv", use_container_width=True)
         with col_act2:
             if st.button("🌐 批量翻译 (本地)", key="batch_translate_local", use_container_width=True):
-                df_filtered, count = batch_translate(df_filtered, max_workers=1000)
+                df_filtered, count = batch_translate(df_filtered)
                 if count == 0: st.info("暂无需要翻译的摘要")
                 else:
                     st.success(f"翻译完成 {count} 篇摘要")
@@ -1199,74 +952,50 @@ elif app_mode == "📂 结果分析(Preview)":
                     sel_prev.clear()
                     st.rerun()
         
-        journals_f = sorted(df_filtered['Journal'].unique())
-        if not journals_f: st.warning("⚠️ 无结果")
+        page_size = st.selectbox("每页显示", PAGE_SIZE_OPTIONS, key="page_size_local")
+        journal_groups = list(df_filtered.groupby('Journal', sort=True, observed=True))
+        if not journal_groups: st.warning("⚠️ 无结果")
         else:
-            tabs = st.tabs([f"{j} ({len(df_filtered[df_filtered['Journal']==j])})" for j in journals_f])
-            for i, j_name in enumerate(journals_f):
-                with tabs[i]:
-                    sub = df_filtered[df_filtered['Journal'] == j_name]
-                    for idx, r in sub.iterrows():
-                        # 复合键解决 Duplicate Key (Preview 模式)
-                        key = r['TranslateKey'] if 'TranslateKey' in r else f"local_{idx}_{hash(str(r['Title']))}"
-                        cite_val = r['Citations'] if 'Citations' in r else "N/A"
-                        if str(cite_val) in ["N/A", "0", "0.0", "nan", "None", "", "None"]:
-                            cite_badge = '<span class="badge badge-cite" style="background:linear-gradient(135deg,#9ca3af,#6b7280)">Cite: Unknown</span>'
-                        else:
-                            cite_badge = f'<span class="badge badge-cite">🔥 Cite: {cite_val}</span>'
-                        
-                        # --- 美化后的卡片式布局 ---
-                        with st.container():
-                            card_html = textwrap.dedent(f"""
-                                <div class="paper-card">
-                                    <h4>{r['Title']}</h4>
-                                    <div style="margin-bottom: 10px;">
-                                        <span class="badge badge-year">{r['Year']}</span>
-                                        <span class="badge badge-journal">{r['Journal']}</span>
-                                        {cite_badge}
-                                        <span style="color: gray; font-size: 0.9em; margin-left: 5px;">📅 {r.get('DisplayDate', r['Year'])}</span>
-                                    </div>
-                                </div>
-                            """).strip()
-                            st.markdown(card_html, unsafe_allow_html=True)
-
-                            c1, c2 = st.columns([0.05, 0.95])
-                            with c1:
-                                sel_val = st.checkbox("", key=f"sel_local_{key}", value=(key in st.session_state['selected_items_preview']), label_visibility="collapsed")
-                                if sel_val: st.session_state['selected_items_preview'].add(key)
-                                else: st.session_state['selected_items_preview'].discard(key)
-                            
-                            with c2:
-                                abst = r['Abstract'] if pd.notna(r['Abstract']) else "暂无摘要"
-                                cn_txt = r.get('Abstract_CN')
-                                
-                                if cn_txt and str(cn_txt).strip():
-                                    st.info(cn_txt)
-                                    with st.expander("📄 查看英文原文"): st.write(abst)
-                                else:
-                                    with st.expander("📄 查看摘要", expanded=False):
-                                        st.write(abst)
-                                        if abst != "暂无摘要":
-                                            if st.button("🌐 翻译", key=f"btn_{key}"):
-                                                with st.spinner("Translating..."):
-                                                    res = translate_text_deepseek(abst)
-                                                    st.session_state['translations'][key] = res
-                                                    st.rerun()
-                                
-                                col_meta1, col_meta2 = st.columns([4, 1])
-                                with col_meta1:
-                                    match_list = find_matched_terms(str(r['Title']), str(abst), filter_struct if strict_mode else None)
-                                    match_disp = ", ".join(match_list) if match_list else r.get('MatchKeyword', 'N/A')
-                                    st.caption(f"Match: {match_disp} | Src: {r.get('Source', 'Local')}")
-                                with col_meta2:
-                                    col_lnk, col_del = st.columns(2)
-                                    with col_lnk:
-                                        url = r['URL'] if pd.notna(r['URL']) else None
-                                        if url: st.link_button("🔗", url, help="Read Paper")
-                                    with col_del:
-                                        if st.button("🗑️", key=f"del_local_{key}", help="Remove Item"):
-                                            st.session_state['removed_items_preview'].add(key)
-                                            st.rerun()
+            tabs = st.tabs([f"{j} ({len(sub)})" for j, sub in journal_groups])
+            for tab, (j_name, sub) in zip(tabs, journal_groups):
+                with tab:
+                    page = paginate_frame(sub, f"page_local_{j_name}", page_size)
+                    render_paper_cards(page, st.session_state['selected_items_preview'], st.session_state['removed_items_preview'],
+                                       filter_struct if strict_mode else None, key_prefix="local_")
 
     else:
-        if app_mode == "📂 结果分析(Preview)": st.info("👈 请在左侧上传 CSV 文件")
+        if app_mode == "📂 结果分析(Preview)": st.info("👈 请在左侧上传 CSV / Parquet 文件")
+
+# ================= 模式 3: 批量采集 (Harvest) =================
+elif app_mode == "📦 批量采集(Harvest)":
+    with st.sidebar:
+        st.divider()
+        h_query = st.text_input("检索式 (S2 bulk 语法)", "\"large language model\" + molecule")
+        c1, c2 = st.columns(2)
+        h_start = c1.number_input("年份起", 2018, key="h_start")
+        h_end = c2.number_input("年份止", datetime.now().year, key="h_end")
+        h_venues = st.multiselect("限定期刊 (可选)", API_JOURNALS_LIST, [])
+        h_filter = st.text_area("本地严格过滤 (A/B; C/D，可选)", "", height=60)
+        h_max = st.number_input("最多采集条数 (0 = 不限)", 0, step=1000)
+        h_proxy = st.text_input("代理 (可选)", "")
+        slug = re.sub(r"[^0-9A-Za-z]+", "_", h_query).strip("_")[:60] or "harvest"
+        h_out = st.text_input("输出文件 (.jsonl / .csv / .parquet)", os.path.join(CACHE_DIR, "harvest", f"{slug}_{h_start}_{h_end}.jsonl"))
+        h_run = st.button("📦 开始 / 继续采集", type="primary", use_container_width=True)
+
+    st.markdown("### 📦 批量采集")
+    st.caption("使用 Semantic Scholar bulk search + continuation token，逐页写入文件并保存断点；同参数再次运行会从断点继续。")
+    if h_run and h_query.strip():
+        h_struct = [[t.strip() for t in g.split('/') if t.strip()] for g in h_filter.split(';') if g.strip()]
+        h_proxies = [h_proxy.strip()] if h_proxy.strip() else None
+        prog = st.progress(0.0)
+        info = st.empty()
+        def _on_page(ck):
+            total = ck.get("total") or 0
+            if total: prog.progress(min(1.0, ck["rows"] / (min(total, h_max) if h_max else total)))
+            info.markdown(f"第 {ck['pages']} 页 · 已写入 **{ck['rows']}** / {total} 条")
+        try:
+            ck = harvest_bulk(h_query.strip(), h_out, h_start, h_end, h_venues or None, h_proxies, h_struct or None, h_max or None, _on_page)
+            prog.progress(1.0)
+            st.success(f"采集完成：{ck['rows']} 条 → {h_out}")
+        except Exception as e:
+            st.error(f"采集中断（可再次点击继续）: {e}")
@@ -0,0 +1,2597 @@
+#!/usr/bin/env python3
+"""
+Search engine behind DeepSearch Pro (paper_search.py), importable without Streamlit.
+
+Holds the Nature / Semantic Scholar workers, task preparation, the shared
+rate limiter, HTTP cache, proxy pool and the background job runner. The
+singletons below are created once per process (the HTTP cache on its first
+request), so every Streamlit session, job and worker thread shares them.
+
+Run directly it is a headless batch runner (e.g. from cron): every query
+file becomes one search job whose rows are written to JSONL, CSV or Parquet.
+
+Usage:
+    python search_engine.py queries/llm.json
+    python search_engine.py queries/*.yaml --out-dir ./results --format parquet
+    python search_engine.py --resume 20250101-020000-ab12cd --out-dir ./results
+"""
+
+import os
+import sys
+import argparse
+import requests
+import importlib.util
+import time
+import random
+import concurrent.futures
+import urllib.parse
+import json
+import itertools
+import uuid
+import hashlib
+import sqlite3
+import threading
+import email.utils
+import asyncio
+import re
+import functools
+import collections
+import copy
+import socket
+from datetime import datetime, timedelta
+from bs4 import BeautifulSoup
+
+def _lazy_module(name):
+    """Module imported on first attribute access (an already imported one is returned as is)."""
+    if name in sys.modules: return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+# pandas / numpy 占冷启动的大半, 延后到首次使用时导入, 让 --help / --list 等命令保持快速
+pd = _lazy_module("pandas")
+np = _lazy_module("numpy")
+
+# 可选：aiohttp 用于 Nature 异步爬取引擎 (缺失时回退到 requests 连接池)
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+# 可选：PyYAML 用于读取 YAML 格式的查询文件
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+# ================= 常量配置 =================
+# HTTP 响应缓存 / 翻译库等持久化数据目录
+CACHE_DIR = os.environ.get("DEEPSEARCH_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "deepsearch_pro"))
+NATURE_JOURNALS_MAP = {
+    "Nature Machine Intelligence": "natmachintell",
+    "Nature Computational Science": "natcomputsci",
+    "Nature Communications": "ncomms",
+    "Nature Methods": "nmeth",
+    "Nature Chemistry": "nchem",
+    "Nature": "nature",
+    "Nature Biotechnology": "nbt",
+    "Nature Biomedical Engineering": "natbiomedeng"
+}
+
+API_JOURNALS_LIST = [
+    "IEEE Transactions on Pattern Analysis and Machine Intelligence", 
+    "IEEE Transactions on Neural Networks and Learning Systems",      
+    "IEEE Transactions on Knowledge and Data Engineering",
+    "IEEE Transactions on Image Processing",
+    "Science Advances",
+    "Science",
+    "NeurIPS",
+    "ICLR",
+    "ICML",
+    "CVPR",
+    "ICCV",
+    "ECCV",
+    "ACL",
+    "Findings of the Association for Computational Linguistics",
+    "EMNLP",
+    "Findings of the Association for Computational Linguistics: EMNLP",
+    "COLING",
+    "NAACL",
+    "AAAI",
+    "IJCAI",
+    "Bioinformatics",
+    "ArXiv"
+]
+
+JOURNAL_DISPLAY_ABBR = {
+    "Nature Machine Intelligence": "Nature MI",
+    "Nature Computational Science": "Nature Comp. Sci",
+    "Nature Communications": "Nature Comm",
+    "Nature Methods": "Nature Methods",
+    "Nature Chemistry": "Nature Chem",
+    "IEEE Transactions on Pattern Analysis and Machine Intelligence": "IEEE TPAMI",
+    "IEEE Transactions on Neural Networks and Learning Systems": "IEEE TNNLS",
+    "IEEE Transactions on Knowledge and Data Engineering": "IEEE TKDE",
+    "Science Advances": "Science Adv",
+    "Association for Computational Linguistics": "ACL",
+    "Findings of the Association for Computational Linguistics": "Findings of ACL",
+    "Empirical Methods in Natural Language Processing": "EMNLP",
+    "Findings of the Association for Computational Linguistics: EMNLP": "Findings of EMNLP",
+    "International Conference on Computational Linguistics": "COLING",
+    "North American Chapter of the Association for Computational Linguistics": "NAACL",
+    "Association for the Advancement of Artificial Intelligence": "AAAI",
+    "International Joint Conference on Artificial Intelligence": "IJCAI"
+}
+
+# ================= 论文 ID =================
+def normalize_title(title):
+    """Lowercase, drop punctuation and collapse whitespace so cosmetic variants share one key."""
+    return " ".join(re.sub(r"[^\w]+", " ", str(title or "").lower()).split())
+
+def _id_part(v):
+    """Identifier as a stripped string, or None for missing / NaN / placeholder values."""
+    v = str(v).strip() if v is not None else ""
+    return None if v in ("", "nan", "None", "<NA>", "N/A") else v
+
+def make_paper_id(doi=None, arxiv=None, s2_id=None, title=None, year=None, journal=None, url=None):
+    """Canonical, session-independent paper ID: DOI > arXiv > S2 paperId > digest of title+year+journal+URL.
+
+    Journal and URL are part of the digest so generic titles ("Correction",
+    "Editorial") from different venues do not share an ID.
+    """
+    if _id_part(doi): return "doi:" + _id_part(doi).lower()
+    if _id_part(arxiv): return "arxiv:" + re.sub(r"v\d+$", "", _id_part(arxiv).lower())
+    if _id_part(s2_id): return "s2:" + _id_part(s2_id)
+    try: year = int(float(year))
+    except (TypeError, ValueError): year = 0
+    key = f"{normalize_title(title)}|{year}|{normalize_title(_id_part(journal))}|{_id_part(url) or ''}"
+    return "t:" + hashlib.sha1(key.encode()).hexdigest()[:16]
+
+def paper_id_series(df):
+    """PaperID per row: keep an existing column, otherwise derive it from DOI / paperId / URL / title+year+journal."""
+    existing = df['PaperID'] if 'PaperID' in df else pd.Series(None, index=df.index, dtype=object)
+    existing = existing.map(_id_part).astype(object)
+    col = lambda c: df[c].astype(object) if c in df else pd.Series(None, index=df.index, dtype=object)
+    doi, s2, url, title, year = col('DOI'), col('paperId'), col('URL'), col('Title'), col('Year')
+    journal = col('FullJournal').where(col('FullJournal').map(_id_part).notna(), col('Journal'))
+    derived = [make_paper_id(doi=_id_part(d) or nature_doi(_id_part(u)), s2_id=sid, title=_id_part(t), year=y, journal=j, url=u)
+               for d, sid, u, t, y, j in zip(doi, s2, url, title, year, journal)]
+    return existing.fillna(pd.Series(derived, index=df.index, dtype=object)).astype(str)
+
+# ================= 近似去重 =================
+DEDUP_SHINGLE = 4          # 字符 n-gram 长度
+DEDUP_NUM_PERM = 64        # MinHash 签名长度
+DEDUP_BANDS = 16           # LSH 分带数 (每带 4 行)
+DEDUP_JACCARD = 0.8        # 签名估计的 Jaccard 阈值
+DEDUP_MIN_TITLE = 12       # 更短的标题只做精确去重
+DEDUP_CHUNK = 1 << 17      # 每批处理的 shingle 数, 控制内存
+# shingle 先经 murmur3 finalizer 打散, 再用 uint32 上的仿射置换 a*x + b (a 为奇数) 生成各签名位
+@functools.lru_cache(maxsize=1)
+def _minhash_params():
+    """(perm a, perm b, band mix) drawn from a fixed seed, so signatures are stable across runs."""
+    rng = np.random.default_rng(20240601)
+    perm_a = rng.integers(0, 1 << 32, DEDUP_NUM_PERM, dtype=np.uint32) | np.uint32(1)
+    perm_b = rng.integers(0, 1 << 32, DEDUP_NUM_PERM, dtype=np.uint32)
+    return perm_a, perm_b, rng.integers(1, 1 << 62, DEDUP_NUM_PERM // DEDUP_BANDS, dtype=np.uint64)
+
+def title_shingles(titles, k=DEDUP_SHINGLE):
+    """Vectorized byte k-gram shingles: returns (row ids, shingle ids), rows in ascending order."""
+    encoded = [t.encode() for t in titles]
+    lens = np.fromiter((len(b) for b in encoded), dtype=np.int64, count=len(encoded))
+    buf = np.frombuffer(b"".join(encoded), dtype=np.uint8).astype(np.uint32)
+    n_grams = np.maximum(lens - k + 1, 0)
+    rows = np.repeat(np.arange(len(encoded)), n_grams)
+    starts = np.repeat(np.cumsum(lens) - lens, n_grams) + (np.arange(n_grams.sum()) - np.repeat(np.cumsum(n_grams) - n_grams, n_grams))
+    grams = np.zeros(len(starts), dtype=np.uint32)
+    for i in range(k): grams = (grams << np.uint32(8)) | buf[starts + i]  # k <= 4 字节装入 uint32
+    grams ^= grams >> np.uint32(16); grams *= np.uint32(0x85EBCA6B)
+    grams ^= grams >> np.uint32(13); grams *= np.uint32(0xC2B2AE35)
+    grams ^= grams >> np.uint32(16)
+    # 行内重复 shingle 不影响 MinHash 取最小值, 无需去重
+    return rows, grams
+
+def minhash_signatures(titles):
+    """(n, DEDUP_NUM_PERM) MinHash signatures of normalized titles, computed in bounded-memory chunks."""
+    rows, grams = title_shingles(titles)
+    perm_a, perm_b, _ = _minhash_params()
+    sig = np.full((len(titles), DEDUP_NUM_PERM), np.iinfo(np.uint32).max, dtype=np.uint32)
+    bounds = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]]) if len(rows) else np.array([], dtype=np.int64)
+    lo = 0
+    while lo < len(bounds):
+        # 按行对齐切块, 避免一行跨块
+        hi = np.searchsorted(bounds, bounds[lo] + DEDUP_CHUNK, side='left')
+        hi = max(hi, lo + 1)
+        s0 = bounds[lo]
+        s1 = bounds[hi] if hi < len(bounds) else len(rows)
+        h = grams[s0:s1, None] * perm_a + perm_b
+        sig[rows[bounds[lo:hi]]] = np.minimum.reduceat(h, bounds[lo:hi] - s0, axis=0)
+        lo = hi
+    return sig
+
+def _lsh_candidates(sig):
+    """Candidate pairs: rows sharing any LSH band bucket (adjacent members after sorting each band)."""
+    r = DEDUP_NUM_PERM // DEDUP_BANDS
+    band_mix = _minhash_params()[2]
+    pairs = []
+    for b in range(DEDUP_BANDS):
+        keys = (sig[:, b * r:(b + 1) * r].astype(np.uint64) * band_mix).sum(axis=1)
+        order = np.argsort(keys, kind='stable')
+        same = keys[order[1:]] == keys[order[:-1]]
+        pairs.append(np.stack([order[:-1][same], order[1:][same]], axis=1))
+    pairs = np.concatenate(pairs) if pairs else np.empty((0, 2), dtype=np.int64)
+    return np.unique(np.sort(pairs, axis=1), axis=0)
+
+def _union_groups(n, edges):
+    """Connected components over (i, j) edges; returns a label (smallest member) per row."""
+    parent = list(range(n))
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+    for i, j in edges:
+        ri, rj = find(int(i)), find(int(j))
+        if ri != rj: parent[max(ri, rj)] = min(ri, rj)
+    return np.array([find(i) for i in range(n)], dtype=np.int64)
+
+def duplicate_groups(df):
+    """Group label per row: exact title|journal|year, same non-digest PaperID, or near-identical title (MinHash/LSH)."""
+    n = len(df)
+    col = lambda c: df[c].astype(object).where(df[c].notna(), '').astype(str) if c in df else pd.Series('', index=df.index)
+    titles = [normalize_title(t) for t in col('Title')]
+    years = pd.to_numeric(df['Year'], errors='coerce').fillna(0).to_numpy() if 'Year' in df else np.zeros(n)
+    pids = col('PaperID').to_numpy()
+    edges = []
+    exact = pd.Series(titles, index=df.index) + "|" + col('Journal').str.strip().str.lower() + "|" + col('Year')
+    codes = pd.factorize(exact)[0]
+    first = pd.Series(np.arange(n)).groupby(codes).transform('min').to_numpy()
+    edges.append(np.stack([first, np.arange(n)], axis=1)[first != np.arange(n)])
+    strong = np.flatnonzero(~pd.Series(pids).str.startswith("t:").to_numpy() & (pids != ''))
+    if len(strong):
+        codes = pd.factorize(pids[strong])[0]
+        first = pd.Series(strong).groupby(codes).transform('min').to_numpy()
+        edges.append(np.stack([first, strong], axis=1)[first != strong])
+    fuzzy = np.flatnonzero(np.fromiter((len(t) >= DEDUP_MIN_TITLE for t in titles), dtype=bool, count=n))
+    if len(fuzzy) > 1:
+        sig = minhash_signatures([titles[i] for i in fuzzy])
+        cand = _lsh_candidates(sig)
+        if len(cand):
+            a, b = cand[:, 0], cand[:, 1]
+            sim = (sig[a] == sig[b]).mean(axis=1)
+            ia, ib = fuzzy[a], fuzzy[b]
+            ya, yb = years[ia], years[ib]
+            year_ok = (ya == 0) | (yb == 0) | (np.abs(ya - yb) <= 1)
+            pa, pb = pids[ia], pids[ib]
+            doi_clash = np.char.startswith(pa.astype(str), "doi:") & np.char.startswith(pb.astype(str), "doi:") & (pa != pb)
+            # 数字不同 (GPT-3 / GPT-4, Part 1 / Part 2) 视为不同论文
+            digits = np.array([" ".join(re.findall(r"\d+", titles[i])) for i in fuzzy], dtype=object)
+            keep = (sim >= DEDUP_JACCARD) & year_ok & ~doi_clash & (digits[a] == digits[b])
+            edges.append(np.stack([ia[keep], ib[keep]], axis=1))
+    edges = np.concatenate(edges) if edges else np.empty((0, 2), dtype=np.int64)
+    return _union_groups(n, edges)
+
+_ID_RANK = {"doi": 0, "arxiv": 1, "s2": 2}
+_NO_ABSTRACT = ("", "暂无摘要", "nan", "None")
+
+def _merge_group(rows):
+    """Union metadata of duplicate rows (dicts, first = kept row): richer abstract, numeric citations, OA PDF, ids."""
+    merged = {}
+    abstracts = [str(r.get('Abstract')) for r in rows if str(r.get('Abstract')) not in _NO_ABSTRACT and pd.notna(r.get('Abstract'))]
+    if abstracts:
+        merged['Abstract'] = max(abstracts, key=len)
+        # 选中的摘要若仍是 Nature 卡片预览, 保留按需抓取标记
+        if any('AbstractPending' in r for r in rows):
+            merged['AbstractPending'] = any(r.get('AbstractPending') is True and str(r.get('Abstract')) == merged['Abstract'] for r in rows)
+    cites = pd.to_numeric(pd.Series([r.get('Citations') for r in rows], dtype=object), errors='coerce').dropna()
+    if len(cites): merged['Citations'] = int(cites.max())
+    for c in ('OpenAccessPdf', 'Abstract_CN', 'paperId', 'DOI'):
+        vals = [r.get(c) for r in rows if isinstance(r.get(c), dict) or _id_part(r.get(c))]
+        if vals: merged[c] = vals[0]
+    ids = [str(r.get('PaperID')) for r in rows if _id_part(r.get('PaperID'))]
+    if ids: merged['PaperID'] = min(ids, key=lambda x: _ID_RANK.get(x.split(":", 1)[0], 3))
+    return merged
+
+def deduplicate_dataframe(df):
+    """Merge exact and near-duplicate papers (see duplicate_groups), keeping the first row of each group enriched with the others' metadata."""
+    if df.empty: return df
+    labels = duplicate_groups(df)
+    pos = np.arange(len(df))
+    if (labels == pos).all(): return df.copy()
+    merge_cols = [c for c in ('Abstract', 'AbstractPending', 'Citations', 'OpenAccessPdf', 'Abstract_CN', 'paperId', 'DOI', 'PaperID') if c in df]
+    # 只处理有重复的组: 单行组 (绝大多数) 不转换为 dict, 也不进入循环
+    lbls, counts = np.unique(labels, return_counts=True)
+    in_dup = np.isin(labels, lbls[counts > 1])
+    idx, grp = pos[in_dup], labels[in_dup]
+    order = np.argsort(grp, kind='stable')
+    idx, grp = idx[order], grp[order]
+    sub = df.iloc[idx][merge_cols].astype(object).to_dict('records')
+    updates = {c: {} for c in merge_cols}
+    for members in np.split(np.arange(len(idx)), np.flatnonzero(np.diff(grp)) + 1):
+        for c, v in _merge_group([sub[i] for i in members]).items():
+            if c in updates: updates[c][int(grp[members[0]])] = v
+    out = df.copy()
+    for c, vals in updates.items():
+        if not vals: continue
+        # 组标签即保留行的位置
+        series = out[c].astype(object)
+        series.iloc[list(vals)] = list(vals.values())
+        if isinstance(out[c].dtype, pd.CategoricalDtype): series = series.astype('category')
+        elif c == 'Citations' and str(out[c].dtype).startswith(('Int', 'int')): series = pd.to_numeric(series, errors='coerce').astype(out[c].dtype)
+        out[c] = series
+    return out.iloc[labels == pos]
+
+def dedup_records(records):
+    """deduplicate_dataframe for the list-of-dicts results of a search run (NaN-free dicts back)."""
+    if not records: return records
+    df = deduplicate_dataframe(pd.DataFrame(records))
+    return [{k: v for k, v in r.items() if not (isinstance(v, float) and v != v)} for r in df.to_dict('records')]
+
+# ================= 关键词过滤引擎 =================
+def clean_filter_term(term):
+    return term.replace('"', '').replace("'", "").strip().lower()
+
+class KeywordFilter:
+    """Compiled strict filter for "A/B; C/D": every group needs at least one of its terms.
+
+    Matching is case-insensitive substring search, as before. Each group is one
+    alternation regex, so the same object serves scalar checks in the workers
+    and vectorized masks over DataFrame Title/Abstract columns.
+    """
+    def __init__(self, groups):
+        self.groups = groups
+        self.patterns = [re.compile("|".join(re.escape(t) for t in g)) for g in groups]
+
+    def match(self, title_txt, abs_txt):
+        content = f"{title_txt or ''} {abs_txt or ''}".lower()
+        return all(p.search(content) for p in self.patterns)
+
+    def matched_terms(self, title_txt, abs_txt):
+        """First matching term of each group, in the order the user typed them."""
+        content = f"{title_txt or ''} {abs_txt or ''}".lower()
+        return [hit for hit in (next((t for t in g if t in content), None) for g in self.groups) if hit]
+
+    def mask(self, df, title_col='Title', abstract_col='Abstract'):
+        if df.empty: return pd.Series(True, index=df.index)
+        title = df[title_col].fillna('').astype(str) if title_col in df else ''
+        abst = df[abstract_col].fillna('').astype(str) if abstract_col in df else ''
+        content = (title + " " + abst).str.lower()
+        mask = pd.Series(True, index=df.index)
+        for p in self.patterns:
+            mask &= content.str.contains(p, na=False)
+        return mask
+
+@functools.lru_cache(maxsize=64)
+def _compile_filter(groups_key):
+    groups = []
+    for group in groups_key:
+        terms = [t for t in dict.fromkeys(clean_filter_term(k) for k in group) if t]
+        if terms: groups.append(terms)
+    return KeywordFilter(groups) if groups else None
+
+def compile_filter(filter_struct):
+    """Return a cached KeywordFilter for a list-of-groups struct, or None when there is nothing to filter."""
+    if not filter_struct: return None
+    return _compile_filter(tuple(tuple(g) for g in filter_struct))
+
+def find_matched_terms(title_txt, abs_txt, filter_struct):
+    """Return list of matched keywords (one per group) based on provided filter_struct."""
+    kf = compile_filter(filter_struct)
+    return kf.matched_terms(title_txt, abs_txt) if kf else []
+
+def unique_keys(prefix, pids):
+    """f"{prefix}_{PaperID}" per row; repeated IDs (e.g. title digests from old exports) get "~2", "~3", ... so keys stay unique."""
+    pids = pd.Series(pids).astype(str)
+    n = pids.groupby(pids, sort=False).cumcount().to_numpy()
+    return f"{prefix}_" + pids + np.where(n > 0, "~" + (n + 1).astype(str), "")
+
+def add_translate_key(df, prefix):
+    """Add PaperID and the per-row key used for widget keys and selection/removal sets (stable across sessions)."""
+    df = df.copy()
+    df['PaperID'] = paper_id_series(df)
+    df['TranslateKey'] = unique_keys(prefix, df['PaperID'])
+    return df
+
+
+# ================= Clash API 控制器 =================
+class ClashAPI:
+    def __init__(self, base_url="http://127.0.0.1:9090", secret=""):
+        self.base_url = base_url.rstrip('/')
+        self.secret = secret
+        self.connected = False
+    
+    def _get_headers(self):
+        headers = {}
+        if self.secret: headers["Authorization"] = f"Bearer {self.secret}"
+        return headers
+
+    def _get_session(self):
+        session = requests.Session()
+        session.trust_env = False
+        return session
+
+    def test_connection(self):
+        try:
+            s = self._get_session()
+            r = s.get(f"{self.base_url}/configs", headers=self._get_headers(), timeout=2)
+            if r.status_code == 200:
+                self.connected = True
+                return True, "✅ 连接成功"
+            elif r.status_code == 401: return False, "❌ 401 Unauthorized"
+            else: return False, f"❌ HTTP {r.status_code}"
+        except Exception as e: return False, f"❌ 无法连接: {str(e)}"
+
+    def get_configs(self):
+        try:
+            s = self._get_session()
+            r = s.get(f"{self.base_url}/configs", headers=self._get_headers(), timeout=2)
+            return r.json() if r.status_code == 200 else {}
+        except: return {}
+
+    def patch_mode(self, mode):
+        try:
+            s = self._get_session()
+            s.patch(f"{self.base_url}/configs", json={"mode": mode}, headers=self._get_headers(), timeout=2)
+            return True
+        except: return False
+    
+    def get_proxies(self):
+        try:
+            s = self._get_session()
+            r = s.get(f"{self.base_url}/proxies", headers=self._get_headers(), timeout=2)
+            return r.json()['proxies'] if r.status_code == 200 else {}
+        except: return {}
+        
+    def select_proxy(self, group_name, proxy_name):
+        try:
+            s = self._get_session()
+            safe_group = urllib.parse.quote(group_name)
+            r = s.put(f"{self.base_url}/proxies/{safe_group}", json={"name": proxy_name}, headers=self._get_headers(), timeout=2)
+            return r.status_code < 400
+        except: return False
+
+    def get_delay(self, proxy_name, test_url=None, timeout_ms=3000):
+        """Node latency (ms) via the controller's delay endpoint; None on timeout / error."""
+        try:
+            s = self._get_session()
+            safe_name = urllib.parse.quote(proxy_name)
+            params = {"url": test_url or CLASH_DELAY_URL, "timeout": timeout_ms}
+            r = s.get(f"{self.base_url}/proxies/{safe_name}/delay", params=params, headers=self._get_headers(), timeout=timeout_ms / 1000 + 1)
+            return r.json().get("delay") if r.status_code == 200 else None
+        except: return None
+
+    def current_node(self, group_name):
+        return (self.get_proxies().get(group_name) or {}).get("now")
+
+# ================= Clash 节点调度 =================
+CLASH_DELAY_URL = "http://www.gstatic.com/generate_204"
+CLASH_PROBE_INTERVAL = 300     # 节点测速刷新间隔 (秒)
+CLASH_BAD_COOLDOWN = 600       # 被拦截节点的冷却时间
+CLASH_DRAIN_TIMEOUT = 10       # 切换前等待在途请求完成的上限
+
+class ClashNodeScheduler:
+    """Serialized exit-node rotation for one Clash selector group.
+
+    Nodes are ranked by the controller's delay test. Requests `lease()` the
+    current node generation and `release()` it with their outcome; only a block
+    or failure on the *current* generation asks for a switch, and the switch
+    waits for in-flight requests to drain (bounded by CLASH_DRAIN_TIMEOUT)
+    before one PUT moves the group to the best healthy node. Stale reports
+    from an older generation are ignored, so concurrent workers never yank the
+    node from under each other.
+    """
+    def __init__(self, api_url, secret, group, nodes):
+        self.api = ClashAPI(api_url, secret)
+        self.group = group
+        self.nodes = [n for n in nodes if 'DIRECT' not in n and 'REJECT' not in n]
+        self.delays = {}
+        self.bad_until = {}
+        self.current = None
+        self.generation = 0
+        self.in_flight = 0
+        self.switch_wanted = False
+        self.switches = 0
+        self.last_probe = 0.0
+        self._probing = False
+        self.cond = threading.Condition()
+
+    def refresh(self):
+        """Re-measure every node's delay (concurrently) and update the ranking."""
+        with concurrent.futures.ThreadPoolExecutor(max_workers=16) as ex:
+            delays = dict(zip(self.nodes, ex.map(self.api.get_delay, self.nodes)))
+        with self.cond:
+            self.delays = delays
+            self.last_probe = time.time()
+            self._probing = False
+        return delays
+
+    def _maybe_refresh(self):
+        if self._probing or time.time() - self.last_probe < CLASH_PROBE_INTERVAL: return
+        self._probing = True
+        threading.Thread(target=self.refresh, daemon=True).start()
+
+    def ranked(self):
+        """Nodes best-first: healthy before cooling-down, then by measured delay (unmeasured last)."""
+        now = time.time()
+        return sorted(self.nodes, key=lambda n: (self.bad_until.get(n, 0) > now, self.delays.get(n) or float("inf")))
+
+    def _switch_locked(self):
+        for node in [n for n in self.ranked() if n != self.current] or [self.current]:
+            if node and self.api.select_proxy(self.group, node):
+                self.current = node
+                break
+        self.generation += 1
+        self.switches += 1
+        self.switch_wanted = False
+        self.cond.notify_all()
+
+    def lease(self):
+        """Block while a switch is pending, then return (generation, node) for one request."""
+        with self.cond:
+            self._maybe_refresh()
+            if self.current is None:
+                now_node = self.api.current_node(self.group)
+                if now_node in self.nodes: self.current = now_node
+                else: self._switch_locked()
+            deadline = time.time() + CLASH_DRAIN_TIMEOUT
+            while self.switch_wanted:
+                if self.in_flight == 0 or time.time() >= deadline:
+                    self._switch_locked()
+                    break
+                self.cond.wait(timeout=0.2)
+            self.in_flight += 1
+            return self.generation, self.current
+
+    def release(self, generation, failed=False):
+        with self.cond:
+            self.in_flight = max(0, self.in_flight - 1)
+            if failed and generation == self.generation and not self.switch_wanted:
+                if self.current: self.bad_until[self.current] = time.time() + CLASH_BAD_COOLDOWN
+                self.switch_wanted = True
+            self.cond.notify_all()
+
+    def snapshot(self):
+        now = time.time()
+        return [{"Node": n, "Delay(ms)": self.delays.get(n), "Current": "👈" if n == self.current else "",
+                 "Cooling": self.bad_until.get(n, 0) > now} for n in self.ranked()]
+
+_clash_schedulers, _clash_schedulers_lock = {}, threading.Lock()
+
+def clash_scheduler_for(clash_cfg):
+    """Process-wide scheduler for the (controller, group) of a task's clash_cfg; None when rotation is off."""
+    if not clash_cfg or not clash_cfg.get('enabled') or not clash_cfg.get('nodes'): return None
+    key = (clash_cfg['url'], clash_cfg['group'])
+    with _clash_schedulers_lock:
+        sched = _clash_schedulers.get(key)
+        if sched is None or sched.nodes != [n for n in clash_cfg['nodes'] if 'DIRECT' not in n and 'REJECT' not in n]:
+            sched = _clash_schedulers[key] = ClashNodeScheduler(clash_cfg['url'], clash_cfg['secret'], clash_cfg['group'], clash_cfg['nodes'])
+        return sched
+
+# ================= 代理池管理器 =================
+class ProxyManager:
+    def __init__(self): self.proxies = []
+    def load_manual_proxies(self, text_input):
+        if not text_input: return 0
+        raw_list = text_input.replace('\n', ';').split(';')
+        valid_proxies = []
+        for p in raw_list:
+            p = p.strip()
+            if not p: continue
+            if not p.startswith("http"): p = f"http://{p}"
+            valid_proxies.append(p)
+        self.proxies = valid_proxies
+        return len(self.proxies)
+
+# 熔断: 连续失败次数阈值; 冷却时间 (初始, 上限) 秒, 每次再失败翻倍
+PROXY_TRIP_FAILURES = 3
+PROXY_COOLDOWN = (30, 600)
+PROXY_PROBE_INTERVAL = 60
+PROXY_EWMA_ALPHA = 0.3
+
+def requests_proxies(proxy):
+    return {"http": proxy, "https": proxy} if proxy else None
+
+class ProxyStats:
+    """Health of one proxy: EWMA latency / success rate, in-flight count and circuit-breaker state."""
+    def __init__(self):
+        self.latency = None
+        self.success = 1.0
+        self.in_flight = 0
+        self.failures = 0
+        self.blocks = 0
+        self.requests = 0
+        self.state = "closed"          # closed / open (熔断中)
+        self.open_until = 0.0
+        self.cooldown = PROXY_COOLDOWN[0]
+        self.trial = False             # 冷却结束后放行的单个试探请求
+
+class ProxyPool:
+    """Process-wide proxy health registry shared by every session, job and worker.
+
+    `acquire()` picks, among the caller's proxies, the one with the lowest
+    load-weighted latency / success score; proxies whose circuit is open are
+    skipped until their cooldown ends, then let through for one trial request.
+    Outcomes (latency, 403/429, the idp.nature.com redirect) feed back through
+    `release()`. A background thread probes tripped proxies once their
+    cooldown ends, and only while the pool is in use.
+    """
+    def __init__(self):
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._prober = None
+        self._last_acquire = 0.0
+
+    def _get(self, proxy):
+        if proxy not in self._stats: self._stats[proxy] = ProxyStats()
+        return self._stats[proxy]
+
+    def _available(self, st_, now):
+        if st_.state == "closed": return True
+        return now >= st_.open_until and not st_.trial
+
+    @staticmethod
+    def _score(st_):
+        # 未用过的代理按极低延迟乐观估计, 保证每个代理都会被试到
+        latency = st_.latency if st_.latency is not None else 0.001
+        return (st_.in_flight + 1) * latency / max(st_.success, 0.05)
+
+    def acquire(self, proxies):
+        """Reserve the healthiest proxy of `proxies` (None when the list is empty)."""
+        if isinstance(proxies, dict): proxies = list(dict.fromkeys(proxies.values()))  # 旧任务里的 requests 代理字典
+        candidates = [p for p in (proxies or []) if p]
+        if not candidates: return None
+        with self._lock:
+            now = self._last_acquire = time.time()
+            stats = {p: self._get(p) for p in candidates}
+            usable = [p for p in candidates if self._available(stats[p], now)]
+            # 全部熔断时退而求其次: 选最早恢复的
+            proxy = min(usable, key=lambda p: self._score(stats[p])) if usable else min(candidates, key=lambda p: stats[p].open_until)
+            st_ = stats[proxy]
+            if st_.state == "open": st_.trial = True
+            st_.in_flight += 1
+        self._ensure_prober()
+        return proxy
+
+    def release(self, proxy, ok=None, latency=None, blocked=False):
+        """Return a proxy; ok=None (e.g. a cache hit) only frees the slot without scoring."""
+        if not proxy: return
+        with self._lock:
+            st_ = self._get(proxy)
+            st_.in_flight = max(0, st_.in_flight - 1)
+            if ok is None: return
+            now = time.time()
+            st_.requests += 1
+            if latency is not None:
+                st_.latency = latency if st_.latency is None else (1 - PROXY_EWMA_ALPHA) * st_.latency + PROXY_EWMA_ALPHA * latency
+            good = ok and not blocked
+            st_.success = (1 - PROXY_EWMA_ALPHA) * st_.success + PROXY_EWMA_ALPHA * (1.0 if good else 0.0)
+            st_.trial = False
+            if blocked: st_.blocks += 1
+            if good:
+                st_.failures, st_.state, st_.cooldown = 0, "closed", PROXY_COOLDOWN[0]
+                return
+            st_.failures += 1
+            if st_.failures >= PROXY_TRIP_FAILURES or st_.state == "open":
+                st_.state = "open"
+                st_.open_until = now + st_.cooldown
+                st_.cooldown = min(PROXY_COOLDOWN[1], st_.cooldown * 2)
+
+    def _record(self, proxy, result, t0):
+        # 缓存命中 / 合并到他人请求的结果: 该代理没有发出请求, 不计分
+        if getattr(result, "from_cache", False) or getattr(result, "coalesced", False): return self.release(proxy)
+        blocked = is_blocked_url(result.url) or result.status_code in (403, 429)
+        self.release(proxy, result.status_code < 500 and not blocked, time.time() - t0, blocked)
+
+    def call(self, proxies, fn):
+        """Run fn(proxy) -> HttpResult on the best proxy and record the outcome."""
+        proxy = self.acquire(proxies)
+        t0 = time.time()
+        try: result = fn(proxy)
+        except CoalescedError:
+            self.release(proxy)
+            raise
+        except Exception:
+            self.release(proxy, False, time.time() - t0)
+            raise
+        self._record(proxy, result, t0)
+        return result
+
+    async def acall(self, proxies, coro_fn):
+        """Async variant of call() for the Nature engine."""
+        proxy = self.acquire(proxies)
+        t0 = time.time()
+        try: result = await coro_fn(proxy)
+        except CoalescedError:
+            self.release(proxy)
+            raise
+        except Exception:
+            self.release(proxy, False, time.time() - t0)
+            raise
+        self._record(proxy, result, t0)
+        return result
+
+    def probe(self, proxy):
+        """Health check through the proxy (test_proxy_connection); feeds the result into the stats."""
+        with self._lock: self._get(proxy).in_flight += 1
+        t0 = time.time()
+        ok, msg = test_proxy_connection(proxy)
+        self.release(proxy, ok, time.time() - t0, blocked=not ok and "拦截" in msg)
+        return ok, msg
+
+    def _ensure_prober(self):
+        with self._lock:
+            if self._prober: return
+            self._prober = threading.Thread(target=self._probe_loop, daemon=True)
+        self._prober.start()
+
+    def _probe_loop(self):
+        while True:
+            time.sleep(PROXY_PROBE_INTERVAL)
+            now = time.time()
+            # 探测也是上游请求: 只探测冷却结束的熔断代理, 且代理池闲置后停止
+            if now - self._last_acquire > PROXY_COOLDOWN[1]: continue
+            with self._lock:
+                due = [p for p, st_ in self._stats.items() if st_.in_flight == 0 and st_.state == "open" and now >= st_.open_until]
+            for p in due:
+                try: self.probe(p)
+                except Exception: pass
+
+    def snapshot(self, proxies=None):
+        """Per-proxy health rows for display."""
+        with self._lock:
+            rows = []
+            for p in (proxies if proxies is not None else list(self._stats)):
+                st_ = self._get(p)
+                rows.append({
+                    "Proxy": p, "State": "🔴 熔断" if st_.state == "open" else "🟢 正常",
+                    "Latency(ms)": round(st_.latency * 1000) if st_.latency is not None else None,
+                    "Success": round(st_.success, 2), "InFlight": st_.in_flight, "Blocks": st_.blocks, "Requests": st_.requests,
+                })
+            return rows
+
+proxy_pool = ProxyPool()
+
+# ================= 浏览器伪装 =================
+def get_browser_headers(manual_cookie=""):
+    user_agents = [
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36",
+        "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36"
+    ]
+    headers = {
+        "User-Agent": random.choice(user_agents),
+        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8",
+        "Referer": "https://www.nature.com/",
+        "Cache-Control": "max-age=0",
+        "Upgrade-Insecure-Requests": "1"
+    }
+    if manual_cookie: headers["Cookie"] = manual_cookie
+    return headers
+
+def test_proxy_connection(proxy_url):
+    proxies = {"http": proxy_url, "https": proxy_url}
+    try:
+        start_t = time.time()
+        r = requests.get("https://www.nature.com", proxies=proxies, timeout=10, headers=get_browser_headers())
+        latency = (time.time() - start_t) * 1000
+        if r.status_code == 200: return True, f"✅ 连接成功 ({latency:.0f}ms)"
+        elif r.status_code in [303, 403]: return False, f"⚠️ 连通但被拦截 (Status {r.status_code})"
+        else: return False, f"⚠️ Status {r.status_code}"
+    except Exception as e: return False, f"❌ 连接失败: {str(e)}"
+
+# ================= 请求限速 =================
+# 每个 host 的 (请求/秒, 突发容量)，可用 DEEPSEARCH_RATE_LIMITS='{"host": [rate, burst]}' 覆盖
+RATE_LIMITS = {
+    "api.semanticscholar.org": (1.0, 1),
+    "www.nature.com": (2.0, 4),
+}
+RATE_LIMITS.update({h: tuple(v) for h, v in json.loads(os.environ.get("DEEPSEARCH_RATE_LIMITS", "{}")).items()})
+DEFAULT_RATE_LIMIT = (2.0, 2)
+
+def parse_retry_after(value):
+    """Retry-After is either delta-seconds or an HTTP date; return seconds or None."""
+    if not value: return None
+    try: return max(0.0, float(value))
+    except ValueError: pass
+    try: return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError): return None
+
+class TokenBucket:
+    """Token bucket with AIMD rate: halve on throttling, creep back up after sustained success."""
+    SUCCESS_STREAK = 10
+
+    def __init__(self, rate, burst):
+        self.max_rate = rate
+        self.min_rate = rate / 16
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.streak = 0
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Take a token and return how many seconds the caller must wait before sending."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            return max(wait, self.blocked_until - now)
+
+    def penalize(self, retry_after=None):
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.streak = 0
+            self.tokens = min(self.tokens, 0)
+            pause = retry_after if retry_after is not None else 1.0 / self.rate
+            self.blocked_until = max(self.blocked_until, time.monotonic() + pause)
+
+    def reward(self):
+        with self._lock:
+            self.streak += 1
+            if self.streak >= self.SUCCESS_STREAK and self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 8)
+                self.streak = 0
+
+class RateLimiter:
+    """Process-wide per-(host, proxy) limiter shared by every worker thread."""
+    def __init__(self, limits, default=DEFAULT_RATE_LIMIT):
+        self.limits = limits
+        self.default = default
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, url, proxy=None):
+        """Bucket per (host, egress proxy): each proxy is a separate client IP upstream."""
+        host = urllib.parse.urlsplit(url).netloc.lower()
+        with self._lock:
+            if (host, proxy) not in self._buckets:
+                self._buckets[(host, proxy)] = TokenBucket(*self.limits.get(host, self.default))
+            return self._buckets[(host, proxy)]
+
+    def acquire(self, url, proxy=None):
+        wait = self.bucket(url, proxy).reserve()
+        if wait > 0: time.sleep(wait)
+
+    def feedback(self, url, status_code, headers=None, blocked=False, proxy=None):
+        b = self.bucket(url, proxy)
+        if status_code in (429, 503) or blocked:
+            b.penalize(parse_retry_after((headers or {}).get("Retry-After")))
+        elif status_code < 400:
+            b.reward()
+
+rate_limiter = RateLimiter(RATE_LIMITS)
+
+# ================= HTTP 响应缓存 =================
+HTTP_CACHE_MAX_MB = int(os.environ.get("DEEPSEARCH_HTTP_CACHE_MB", "512"))
+
+# 各数据源缓存有效期 (秒)
+HTTP_CACHE_TTL = {
+    "s2": 6 * 3600,
+    "nature_search": 3600,
+    "nature_article": 7 * 24 * 3600,
+}
+
+class HttpResult:
+    """Snapshot of an HTTP response, identical for live fetches and cache hits."""
+    def __init__(self, status_code, url, headers, content, encoding=None, from_cache=False):
+        self.status_code = status_code
+        self.url = url
+        self.headers = headers or {}
+        self.content = content or b""
+        self.encoding = encoding or "utf-8"
+        self.from_cache = from_cache
+        self.coalesced = False   # 等待他人同一请求得到的结果, 本方未发出请求
+
+    @classmethod
+    def from_response(cls, resp):
+        return cls(resp.status_code, resp.url, dict(resp.headers), resp.content, resp.encoding or resp.apparent_encoding)
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding, errors="replace")
+
+    def json(self):
+        return json.loads(self.text)
+
+def normalize_cache_key(url, params=None, method="GET", body=None, vary=None):
+    """Hash method + canonical URL (sorted query incl. params) + optional body/vary value."""
+    parts = urllib.parse.urlsplit(url)
+    query = urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+    if params: query += [(str(k), str(v)) for k, v in params.items() if v is not None]
+    query.sort()
+    canon = urllib.parse.urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path or "/", urllib.parse.urlencode(query), ""))
+    raw = f"{method.upper()} {canon}"
+    if body is not None: raw += " " + json.dumps(body, sort_keys=True)
+    if vary: raw += " " + hashlib.sha256(str(vary).encode()).hexdigest()
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+def is_blocked_url(url):
+    """Login / captcha redirects (Nature IdP, Google sorry page) must never be cached."""
+    url = url or ""
+    return "idp.nature.com" in url or "authorize" in url or "/sorry/" in url
+
+class ResponseCache:
+    """SQLite response store with per-source TTL, LRU eviction and ETag/Last-Modified validators."""
+    def __init__(self, path, max_bytes):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS responses (
+            key TEXT PRIMARY KEY, source TEXT, url TEXT, status INTEGER, headers TEXT, body BLOB,
+            encoding TEXT, etag TEXT, last_modified TEXT, size INTEGER, fetched_at REAL, accessed_at REAL)""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses(accessed_at)")
+        self._conn.commit()
+        self._total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def lookup(self, key):
+        """Return (HttpResult, fetched_at, etag, last_modified) or None; marks the entry as recently used."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status, url, headers, body, encoding, etag, last_modified, fetched_at FROM responses WHERE key=?", (key,)
+            ).fetchone()
+            if not row: return None
+            self._conn.execute("UPDATE responses SET accessed_at=? WHERE key=?", (time.time(), key))
+            self._conn.commit()
+        status, url, headers, body, encoding, etag, last_mod, fetched_at = row
+        result = HttpResult(status, url, json.loads(headers or "{}"), body, encoding, from_cache=True)
+        return result, fetched_at, etag, last_mod
+
+    def store(self, key, source, result):
+        now = time.time()
+        size = len(result.content)
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM responses WHERE key=?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?,?,?,?,?,?,?,?,?,?,?,?)",
+                (key, source, result.url, result.status_code, json.dumps(result.headers), result.content, result.encoding,
+                 result.headers.get("ETag"), result.headers.get("Last-Modified"), size, now, now)
+            )
+            self._total += size - (old[0] if old else 0)
+            self._evict()
+            self._conn.commit()
+
+    def touch(self, key):
+        """Reset the age of an entry after a 304 revalidation."""
+        with self._lock:
+            now = time.time()
+            self._conn.execute("UPDATE responses SET fetched_at=?, accessed_at=? WHERE key=?", (now, now, key))
+            self._conn.commit()
+
+    def _evict(self):
+        while self._total > self.max_bytes:
+            rows = self._conn.execute("SELECT key, size FROM responses ORDER BY accessed_at LIMIT 64").fetchall()
+            if not rows: break
+            self._conn.executemany("DELETE FROM responses WHERE key=?", [(k,) for k, _ in rows])
+            self._total -= sum(s for _, s in rows)
+
+# 首次请求时才打开 http_cache.sqlite (... 表示尚未打开, None 表示不可用)
+_response_cache, _response_cache_lock = ..., threading.Lock()
+
+def get_response_cache():
+    """Process-wide cache shared by all sessions, opened on first use; None when the cache dir is not writable."""
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is ...:
+            try: _response_cache = ResponseCache(os.path.join(CACHE_DIR, "http_cache.sqlite"), HTTP_CACHE_MAX_MB * 1024 * 1024)
+            except (OSError, sqlite3.Error): _response_cache = None
+        return _response_cache
+
+class SingleFlight:
+    """Coalesce identical in-flight upstream calls across threads, sessions and the async engine.
+
+    The first caller for a key (the leader) performs the call; concurrent
+    callers with the same key wait on the leader's Future and get the same
+    result, flagged `coalesced` (or a CoalescedError), so the proxy pool does
+    not score a waiter's proxy with an outcome it did not produce. Sync
+    waiters block on it, async waiters await it via asyncio.wrap_future. Once
+    the call finishes the key is released, and later callers are served by
+    the response cache instead.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.coalesced = 0
+
+    def _join(self, key):
+        with self._lock:
+            fut = self._calls.get(key)
+            if fut is not None:
+                self.coalesced += 1
+                return fut, False
+            fut = self._calls[key] = concurrent.futures.Future()
+            return fut, True
+
+    def _settle(self, key, fut, result=None, error=None):
+        with self._lock: self._calls.pop(key, None)
+        if error is not None: fut.set_exception(error)
+        else: fut.set_result(result)
+
+    def do(self, key, fn):
+        fut, leader = self._join(key)
+        if not leader: return _waiter_result(fut)
+        try: result = fn()
+        except BaseException as e:
+            self._settle(key, fut, error=e)
+            raise
+        self._settle(key, fut, result)
+        return result
+
+    async def do_async(self, key, coro_fn):
+        fut, leader = self._join(key)
+        if not leader:
+            await asyncio.wait([asyncio.wrap_future(fut)])
+            return _waiter_result(fut)
+        try: result = await coro_fn()
+        except BaseException as e:
+            self._settle(key, fut, error=e)
+            raise
+        self._settle(key, fut, result)
+        return result
+
+class CoalescedError(Exception):
+    """Raised to single-flight waiters when the leader's call failed; the waiter itself sent nothing."""
+
+def _waiter_result(fut):
+    """A waiter's view of the leader's outcome, flagged so proxy scoring skips it."""
+    try: result = fut.result()
+    except Exception as e: raise CoalescedError(f"{type(e).__name__}: {e}") from e
+    if isinstance(result, HttpResult):
+        result = copy.copy(result)
+        result.coalesced = True
+    return result
+
+inflight = SingleFlight()
+
+def cache_begin(key, source, headers=None):
+    """Return (fresh_hit, entry, headers); headers carry validators when a stale entry exists."""
+    cache = get_response_cache()
+    entry = cache.lookup(key) if cache else None
+    headers = dict(headers or {})
+    if entry:
+        cached, fetched_at, etag, last_mod = entry
+        if time.time() - fetched_at < HTTP_CACHE_TTL.get(source, 3600): return cached, entry, headers
+        if etag: headers["If-None-Match"] = etag
+        if last_mod: headers["If-Modified-Since"] = last_mod
+    return None, entry, headers
+
+def cache_finish(key, source, entry, result, proxy=None, url=None):
+    """Report to the rate limiter, resolve 304s against the stale entry and store cacheable results.
+
+    The limiter is keyed by the requested `url`: a blocked fetch ends on a
+    redirect host (idp.nature.com) that no request ever draws tokens from.
+    """
+    rate_limiter.feedback(url or result.url, result.status_code, result.headers, blocked=is_blocked_url(result.url) or result.status_code == 403, proxy=proxy)
+    cache = get_response_cache()
+    if result.status_code == 304 and entry:
+        cache.touch(key)
+        return entry[0]
+    if cache and result.status_code == 200 and not is_blocked_url(result.url):
+        cache.store(key, source, result)
+    return result
+
+def cached_request(url, source, params=None, session=None, method="GET", json_body=None, vary=None, headers=None, **kwargs):
+    """Fetch through the shared response cache.
+
+    Fresh entries are served without touching the network; stale entries are
+    revalidated with If-None-Match / If-Modified-Since. Only requests that really
+    go upstream wait on (and report back to) the per-host rate limiter.
+    """
+    key = normalize_cache_key(url, params, method, json_body, vary)
+    hit, entry, headers = cache_begin(key, source, headers)
+    if hit: return hit
+    proxy = (kwargs.get("proxies") or getattr(session, "proxies", None) or {}).get("https")
+    def upstream():
+        rate_limiter.acquire(url, proxy)
+        resp = (session or requests).request(method, url, params=params, json=json_body, headers=headers, **kwargs)
+        return cache_finish(key, source, entry, HttpResult.from_response(resp), proxy, url)
+    # 相同请求正在进行时共享其结果, 不再重复请求上游
+    return inflight.do(key, upstream)
+
+# ================= 辅助功能 =================
+def parse_nature_abstract(html):
+    soup = BeautifulSoup(html, 'html.parser')
+    abs_div = soup.find("div", id="Abs1-content")
+    if abs_div: return abs_div.get_text(strip=True)
+    sections = soup.find_all("div", class_="c-article-section__content")
+    for sec in sections:
+        t = sec.get_text(strip=True)
+        if len(t) > 200: return t
+    meta = soup.find("meta", attrs={"name": "description"})
+    if meta: return meta.get("content", "").strip()
+    return None
+
+# ================= Nature Worker =================
+# 单 host 并发上限 / 全局连接池大小 (异步引擎)
+NATURE_HOST_CONCURRENCY = 16
+NATURE_POOL_SIZE = 256
+
+def parse_nature_search_page(html, q_str, j_name, start_y, end_y, since=None):
+    """Parse a Nature search result page.
+
+    Returns (in-window papers newer than the `since` watch mark, number of
+    article cards, oldest year on page, oldest ISO date on page).
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+    arts = soup.find_all("li", class_="app-article-list-row__item") or soup.find_all("article", class_="u-full-height")
+    is_new = since_filter(since)
+    prelim_papers = []
+    page_years = []
+    page_dates = []
+    for art in arts:
+        try:
+            title_tag = art.find("a", class_="c-card__link")
+            if not title_tag: continue
+            title = title_tag.get_text().strip()
+            link = "https://www.nature.com" + title_tag['href'] if title_tag['href'].startswith("/") else title_tag['href']
+            date_tag = art.find("time")
+            py = 0
+            p_date = ""
+            if date_tag:
+                p_date = date_tag.get_text().strip()
+                if len(p_date) >= 4: py = int(p_date[-4:])
+            if py: page_years.append(py)
+            if parse_pub_date(p_date): page_dates.append(parse_pub_date(p_date))
+            abs_txt = "暂无摘要"
+            sum_div = art.find("div", class_="c-card__summary")
+            if sum_div: abs_txt = sum_div.get_text().strip()
+
+            if start_y <= py <= end_y:
+                doi = nature_doi(link)
+                paper = {
+                    "PaperID": make_paper_id(doi=doi, title=title, year=py, journal=j_name, url=link), "DOI": doi, "Year": py, "DisplayDate": p_date, "Journal": JOURNAL_DISPLAY_ABBR.get(j_name, j_name),
+                    "FullJournal": j_name, "Title": title, "Citations": "N/A", "URL": link,
+                    "Abstract": abs_txt, "MatchKeyword": q_str, "Source": "Nature Official"
+                }
+                if is_new(paper): prelim_papers.append(paper)
+        except: continue
+    return prelim_papers, len(arts), min(page_years) if page_years else None, min(page_dates) if page_dates else None
+
+class NatureScrapeEngine:
+    """Asyncio scraping engine for Nature search pages and article enrichment.
+
+    A single event loop runs in a daemon thread (started on first use); search pages and article
+    fetches are tasks on it, with one keep-alive connection pool per proxy and
+    a per-host concurrency cap. `submit()` returns a concurrent.futures.Future
+    so the caller can mix it with thread-pool futures in `as_completed`.
+    Without aiohttp the same tasks fall back to pooled `requests` sessions on
+    a small executor.
+    """
+    def __init__(self, host_concurrency=NATURE_HOST_CONCURRENCY, pool_size=NATURE_POOL_SIZE):
+        self.host_concurrency = host_concurrency
+        self.pool_size = pool_size
+        self._loop = None
+        self._loop_lock = threading.Lock()
+        self._sessions = {}
+        self._host_sems = {}
+        self._executor = None if aiohttp else concurrent.futures.ThreadPoolExecutor(max_workers=32)
+
+    @property
+    def loop(self):
+        # 首次使用时才启动事件循环线程: 导入模块 (如命令行 --help / --list) 不产生后台线程
+        if self._loop is None:
+            with self._loop_lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    threading.Thread(target=loop.run_forever, daemon=True, name="nature-engine").start()
+                    self._loop = loop
+        return self._loop
+
+    def submit(self, task_args):
+        return asyncio.run_coroutine_threadsafe(self.scrape_task(task_args), self.loop)
+
+    def _host_sem(self, url):
+        host = urllib.parse.urlsplit(url).netloc.lower()
+        if host not in self._host_sems: self._host_sems[host] = asyncio.Semaphore(self.host_concurrency)
+        return self._host_sems[host]
+
+    def _session(self, proxy):
+        if proxy not in self._sessions:
+            if aiohttp:
+                connector = aiohttp.TCPConnector(limit=self.pool_size, limit_per_host=self.host_concurrency, ttl_dns_cache=300)
+                self._sessions[proxy] = aiohttp.ClientSession(connector=connector, trust_env=False)
+            else:
+                sess = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=self.host_concurrency)
+                sess.mount("https://", adapter)
+                sess.mount("http://", adapter)
+                if proxy: sess.proxies = {"http": proxy, "https": proxy}
+                self._sessions[proxy] = sess
+        return self._sessions[proxy]
+
+    async def fetch(self, url, source, params=None, headers=None, proxy=None, vary=None, timeout=15):
+        """Cached, rate-limited GET on the pooled session for `proxy`; returns an HttpResult."""
+        session = self._session(proxy)
+        if not aiohttp:
+            async with self._host_sem(url):
+                return await self.loop.run_in_executor(self._executor, lambda: cached_request(
+                    url, source, params=params, session=session, vary=vary, headers=headers, timeout=timeout))
+        key = normalize_cache_key(url, params, vary=vary)
+        hit, entry, headers = cache_begin(key, source, headers)
+        if hit: return hit
+
+        async def upstream():
+            async with self._host_sem(url):
+                wait = rate_limiter.bucket(url, proxy).reserve()
+                if wait > 0: await asyncio.sleep(wait)
+                async with session.get(url, params=params, headers=headers, proxy=proxy, timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
+                    body = await resp.read()
+                    result = HttpResult(resp.status, str(resp.url), dict(resp.headers), body, resp.charset)
+                return cache_finish(key, source, entry, result, proxy, url)
+        # 与其他会话/任务中相同的请求合并为一次上游调用
+        return await inflight.do_async(key, upstream)
+
+    async def fetch_pooled(self, url, source, proxies, **kwargs):
+        """fetch() through the healthiest of `proxies` (direct when empty), scoring the proxy with the outcome."""
+        if not proxies: return await self.fetch(url, source, **kwargs)
+        return await proxy_pool.acall(proxies, lambda proxy: self.fetch(url, source, proxy=proxy, **kwargs))
+
+    async def fetch_clash(self, clash, url, source, proxies, **kwargs):
+        """fetch_pooled() under a Clash node lease; returns (HttpResult, node). Blocks / errors report back to the scheduler."""
+        if clash is None: return await self.fetch_pooled(url, source, proxies, **kwargs), None
+        generation, node = await self.loop.run_in_executor(None, clash.lease)
+        failed = True
+        try:
+            resp = await self.fetch_pooled(url, source, proxies, **kwargs)
+            failed = is_blocked_url(resp.url) or resp.status_code in (403, 429)
+            return resp, node
+        finally:
+            clash.release(generation, failed)
+
+    async def fetch_abstract(self, url, headers, proxies, clash=None):
+        """Full abstract from a Nature article page; None if the fetch or parse fails."""
+        try:
+            r, _ = await self.fetch_clash(clash, url, "nature_article", proxies, headers=headers, vary=headers.get("Cookie"))
+            return parse_nature_abstract(r.text) if r.status_code == 200 else None
+        except Exception: return None
+
+    async def enrich_article(self, item, headers, proxies, enable_full_abstract, filter_kws_structured, strict_filter, clash=None):
+        """Cheapest-first enrichment plan for one search card; returns (item or None, logs, fetched article page).
+
+        The strict filter is checked on title + card summary first. The article
+        page is only fetched when that cannot decide (the summary misses a term)
+        or when enable_full_abstract is True (eager). With "lazy", cards that
+        already pass keep the summary, marked AbstractPending, and the full
+        abstract is fetched when the row is viewed (see enrich_on_view).
+        """
+        logs = []
+        kf = compile_filter(filter_kws_structured) if strict_filter else None
+        summary = item['Abstract']
+        decided = not kf or kf.match(item['Title'], summary)
+        if not enable_full_abstract or (decided and enable_full_abstract == "lazy"):
+            if not decided:
+                logs.append("Skipped")
+                return None, logs, False
+            if enable_full_abstract: item['AbstractPending'] = True
+            return item, logs, False
+
+        full = await self.fetch_abstract(item['URL'], headers, proxies, clash)
+        if full:
+            item['Abstract'] = full
+            logs.append("Full Abs Fetched")
+        # 摘要预览也是文章内容的一部分: 标题 + 预览 + 全文任一命中即可
+        if not decided and not kf.match(item['Title'], f"{summary} {full or ''}"):
+            logs.append("Skipped")
+            return None, logs, True
+        return item, logs, True
+
+    async def _fetch_abstracts(self, urls, proxies, headers):
+        fulls = await asyncio.gather(*[self.fetch_abstract(u, headers, proxies) for u in urls])
+        return dict(zip(urls, fulls))
+
+    def fetch_abstracts(self, urls, proxies=None, cookie=""):
+        """Blocking: fetch several full abstracts concurrently on the engine loop; {url: abstract or None}."""
+        return asyncio.run_coroutine_threadsafe(self._fetch_abstracts(list(urls), proxies or [], get_browser_headers(cookie)), self.loop).result()
+
+    async def scrape_task(self, task_args):
+        q_str, j_name, j_code, start_y, end_y, use_proxy, proxies_list, cookie, clash_cfg, en_full_abs, filter_kws_struct, max_pages, strict_filter, *opt = task_args
+        since = opt[0] if opt else None
+        papers = []
+        logs = []
+        base_url = "https://www.nature.com/search"
+        max_retries = 3 if use_proxy else 1
+        proxies = proxies_list if use_proxy else []
+        clash = clash_scheduler_for(clash_cfg)
+        last_node = None
+
+        # 增量模式下一直翻到上次的高水位为止, 而不是固定页数
+        if since: max_pages = max(max_pages, WATCH_MAX_PAGES)
+        reached_start = False
+        failed_pages = []
+        for page_num in range(1, max_pages + 1):
+            if reached_start: break
+            params = {"q": q_str, "journal": j_code, "order": "date_desc", "page": page_num}
+            page_success = False
+            for attempt in range(max_retries):
+                headers = get_browser_headers(cookie)
+                log_prefix = f"[{datetime.now().strftime('%H:%M:%S')}] {j_name} P{page_num} (Try {attempt+1})"
+
+                try:
+                    # 每次尝试重新选代理: 被拦截的代理分数下降 / 熔断, 重试自动换到其他代理;
+                    # Clash 节点只在当前节点被拦截时由调度器统一切换
+                    resp, node = await self.fetch_clash(clash, base_url, "nature_search", proxies, params=params, headers=headers, vary=cookie)
+                    if node and node != last_node:
+                        if last_node: logs.append(f"{log_prefix} | Node: {node}")
+                        last_node = node
+                    if is_blocked_url(resp.url):
+                        logs.append("  -> ⚠️ Blocked")
+                        if attempt < max_retries-1: continue
+                        break
+
+                    if resp.status_code == 200:
+                        prelim_papers, n_items, oldest_y, oldest_d = parse_nature_search_page(resp.text, q_str, j_name, start_y, end_y, since)
+                        if not n_items:
+                            logs.append("  -> No items.")
+                            page_success = True
+                            break
+                        window = f"new since {since['from']}" if since else f"in {start_y}-{end_y}"
+                        logs.append(f"  -> Found {n_items} items ({len(prelim_papers)} {window})")
+                        # 结果按日期降序：本页已出现早于起始年份 (或高水位) 的文章，后续页面只会更旧
+                        if oldest_y and oldest_y < start_y:
+                            reached_start = True
+                            if page_num < max_pages: logs.append(f"  -> Reached {oldest_y} < {start_y}, skipped {max_pages - page_num} pages")
+                        elif since and oldest_d and oldest_d < since["from"]:
+                            reached_start = True
+                            logs.append(f"  -> Reached watch mark {since['from']}")
+                        elif since and page_num == max_pages:
+                            logs.append(f"  -> ⚠️ {max_pages} 页内未到达上次高水位 {since['from']}")
+
+                        # 文章详情作为同一事件循环上的任务并发处理
+                        enriched = await asyncio.gather(
+                            *[self.enrich_article(p, headers, proxies, en_full_abs, filter_kws_struct, strict_filter, clash) for p in prelim_papers],
+                            return_exceptions=True
+                        )
+                        n_fetched = n_deferred = 0
+                        for res in enriched:
+                            if isinstance(res, Exception): continue
+                            p_res, p_logs, fetched = res
+                            n_fetched += fetched
+                            if p_res:
+                                papers.append(p_res)
+                                n_deferred += bool(p_res.get('AbstractPending'))
+                            if p_logs: logs.extend([f"    {l}" for l in p_logs])
+                        if en_full_abs and prelim_papers:
+                            logs.append(f"  -> Article pages: {n_fetched} fetched, {len(prelim_papers) - n_fetched} saved ({n_deferred} deferred to view)")
+
+                        page_success = True
+                        break
+                    if attempt < max_retries-1: continue
+                except Exception as e:
+                    logs.append(f"  -> Err: {str(e)}")
+                    if attempt < max_retries-1: continue
+            if not page_success:
+                logs.append("  -> Page failed.")
+                failed_pages.append(page_num)
+
+        return papers, (f"Pages failed: {failed_pages}" if failed_pages else None), logs
+
+nature_engine = NatureScrapeEngine()
+
+def scrape_nature_worker(task_args):
+    """Blocking wrapper around the async engine (same return schema as before)."""
+    return nature_engine.submit(task_args).result()
+
+# ================= API Worker =================
+S2_SEARCH_URL = "https://api.semanticscholar.org/graph/v1/paper/search"
+# relevance 检索最多可翻到 offset + limit = 1000
+S2_SEARCH_MAX_RESULTS = 1000
+# 单个 (query, venue chunk) 最多拆出的切片任务数
+S2_PLAN_MAX_SLICES = 40
+S2_SEARCH_FIELDS = "paperId,externalIds,title,url,venue,year,abstract,citationCount,openAccessPdf,publicationDate"
+# 两阶段检索的第一阶段: 不含 abstract, 响应体通常只有完整字段的几分之一
+S2_LIGHT_FIELDS = "paperId,externalIds,title,url,venue,year,citationCount,openAccessPdf,publicationDate"
+S2_ABSTRACT_FIELDS = "paperId,abstract"
+
+def s2_filter_two_phase(papers, kf, proxies):
+    """Second phase of a light-field search: decide `kf` on titles, batch-fetch abstracts only for the undecided.
+
+    Papers whose title already passes (all of them without a filter) are kept
+    without an abstract, marked AbstractPending and filled by enrich_on_view;
+    the rest are resolved with one cached /paper/batch call per 500 and
+    filtered on title + abstract. A failed batch call raises instead of
+    silently treating the abstracts as empty. Returns (papers, logs).
+    """
+    if not kf: return papers, []
+    undecided = [p for p in papers if not kf.match(p.get("title"), None)]
+    if not undecided: return papers, []
+    found, n_req = s2_batch_fetch([p.get("paperId") for p in undecided], proxies, S2_ABSTRACT_FIELDS, raise_on_error=True)
+    for p in undecided: p["abstract"] = (found.get(p.get("paperId")) or {}).get("abstract")
+    kept = [p for p in papers if "abstract" not in p or kf.match(p.get("title"), p["abstract"])]
+    return kept, [f"  -> Abstracts: {len(undecided)}/{len(papers)} fetched for filtering ({n_req} batch requests), {len(papers) - len(kept)} skipped"]
+
+def search_api_worker(task_args):
+    """One S2 relevance-search page.
+
+    With abstracts=True the abstract comes with the search response; with
+    "lazy" the search asks for light fields only and abstracts are fetched
+    only for the rows the title cannot decide (s2_filter_two_phase).
+    """
+    q_str, start, end, limit, venues_chunk, proxies, filter_kws_struct, strict_filter, ignore_venue_filter, offset, abstracts, *opt = task_args
+    since = opt[0] if opt else None
+    url = S2_SEARCH_URL
+    two_phase = abstracts == "lazy"
+    
+    params = {
+        "query": q_str, **s2_date_params(start, end, since), "limit": limit, "offset": offset or None,
+        "fields": S2_LIGHT_FIELDS if two_phase else S2_SEARCH_FIELDS
+    }
+    if not ignore_venue_filter and venues_chunk:
+        params["venue"] = ",".join(venues_chunk)
+        
+    logs = []
+    max_retries = 4
+    for attempt in range(max_retries):
+        try:
+            r = proxy_pool.call(proxies, lambda p: cached_request(url, "s2", params=params, headers={"User-Agent": "ResearchTool/Pro"}, proxies=requests_proxies(p), timeout=20))
+            if r.status_code == 200:
+                filtered_data = r.json().get("data", [])
+                if since:
+                    # 日期过滤含回看窗口, 去掉上次已见过的论文
+                    is_new = since_filter(since)
+                    filtered_data = [p for p in filtered_data if is_new(normalize_api_result(p, q_str))]
+                kf = compile_filter(filter_kws_struct) if strict_filter else None
+                if two_phase:
+                    filtered_data, f_logs = s2_filter_two_phase(filtered_data, kf, proxies)
+                    logs.extend(f_logs)
+                else:
+                    filtered_data = [p for p in filtered_data if not kf or kf.match(p.get("title"), p.get("abstract"))]
+                return filtered_data, None, logs
+            elif r.status_code == 429:
+                # 限速器已根据 Retry-After 暂停该 host，下次 acquire 自动等待
+                logs.append(f"⚠️ API 429 (Retry {attempt+1})")
+                continue
+            else:
+                msg = f"Status {r.status_code}"
+                logs.append(msg)
+                return [], msg, logs
+        except Exception as e:
+            msg = str(e)
+            logs.append(msg)
+            if attempt < max_retries-1: 
+                time.sleep(2)
+                continue
+            return [], msg, logs
+    return [], "Max Retries", logs
+
+def normalize_api_result(p, query_kw):
+    """Map Semantic Scholar fields into the unified schema used by the UI."""
+    venue_raw = p.get("venue")
+    venue = str(venue_raw).strip() if venue_raw else "Unknown"
+    pub_date = p.get("publicationDate") or ""
+    display_date = pub_date.split("T")[0] if isinstance(pub_date, str) else ""
+    year_val = p.get("year") or 0
+    cite_val = p.get("citationCount")
+    cite_val = cite_val if cite_val is not None else "N/A"
+    
+    open_pdf = p.get("openAccessPdf")
+    pdf_url = open_pdf.get("url") if isinstance(open_pdf, dict) else None
+    url_val = pdf_url or p.get("url") or None
+    if (not url_val) and p.get("paperId"):
+        url_val = f"https://www.semanticscholar.org/p/{p['paperId']}"
+    url_val = str(url_val).strip() if url_val else None
+
+    abs_txt = p.get("abstract") or "暂无摘要"
+    title_txt = p.get("title") or "Untitled"
+    ext = p.get("externalIds") or {}
+    doi = ext.get("DOI")
+
+    row = {
+        "PaperID": make_paper_id(doi=doi, arxiv=ext.get("ArXiv"), s2_id=p.get("paperId"), title=p.get("title"), year=year_val, journal=venue, url=url_val),
+        "Year": year_val,
+        "DisplayDate": display_date,
+        "Journal": venue,
+        "FullJournal": venue,
+        "venue": venue,
+        "Title": title_txt,
+        "Citations": cite_val,
+        "URL": url_val,
+        "Abstract": abs_txt,
+        "MatchKeyword": query_kw,
+        "Source": "Semantic Scholar API",
+        # Extra raw fields for reference
+        "paperId": p.get("paperId"),
+        "DOI": doi,
+        "API_URL": p.get("url"),
+        "OpenAccessPdf": open_pdf,
+        "PublicationDate": pub_date
+    }
+    # 轻量检索未请求 abstract 字段: 摘要留到浏览 / 导出 / 翻译时批量获取
+    if "abstract" not in p: row["AbstractPending"] = True
+    return row
+
+# ================= 引用 / 元数据补全 =================
+S2_BATCH_URL = "https://api.semanticscholar.org/graph/v1/paper/batch"
+S2_MATCH_URL = "https://api.semanticscholar.org/graph/v1/paper/search/match"
+S2_BATCH_SIZE = 500
+S2_ENRICH_FIELDS = "paperId,externalIds,citationCount,abstract,openAccessPdf,url"
+S2_MATCH_FIELDS = S2_ENRICH_FIELDS + ",title,year"   # 标题匹配需核对标题与年份
+
+def nature_doi(url):
+    """Nature article URLs end in the DOI suffix: /articles/s41467-024-1 -> 10.1038/s41467-024-1."""
+    m = re.search(r"nature\.com/articles/([^/?#]+)", str(url or ""))
+    return f"10.1038/{m.group(1)}" if m else None
+
+def s2_lookup_id(row):
+    """Batch-endpoint id for a result row: S2 paperId, else DOI, else None (title match needed)."""
+    if row.get('paperId'): return row['paperId']
+    pid = str(row.get('PaperID') or '')
+    if pid.startswith("arxiv:"): return "ARXIV:" + pid[6:]
+    doi = row.get('DOI') or nature_doi(row.get('URL'))
+    return f"DOI:{doi}" if doi else None
+
+def s2_request_with_retry(url, proxies, max_retries=3, **kwargs):
+    """S2 call through cache + limiter on the healthiest of `proxies` (a list of proxy URLs); 429s are retried once the limiter lets us."""
+    r = None
+    for _ in range(max_retries):
+        r = proxy_pool.call(proxies, lambda p: cached_request(url, "s2", headers={"User-Agent": "ResearchTool/Pro"}, proxies=requests_proxies(p), timeout=30, **kwargs))
+        if r.status_code != 429: break
+    return r
+
+def s2_batch_fetch(ids, proxies=None, fields=S2_ENRICH_FIELDS, raise_on_error=False):
+    """Resolve ids via POST /paper/batch in chunks of 500; return ({id: paper}, request_count).
+
+    Failed chunks are skipped, or raise RuntimeError with raise_on_error
+    (callers that must not mistake a failure for "no abstract").
+    """
+    found, n_req = {}, 0
+    ids = list(dict.fromkeys(i for i in ids if i))
+    for i in range(0, len(ids), S2_BATCH_SIZE):
+        chunk = ids[i:i + S2_BATCH_SIZE]
+        r = s2_request_with_retry(S2_BATCH_URL, proxies, method="POST", params={"fields": fields}, json_body={"ids": chunk})
+        n_req += 1
+        if r is None or r.status_code != 200:
+            if raise_on_error: raise RuntimeError(f"S2 batch failed: HTTP {getattr(r, 'status_code', None)}")
+            continue
+        for pid, paper in zip(chunk, r.json()):
+            if paper: found[pid] = paper
+    return found, n_req
+
+def s2_match_title(title, year=None, proxies=None, fields=S2_MATCH_FIELDS):
+    """Best title match via /paper/search/match (one cached request per title).
+
+    The hit is only accepted when its normalized title equals ours and, if we
+    know the year, its year is within ±1; otherwise a near-miss would attach
+    another paper's citations / abstract.
+    """
+    r = s2_request_with_retry(S2_MATCH_URL, proxies, params={"query": title, "fields": fields})
+    if r is None or r.status_code != 200: return None
+    data = r.json().get("data") or []
+    if not data or normalize_title(data[0].get("title")) != normalize_title(title): return None
+    try: year = int(float(year))
+    except (TypeError, ValueError): year = 0
+    if year > 0 and not (data[0].get("year") and abs(int(data[0]["year"]) - year) <= 1): return None
+    return data[0]
+
+def enrich_citations_s2(records, proxies=None):
+    """Fill Citations (and missing abstract / paperId / OA PDF) in place for rows without a numeric count."""
+    todo = [p for p in records if str(p.get('Citations', 'N/A')) in ["N/A", "", "None", "nan"]]
+    if not todo: return []
+    by_id, no_id = {}, []
+    for p in todo:
+        sid = s2_lookup_id(p)
+        if sid: by_id.setdefault(sid, []).append(p)
+        else: no_id.append(p)
+    found, n_req = s2_batch_fetch(by_id.keys(), proxies)
+    resolved = [(paper, rows) for sid, rows in by_id.items() if (paper := found.get(sid))]
+    unresolved = [p for sid, rows in by_id.items() if sid not in found for p in rows] + no_id
+    for p in unresolved:
+        paper = s2_match_title(p['Title'], p.get('Year'), proxies)
+        n_req += 1
+        if paper: resolved.append((paper, [p]))
+    n_filled = 0
+    for paper, rows in resolved:
+        for p in rows:
+            if paper.get("citationCount") is not None:
+                p['Citations'] = paper["citationCount"]
+                n_filled += 1
+            p['paperId'] = p.get('paperId') or paper.get("paperId")
+            if paper.get("abstract") and p.get('Abstract') in [None, "", "暂无摘要"]: p['Abstract'] = paper["abstract"]
+            if paper.get("openAccessPdf") and not p.get('OpenAccessPdf'): p['OpenAccessPdf'] = paper["openAccessPdf"]
+    return [f"S2 引用补全: {n_filled}/{len(todo)} 篇, {n_req} 次请求"]
+
+def enrich_on_view(rows, proxies=None, cookie="", citations=False):
+    """Deferred enrichment for the rows a user is looking at (or keeping).
+
+    Fetches abstracts for rows marked AbstractPending (Nature article pages,
+    or one cached /paper/batch call for light-field S2 rows) and, with
+    `citations`, S2 citation counts for rows without one. Returns {PaperID: {field: value}} with an entry for every row
+    attempted, so callers can overlay it and skip these rows next time.
+    """
+    # 行可能来自 DataFrame: 去掉 NaN, 以免被当作 paperId / URL
+    rows = [{k: v for k, v in r.items() if not (isinstance(v, float) and v != v)} for r in rows]
+    out = {r['PaperID']: {} for r in rows}
+    pending = [r for r in rows if r.get('AbstractPending') is True]
+    s2_pending = [r for r in pending if r.get('Source') == "Semantic Scholar API" and r.get('paperId')]
+    nat_pending = [r for r in pending if r.get('Source') != "Semantic Scholar API" and r.get('URL')]
+    if s2_pending:
+        try:
+            found, _ = s2_batch_fetch([r['paperId'] for r in s2_pending], proxies, S2_ABSTRACT_FIELDS, raise_on_error=True)
+        except Exception:
+            # 批量请求失败: 这些行保持待补全, 下次浏览时重试
+            for r in s2_pending: out.pop(r['PaperID'], None)
+            s2_pending = []
+        for r in s2_pending:
+            abs_txt = (found.get(r['paperId']) or {}).get("abstract")
+            if abs_txt: r['Abstract'] = out[r['PaperID']]['Abstract'] = abs_txt
+            out[r['PaperID']]['AbstractPending'] = False
+    if nat_pending:
+        fulls = nature_engine.fetch_abstracts({r['URL'] for r in nat_pending}, proxies, cookie)
+        for r in nat_pending:
+            if fulls.get(r['URL']):
+                r['Abstract'] = out[r['PaperID']]['Abstract'] = fulls[r['URL']]
+            out[r['PaperID']]['AbstractPending'] = False
+    if citations:
+        before = {r['PaperID']: r.get('Abstract') for r in rows}
+        enrich_citations_s2(rows, proxies)
+        for r in rows:
+            if r['PaperID'] not in out: continue
+            if str(r.get('Citations', 'N/A')) not in ["N/A", "", "None", "nan"]: out[r['PaperID']]['Citations'] = r['Citations']
+            if r.get('Abstract') != before[r['PaperID']]: out[r['PaperID']]['Abstract'] = r['Abstract']
+    return out
+
+# ================= 查询规划 =================
+def s2_probe_total(q_str, start, end, venues_chunk, proxies, ignore_venue_filter, since=None):
+    """Cheap limit=1 search to read `total` for a year window; None if the probe fails."""
+    params = {"query": q_str, **s2_date_params(start, end, since), "limit": 1, "fields": "paperId"}
+    if not ignore_venue_filter and venues_chunk: params["venue"] = ",".join(venues_chunk)
+    try:
+        r = s2_request_with_retry(S2_SEARCH_URL, proxies, params=params)
+        return int(r.json().get("total", 0)) if r.status_code == 200 else None
+    except Exception:
+        return None
+
+def plan_api_slices(task_args):
+    """Expand one API task into (year slice, offset) tasks that together cover every hit.
+
+    Windows with more hits than relevance search can page through are split
+    in half by year until they fit; each window is then paged by offset.
+    Returns (tasks, logs); a failed probe keeps the original single task.
+    """
+    q_str, start, end, limit, venues_chunk, proxies, filter_kws_struct, strict_filter, ignore_venue_filter, _, abstracts, *opt = task_args
+    since = opt[0] if opt else None
+    logs = []
+    # 增量模式只规划高水位之后的年份
+    windows = [(max(start, int(since["from"][:4])) if since else start, end)]
+    tasks = []
+    while windows:
+        y0, y1 = windows.pop()
+        total = s2_probe_total(q_str, y0, y1, venues_chunk, proxies, ignore_venue_filter, since)
+        if total is None:
+            tasks.append((q_str, y0, y1, limit, venues_chunk, proxies, filter_kws_struct, strict_filter, ignore_venue_filter, 0, abstracts, since))
+            continue
+        if total > S2_SEARCH_MAX_RESULTS and y0 < y1:
+            mid = (y0 + y1) // 2
+            windows += [(y0, mid), (mid + 1, y1)]
+            continue
+        if total > S2_SEARCH_MAX_RESULTS:
+            logs.append(f"⚠️ {q_str} {y0}: {total} 篇，超出单年可翻页上限 {S2_SEARCH_MAX_RESULTS}")
+        for off in range(0, min(total, S2_SEARCH_MAX_RESULTS), limit):
+            tasks.append((q_str, y0, y1, min(limit, S2_SEARCH_MAX_RESULTS - off), venues_chunk, proxies, filter_kws_struct, strict_filter, ignore_venue_filter, off, abstracts, since))
+    if len(tasks) > S2_PLAN_MAX_SLICES:
+        logs.append(f"⚠️ {q_str}: {len(tasks)} 个切片，仅执行前 {S2_PLAN_MAX_SLICES} 个")
+        tasks = tasks[:S2_PLAN_MAX_SLICES]
+    return tasks, logs
+
+# ================= 批量采集 (Bulk Search) =================
+S2_BULK_URL = "https://api.semanticscholar.org/graph/v1/paper/search/bulk"
+S2_BULK_FIELDS = S2_SEARCH_FIELDS
+
+# normalize_api_result 的列: 每页固定列顺序与类型, 某页整列为空时 parquet 分片也不会推断出 null 类型
+HARVEST_DTYPES = {
+    "PaperID": "string", "Year": "Int64", "DisplayDate": "string", "Journal": "string", "FullJournal": "string",
+    "venue": "string", "Title": "string", "Citations": "Int64", "URL": "string", "Abstract": "string",
+    "MatchKeyword": "string", "Source": "string", "paperId": "string", "DOI": "string", "API_URL": "string",
+    "OpenAccessPdf": "string", "PublicationDate": "string",
+}
+
+class HarvestWriter:
+    """Append normalized rows to .jsonl / .csv, or to part files of a .parquet dataset directory (fixed HARVEST_DTYPES schema)."""
+    def __init__(self, path, part_start=0):
+        self.path = path
+        self.kind = os.path.splitext(path)[1].lower().lstrip(".") or "jsonl"
+        self.part = part_start
+        if self.kind == "parquet": os.makedirs(path, exist_ok=True)
+        elif os.path.dirname(path): os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    @staticmethod
+    def _flat(row):
+        row = dict(row)
+        pdf = row.pop("OpenAccessPdf", None)
+        row["OpenAccessPdf"] = pdf.get("url") if isinstance(pdf, dict) else pdf
+        if row.get("Citations") == "N/A": row["Citations"] = None
+        return row
+
+    def write(self, rows):
+        if not rows: return
+        if self.kind == "jsonl":
+            with open(self.path, "a", encoding="utf-8") as f:
+                for r in rows: f.write(json.dumps(r, ensure_ascii=False) + "\n")
+            return
+        df = pd.DataFrame([self._flat(r) for r in rows]).reindex(columns=list(HARVEST_DTYPES))
+        df = df.astype({c: t for c, t in HARVEST_DTYPES.items() if t != "string"}).astype(object).astype(HARVEST_DTYPES)
+        if self.kind == "parquet":
+            self.part += 1
+            df.to_parquet(os.path.join(self.path, f"part-{self.part:05d}.parquet"), index=False)
+        else:
+            df.to_csv(self.path, mode="a", header=not os.path.exists(self.path), index=False, encoding="utf-8-sig")
+
+def harvest_bulk(query, out_path, start, end, venues=None, proxies=None, filter_kws_struct=None, max_rows=None, progress=None):
+    """Stream S2 bulk search into `out_path`, one page (≤1000 rows) at a time.
+
+    The continuation token is checkpointed to `<out_path>.ckpt.json` after each
+    page is written, so an interrupted harvest with the same parameters resumes
+    where it stopped (at-least-once: a crash between write and checkpoint can
+    repeat one page). Returns the final checkpoint dict.
+    """
+    params = {"query": query, "year": f"{start}-{end}", "fields": S2_BULK_FIELDS}
+    if venues: params["venue"] = ",".join(venues)
+    ckpt_path = out_path.rstrip("/\\") + ".ckpt.json"
+    ckpt = {"params": params, "token": None, "pages": 0, "rows": 0, "total": None, "done": False}
+    if os.path.exists(ckpt_path):
+        with open(ckpt_path, encoding="utf-8") as f: prev = json.load(f)
+        if prev.get("params") == params: ckpt = prev
+    if ckpt["done"]: return ckpt
+    writer = HarvestWriter(out_path, part_start=ckpt["pages"])
+    kf = compile_filter(filter_kws_struct)
+    while True:
+        page_params = dict(params, token=ckpt["token"]) if ckpt["token"] else params
+        r = s2_request_with_retry(S2_BULK_URL, proxies, max_retries=5, params=page_params)
+        if r is None or r.status_code != 200:
+            raise RuntimeError(f"bulk search failed: HTTP {getattr(r, 'status_code', None)}")
+        data = r.json()
+        rows = [normalize_api_result(p, query) for p in data.get("data") or [] if not kf or kf.match(p.get("title"), p.get("abstract"))]
+        writer.write(rows)
+        ckpt.update(token=data.get("token"), pages=ckpt["pages"] + 1, rows=ckpt["rows"] + len(rows), total=data.get("total"))
+        ckpt["done"] = not ckpt["token"] or bool(max_rows and ckpt["rows"] >= max_rows)
+        tmp = ckpt_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f: json.dump(ckpt, f)
+        os.replace(tmp, ckpt_path)
+        if progress: progress(ckpt)
+        if ckpt["done"]: return ckpt
+
+# ================= 增量检索 (高水位) =================
+WATCH_LOOKBACK_DAYS = 14   # 高水位前回看的天数, 覆盖 S2 收录延迟与同日多篇
+WATCH_MAX_PAGES = 10       # 增量模式下 Nature 最多翻到的页数 (通常第 1 页就到达高水位)
+
+def parse_pub_date(text):
+    """'03 May 2024' / '2024-05-03' -> '2024-05-03'; None for a bare year or unparseable text."""
+    text = str(text or "").strip().split("T")[0]
+    for fmt in ("%Y-%m-%d", "%d %B %Y", "%d %b %Y"):
+        try: return datetime.strptime(text, fmt).strftime("%Y-%m-%d")
+        except ValueError: continue
+    return None
+
+def row_pub_date(row):
+    """ISO publication date of a result row, or None when only the year is known."""
+    return parse_pub_date(row.get("PublicationDate")) or parse_pub_date(row.get("DisplayDate"))
+
+def since_filter(since):
+    """Predicate keeping rows newer than a watch mark {"from": ISO date, "ids": [...]} (everything when None)."""
+    if not since: return lambda row: True
+    seen, start = set(since["ids"]), since["from"]
+    def is_new(row):
+        if row.get("PaperID") in seen: return False
+        d = row_pub_date(row)
+        return d >= start if d else int(row.get("Year") or 0) >= int(start[:4])
+    return is_new
+
+def s2_date_params(start, end, since=None):
+    """S2 search date filter: the year window, narrowed to publication dates after the watch mark."""
+    if not since: return {"year": f"{start}-{end}"}
+    return {"publicationDateOrYear": f"{max(since['from'], f'{start}-01-01')}:{end}-12-31"}
+
+class WatchState:
+    """High-water marks of a saved search, stored next to its result file as <store>.watch.json.
+
+    For every (source, query, journal / venue chunk) the mark keeps the newest
+    publication date seen and the PaperIDs published within
+    WATCH_LOOKBACK_DAYS of it. `apply()` attaches a `since` filter to each
+    task so workers only return newer papers (Nature stops paging at the
+    mark, S2 narrows its date filter); `observe()` advances the marks in
+    memory and `save()` persists them once the delta has been stored.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.marks = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f: self.marks = json.load(f)
+
+    @staticmethod
+    def key(kind, task):
+        if kind == "nature": return json.dumps(["nature", task[0], task[1]], ensure_ascii=False)
+        return json.dumps(["s2", task[0], None if task[8] else task[4]], ensure_ascii=False)
+
+    def since(self, kind, task):
+        mark = self.marks.get(self.key(kind, task))
+        if not mark or not mark["date"]: return None
+        start = datetime.strptime(mark["date"], "%Y-%m-%d") - timedelta(days=WATCH_LOOKBACK_DAYS)
+        return {"from": start.strftime("%Y-%m-%d"), "ids": sorted(mark["ids"])}
+
+    def apply(self, kind, tasks):
+        """Append the `since` field to each task tuple (None for keys without a mark yet)."""
+        return [tuple(t) + (self.since(kind, t),) for t in tasks]
+
+    def observe(self, kind, task, rows):
+        if not rows: return
+        with self.lock:
+            mark = self.marks.setdefault(self.key(kind, task), {"date": "", "ids": {}})
+            for r in rows:
+                d = row_pub_date(r)
+                if d: mark["date"] = max(mark["date"], d)
+                elif r.get("Year"):
+                    # 只知年份的论文: 高水位只推进到年初, ID 保留到整年落出回看窗口
+                    mark["date"] = max(mark["date"], f"{int(r['Year']):04d}-01-01")
+                    d = f"{int(r['Year']):04d}-12-31"
+                if d and r.get("PaperID"): mark["ids"][r["PaperID"]] = d
+            if not mark["date"]: return
+            cutoff = (datetime.strptime(mark["date"], "%Y-%m-%d") - timedelta(days=WATCH_LOOKBACK_DAYS)).strftime("%Y-%m-%d")
+            mark["ids"] = {pid: d for pid, d in mark["ids"].items() if d >= cutoff}
+
+    def save(self):
+        with self.lock: data = json.dumps(self.marks, ensure_ascii=False)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f: f.write(data)
+        os.replace(tmp, self.path)
+
+# ================= 任务准备函数 =================
+def build_queries(kw_text, advanced=True):
+    """Turn 'A/B; C/D' keywords into (Nature queries, S2 queries, filter groups).
+
+    Advanced (AND) mode: one Nature query ANDing the groups, the cross product
+    of the groups for S2, and the groups double as the local keyword filter.
+    Normal (OR) mode: one Nature query per group, one S2 query per term, no filter.
+    """
+    raw_kws = [k.strip() for k in kw_text.split(';') if k.strip()]
+    groups = [[t.strip() for t in k_grp.split('/') if t.strip()] for k_grp in raw_kws]
+    groups = [g for g in groups if g]
+    quoted = [[f'"{t}"' if " " in t else t for t in g] for g in groups]
+    if not groups: return [], [], None
+    if advanced:
+        nat_parts = ["(" + " OR ".join(g) + ")" if len(g) > 1 else g[0] for g in quoted]
+        # API 组合逻辑: (A|B) + (C|D) -> A C, A D, B C, B D
+        return [" ".join(nat_parts)], [" ".join(t) for t in itertools.product(*quoted)], groups
+    q_list_nat = ["(" + " OR ".join(g) + ")" if len(g) > 1 else g[0] for g in quoted]
+    return q_list_nat, [t for g in quoted for t in g], None
+
+def prepare_nature_tasks(query_list, selected_map, start, end, use_proxy, proxies_list, cookie, clash_cfg, en_full_abs, filter_kws_struct, max_pages, strict_filter):
+    tasks = []
+    if clash_cfg and clash_cfg['nodes']:
+        clash_cfg['nodes'] = [n for n in clash_cfg['nodes'] if 'DIRECT' not in n and 'REJECT' not in n]
+    for q in query_list:
+        if not q.strip(): continue
+        for j_name, j_code in selected_map.items():
+            tasks.append((q, j_name, j_code, start, end, use_proxy, proxies_list, cookie, clash_cfg, en_full_abs, filter_kws_struct, max_pages, strict_filter))
+    return tasks
+
+def prepare_api_tasks(query_list, start, end, limit, target_venues_list, use_proxy, proxies_list, filter_kws_struct, strict_filter, ignore_venue_filter, abstracts=True):
+    # 任务只携带候选代理列表, 每次请求由 proxy_pool 选择
+    proxies = list(proxies_list) if use_proxy and proxies_list else None
+    tasks = []
+    if ignore_venue_filter:
+        for q in query_list:
+            if not q.strip(): continue
+            tasks.append((q, start, end, limit, None, proxies, filter_kws_struct, strict_filter, True, 0, abstracts))
+    else:
+        # Chunk size = 5 to reduce API calls
+        chunk_size = 5
+        venue_chunks = [target_venues_list[i:i + chunk_size] for i in range(0, len(target_venues_list), chunk_size)]
+        for q in query_list:
+            if not q.strip(): continue
+            for chunk in venue_chunks:
+                tasks.append((q, start, end, limit, chunk, proxies, filter_kws_struct, strict_filter, False, 0, abstracts))
+    return tasks
+
+# ================= 检索调度 =================
+SOURCE_BUDGETS = {"nature": 6, "s2": 4}   # 每个来源同时运行的任务数
+ENRICH_BATCH_MIN = 100                     # 攒够多少条再提交一次 S2 批量补全
+
+class SearchScheduler:
+    """Runs Nature and Semantic Scholar tasks under separate concurrency budgets.
+
+    Each source keeps round-robin sub-queues (per journal / per query), so one
+    long multi-page journal cannot starve the others and every source starts
+    producing results immediately. Rows lacking citations are fed to a shared
+    enrichment stage (S2 /paper/batch) that runs alongside the search instead
+    of after it. `run()` yields (kind, task, result) as work completes.
+    """
+    def __init__(self, budgets=None, enrich_proxies=None):
+        self.budgets = dict(SOURCE_BUDGETS, **(budgets or {}))
+        self.queues = {src: collections.OrderedDict() for src in self.budgets}
+        self.running = {src: 0 for src in self.budgets}
+        self.futures = {}
+        self.enrich_proxies = enrich_proxies
+        self._enrich_buf = []
+        self._enriched_ids = set()
+        self._s2_pool = concurrent.futures.ThreadPoolExecutor(max_workers=self.budgets["s2"])
+        self._enrich_pool = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+    def add(self, kind, task):
+        """Queue a 'nature', 'plan' (S2 slice planning) or 'api' task."""
+        src = "nature" if kind == "nature" else "s2"
+        key = task[1] if kind == "nature" else task[0]  # 期刊 / 查询词
+        self.queues[src].setdefault(key, collections.deque()).append((kind, task))
+
+    def enrich(self, rows):
+        """Hand rows to the enrichment stage; rows already seen (by PaperID) are skipped."""
+        for p in rows:
+            pid = p.get('PaperID')
+            if pid in self._enriched_ids: continue
+            if pid: self._enriched_ids.add(pid)
+            self._enrich_buf.append(p)
+        if len(self._enrich_buf) >= ENRICH_BATCH_MIN: self._flush_enrich()
+
+    def skip_enrich(self, paper_ids):
+        """Mark ids that already carry a citation count (e.g. from the S2 search) so their twins are not re-fetched."""
+        self._enriched_ids.update(pid for pid in paper_ids if pid)
+        self._enrich_buf = [p for p in self._enrich_buf if p.get('PaperID') not in paper_ids]
+
+    def _flush_enrich(self):
+        batch, self._enrich_buf = self._enrich_buf, []
+        if batch: self.futures[self._enrich_pool.submit(enrich_citations_s2, batch, self.enrich_proxies)] = ("enrich", None)
+
+    def _start(self, kind, task):
+        if kind == "nature": fut = nature_engine.submit(task)
+        elif kind == "plan": fut = self._s2_pool.submit(plan_api_slices, task)
+        else: fut = self._s2_pool.submit(search_api_worker, task)
+        self.futures[fut] = (kind, task)
+
+    def _pump(self):
+        for src, queue in self.queues.items():
+            while self.running[src] < self.budgets[src] and queue:
+                key, dq = next(iter(queue.items()))
+                kind, task = dq.popleft()
+                # 轮转: 该子队列移到末尾, 空则删除
+                if dq: queue.move_to_end(key)
+                else: del queue[key]
+                self._start(kind, task)
+                self.running[src] += 1
+
+    def _searching(self):
+        return any(self.queues.values()) or any(k != "enrich" for k, _ in self.futures.values())
+
+    def run(self):
+        self._pump()
+        while self.futures:
+            done, _ = concurrent.futures.wait(list(self.futures), return_when=concurrent.futures.FIRST_COMPLETED)
+            for fut in done:
+                kind, task = self.futures.pop(fut)
+                if kind != "enrich": self.running["nature" if kind == "nature" else "s2"] -= 1
+                try: result = fut.result()
+                except Exception as e: result = e
+                if kind == "plan" and not isinstance(result, Exception):
+                    for t in result[0]: self.add("api", t)
+                yield kind, task, result
+            self._pump()
+            # 检索全部结束后冲刷剩余的补全批次
+            if not self._searching(): self._flush_enrich()
+
+    def cancel(self):
+        """Drop queued tasks; tasks already running finish and are still yielded."""
+        for queue in self.queues.values(): queue.clear()
+        self._enrich_buf = []
+
+    def close(self):
+        self._s2_pool.shutdown(wait=False, cancel_futures=True)
+        self._enrich_pool.shutdown(wait=False, cancel_futures=True)
+
+# ================= 后台检索任务 =================
+JOBS_DIR = os.path.join(CACHE_DIR, "jobs")
+JOB_MAX_RUNNING = 1        # 每个会话 (owner) 同时运行的检索任务数, 其余排队
+JOB_LIST_LIMIT = 20
+JOB_SNAPSHOT_DEDUP_EVERY = 10   # 运行中的任务最多每隔多少秒重做一次跨来源去重, 期间新结果直接追加
+JOB_HEARTBEAT = 15   # 未结束的任务每隔多少秒刷新 job.json, 其他进程 (网页端 / 命令行) 据此判断任务是否仍在运行
+# partial: 运行结束但有任务失败 (未写检查点, 「继续」时重试)
+JOB_FINAL_STATES = ("done", "partial", "cancelled", "failed", "interrupted")
+
+def strip_task_credentials(nature_tasks):
+    """Nature tasks as persisted in job.json: no cookie and no Clash controller secret."""
+    return [t[:7] + ("", {k: v for k, v in t[8].items() if k != "secret"} if t[8] else t[8]) + t[9:] for t in nature_tasks]
+
+def restore_task_credentials(nature_tasks, cookie="", clash_secret=""):
+    """Put the cookie / Clash secret of the resuming session back into persisted Nature tasks."""
+    return [t[:7] + (cookie or "", dict(t[8], secret=clash_secret or "") if t[8] else t[8]) + t[9:] for t in nature_tasks]
+
+def job_owner_alive(meta):
+    """Whether an unfinished job on disk is still owned by a live process: fresh heartbeat and, on this host, a running pid."""
+    if time.time() - meta.get("heartbeat", 0) > 3 * JOB_HEARTBEAT: return False
+    # os.kill(pid, 0) 只在 POSIX 上是存活检查 (Windows 上会结束进程)
+    if os.name == "posix" and meta.get("host") == socket.gethostname():
+        try: os.kill(meta["pid"], 0)
+        except ProcessLookupError: return False
+        except (OSError, KeyError, TypeError): pass
+    return True
+
+def search_task_key(kind, task):
+    """Checkpoint key of a task: the fields that define its output (query, journal/venues, years, page/offset), not proxies or cookies."""
+    if kind == "nature":
+        q_str, j_name, j_code, start_y, end_y = task[:5]
+        ident = [kind, q_str, j_name, j_code, start_y, end_y, task[11]]
+    else:
+        q_str, start, end, limit, venues_chunk = task[:5]
+        ident = [kind, q_str, start, end, limit, venues_chunk, task[8], task[9] if kind == "api" else None]
+    return hashlib.sha1(json.dumps(ident, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+class SearchRun:
+    """One online search job executing on a background thread.
+
+    The worker loop only touches plain attributes under a lock, never
+    Streamlit, so any page (or a page reloaded later) can poll it:
+    `snapshot()` returns the rows gathered so far (exact PaperID duplicates are
+    dropped on arrival, near-duplicates merged per snapshot). Job parameters
+    live in <JOBS_DIR>/<id>/job.json and every finished task is appended to
+    tasks.jsonl, so an interrupted job resumes from its checkpoints. With a
+    WatchState attached, the rows of every finished task advance its marks.
+    """
+    def __init__(self, nature_tasks, api_tasks, full_api=True, enrich=False, enrich_proxies=None,
+                 filter_struct=None, label="", job_id=None, created=None, watch=None, owner=None):
+        self.job_id = job_id or datetime.now().strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6]
+        self.job_dir = os.path.join(JOBS_DIR, self.job_id)
+        self.created = created or time.time()
+        self.label = label
+        self.owner = owner   # 提交任务的会话, 运行上限与任务列表按会话区分
+        self.filter_struct = filter_struct
+        self.nature_tasks, self.api_tasks = nature_tasks, api_tasks
+        self.full_api, self.enrich, self.enrich_proxies = full_api, enrich, enrich_proxies
+        self.watch = watch
+        self.scheduler = None
+        self.lock = threading.Lock()
+        self.rows, self.logs = [], []
+        self.nat_total, self.nat_done = len(nature_tasks), 0
+        self.api_total, self.api_done = len(api_tasks), 0
+        self.n_failed = 0
+        self.nat_label = self.api_label = ""
+        self.version = 0
+        self.status = "queued"
+        self.enriching = False
+        self.on_finish = None
+        self._ids = set()
+        self._snap = (-1, 0, [], 0.0)   # (version, 已去重的行数, 去重结果, 时间)
+        self._cancelled = False
+        self.external = False   # 由另一个进程运行 (只读查看)
+        self._save_lock = threading.Lock()
+        self._heartbeat = None
+
+    @property
+    def done(self):
+        return self.status in JOB_FINAL_STATES
+
+    def meta(self):
+        return {
+            "job_id": self.job_id, "created": self.created, "label": self.label, "owner": self.owner, "status": self.status,
+            "filter_struct": self.filter_struct, "full_api": self.full_api, "enrich": self.enrich,
+            # Cookie 与 Clash secret 不落盘, 继续任务时由调用方重新提供
+            "enrich_proxies": self.enrich_proxies, "nature_tasks": strip_task_credentials(self.nature_tasks), "api_tasks": self.api_tasks,
+            "nat_done": self.nat_done, "nat_total": self.nat_total, "api_done": self.api_done, "api_total": self.api_total,
+            "n_rows": len(self.rows), "n_failed": self.n_failed, "watch": self.watch.path if self.watch else None,
+            "pid": os.getpid(), "host": socket.gethostname(), "heartbeat": time.time(),
+        }
+
+    def save(self):
+        if self.external: return
+        with self.lock: meta = self.meta()
+        with self._save_lock:
+            os.makedirs(self.job_dir, exist_ok=True)
+            tmp = os.path.join(self.job_dir, "job.json.tmp")
+            with open(tmp, "w", encoding="utf-8") as f: json.dump(meta, f, ensure_ascii=False)
+            os.replace(tmp, os.path.join(self.job_dir, "job.json"))
+            if not self.done and self._heartbeat is None:
+                self._heartbeat = threading.Thread(target=self._beat, daemon=True)
+                self._heartbeat.start()
+
+    def _beat(self):
+        """Refresh job.json while the job is queued / running, so other processes see it as alive."""
+        while not self.done:
+            time.sleep(JOB_HEARTBEAT)
+            if not self.done: self.save()
+        self._heartbeat = None
+
+    @classmethod
+    def load(cls, job_id, cookie="", clash_secret=""):
+        """Rebuild a job from disk (parameters only; checkpoints are replayed when it runs).
+
+        job.json holds no credentials; `cookie` / `clash_secret` are put back
+        into the Nature tasks for a job that is about to be resumed.
+        """
+        with open(os.path.join(JOBS_DIR, job_id, "job.json"), encoding="utf-8") as f: m = json.load(f)
+        nature_tasks = restore_task_credentials([tuple(t) for t in m["nature_tasks"]], cookie, clash_secret)
+        run = cls(nature_tasks, [tuple(t) for t in m["api_tasks"]], m["full_api"], m["enrich"],
+                  m["enrich_proxies"], m["filter_struct"], m["label"], m["job_id"], m["created"],
+                  WatchState(m["watch"]) if m.get("watch") else None, m.get("owner"))
+        # 不在本进程内存中的 queued / running 任务: 其他进程仍在心跳则只读查看, 否则说明上次运行被中断
+        if m["status"] in JOB_FINAL_STATES: run.status = m["status"]
+        elif job_owner_alive(m): run.status, run.external = m["status"], True
+        else: run.status = "interrupted"
+        run.nat_done, run.nat_total, run.api_done, run.api_total = m["nat_done"], m["nat_total"], m["api_done"], m["api_total"]
+        run.n_failed = m.get("n_failed", 0)
+        run._replay()
+        return run
+
+    def _checkpoint(self, kind, task, result):
+        line = json.dumps({"key": search_task_key(kind, task), "kind": kind, "result": result}, ensure_ascii=False, default=str)
+        with open(os.path.join(self.job_dir, "tasks.jsonl"), "a", encoding="utf-8") as f: f.write(line + "\n")
+
+    def _read_checkpoints(self):
+        path = os.path.join(self.job_dir, "tasks.jsonl")
+        if not os.path.exists(path): return []
+        entries = []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try: entries.append(json.loads(line))
+                except ValueError: continue  # 崩溃时写了一半的行
+        return entries
+
+    def _replay(self):
+        """Restore rows / logs from checkpoints; returns (finished task keys, planned S2 slices)."""
+        done_keys, slices = set(), []
+        tasks = {search_task_key(k, t): (k, t) for k, ts in (('nature', self.nature_tasks), ('api', self.api_tasks)) for t in ts}
+        for e in self._read_checkpoints():
+            done_keys.add(e["key"])
+            if e["kind"] == "plan":
+                slices.extend(tuple(t) for t in e["result"][0])
+                tasks.update({search_task_key('api', tuple(t)): ('api', tuple(t)) for t in e["result"][0]})
+                self.logs.extend(e["result"][1])
+                continue
+            rows, _err, logs = e["result"]
+            self.logs.extend(logs or [])
+            if rows: self._add_rows(rows)
+            if self.watch and e["key"] in tasks: self.watch.observe(*tasks[e["key"]], rows)
+        return done_keys, slices
+
+    def start(self):
+        self.status = "running"
+        self.save()
+        threading.Thread(target=self._work, daemon=True).start()
+        return self
+
+    def cancel(self):
+        self._cancelled = True
+        if self.scheduler: self.scheduler.cancel()
+        if self.status == "queued":
+            self.status = "cancelled"
+            self.save()
+
+    def _add_rows(self, rows):
+        fresh = []
+        for r in rows:
+            pid = r.get('PaperID')
+            if pid and pid in self._ids: continue
+            if pid: self._ids.add(pid)
+            fresh.append(r)
+        with self.lock:
+            self.rows.extend(fresh)
+            self.version += 1
+        return fresh
+
+    def _work(self):
+        self.rows, self.logs, self._ids = [], [], set()
+        self.n_failed, self._snap = 0, (-1, 0, [], 0.0)
+        done_keys, planned = self._replay()
+        sched = self.scheduler = SearchScheduler(enrich_proxies=self.enrich_proxies)
+        if done_keys: self.logs.append(f"♻️ 从检查点恢复 {len(done_keys)} 个已完成任务")
+        # 完整翻页时先规划切片，规划完成后由调度器提交; 已规划的切片直接取自检查点
+        if self.full_api:
+            api_todo = [('plan', t) for t in self.api_tasks if search_task_key('plan', t) not in done_keys] + [('api', t) for t in planned]
+        else:
+            api_todo = [('api', t) for t in self.api_tasks]
+        nat_todo = [('nature', t) for t in self.nature_tasks]
+        with self.lock:
+            self.nat_total, self.api_total = len(nat_todo), len(api_todo)
+            self.nat_done = sum(search_task_key(k, t) in done_keys for k, t in nat_todo)
+            self.api_done = sum(search_task_key(k, t) in done_keys for k, t in api_todo)
+        for kind, task in nat_todo + api_todo:
+            if search_task_key(kind, task) not in done_keys: sched.add(kind, task)
+        if self._cancelled: sched.cancel()
+        if self.enrich: sched.enrich([r for r in self.rows if str(r.get('Citations', 'N/A')) == "N/A"])
+        seen_api_ids = {r.get("paperId") for r in self.rows if r.get("paperId")}
+        try:
+            for t_type, t_info, result in sched.run():
+                try:
+                    if isinstance(result, Exception): raise result
+                    if t_type == 'enrich':
+                        with self.lock:
+                            self.logs.extend(result)
+                            self.version += 1
+                        continue
+                    if t_type == 'plan':
+                        slices, p_logs = result
+                        self._checkpoint(t_type, t_info, result)
+                        with self.lock:
+                            self.logs.extend(p_logs)
+                            self.api_total += len(slices) - 1
+                        continue
+                    r_list, err, l_list = result
+                    if l_list:
+                        with self.lock: self.logs.extend(l_list)
+                    rows = []
+                    if r_list and t_type == 'nature':
+                        rows = r_list
+                        fresh = self._add_rows(r_list)
+                        if self.enrich: sched.enrich(fresh)
+                        if self.watch: self.watch.observe(t_type, t_info, r_list)
+                    elif r_list:
+                        q_kw = t_info[0]  # query string used for this API call
+                        for p in r_list:
+                            pid = p.get("paperId")
+                            if pid and pid in seen_api_ids: continue
+                            if pid: seen_api_ids.add(pid)
+                            rows.append(normalize_api_result(p, q_kw))
+                        self._add_rows(rows)
+                        if self.watch: self.watch.observe(t_type, t_info, rows)
+                        if self.enrich: sched.skip_enrich({r['PaperID'] for r in rows if r['Citations'] != "N/A"})
+                    # 失败 (含部分页面失败) 的任务不写检查点, 恢复时整体重试, 已抓取的页面由缓存提供
+                    if not err: self._checkpoint(t_type, t_info, [rows, err, l_list])
+                    else:
+                        with self.lock: self.n_failed += 1
+                except Exception as e:
+                    with self.lock:
+                        self.logs.append(f"Main Loop Err: {e}")
+                        if t_type != 'enrich': self.n_failed += 1
+                finally:
+                    with self.lock:
+                        if t_type == 'nature':
+                            self.nat_done += 1
+                            self.nat_label = t_info[1]
+                        elif t_type == 'api':
+                            self.api_done += 1
+                            v_disp = "Global" if t_info[8] else (t_info[4][0][:15]+"..." if t_info[4] else "All")
+                            self.api_label = f"{v_disp} {t_info[1]}-{t_info[2]} @{t_info[9]}"
+                        self.enriching = self.enrich and self.nat_done >= self.nat_total and self.api_done >= self.api_total
+                    if t_type != 'enrich': self.save()
+            final = "cancelled" if self._cancelled else "partial" if self.n_failed else "done"
+            if final == "partial":
+                with self.lock: self.logs.append(f"⚠️ {self.n_failed} 个任务失败, 可继续该任务重试")
+        except Exception as e:
+            with self.lock: self.logs.append(f"Search Err: {e}")
+            final = "failed"
+        finally:
+            sched.close()
+        with self.lock:
+            self.status = final
+            self.version += 1
+        self.save()
+        if self.on_finish: self.on_finish(self)
+
+    def progress(self):
+        """(nature fraction, api fraction) for progress bars."""
+        with self.lock:
+            nat = self.nat_done / self.nat_total if self.nat_total else 1.0
+            api = min(1.0, self.api_done / self.api_total) if self.api_total else 1.0
+        return (1.0, 1.0) if self.status == "done" else (nat, api)
+
+    def snapshot(self):
+        """Rows so far with Nature / API near-duplicates merged.
+
+        While the job runs, the full merge is redone at most every
+        JOB_SNAPSHOT_DEDUP_EVERY seconds; rows that arrived since are appended
+        as-is. Finished jobs always get a full merge (once per version).
+        """
+        with self.lock:
+            version, rows, running = self.version, list(self.rows), self.status not in JOB_FINAL_STATES
+        snap_version, n_done, merged, t = self._snap
+        if snap_version == version: return merged
+        if running and n_done and len(rows) >= n_done and time.time() - t < JOB_SNAPSHOT_DEDUP_EVERY:
+            return merged + rows[n_done:]
+        # 合并 Nature / API 的重复论文, 避免重复翻译
+        self._snap = (version, len(rows), dedup_records(rows), time.time())
+        return self._snap[2]
+
+class JobManager:
+    """Process-wide registry and queue of search jobs, independent of any browser connection.
+
+    Each owner (a browser session token, or None for the command line) runs at
+    most JOB_MAX_RUNNING jobs at a time; its other jobs wait in submission
+    order, so one user's queue does not hold up another's. Jobs not in memory
+    (e.g. after a server restart) are loaded from disk on demand and can be
+    resumed from their checkpoints.
+    """
+    def __init__(self, max_running=JOB_MAX_RUNNING):
+        self.max_running = max_running
+        self.jobs = {}
+        self.lock = threading.RLock()
+
+    def submit(self, run):
+        run.status = "queued"
+        run.save()
+        with self.lock: self.jobs[run.job_id] = run
+        self._dispatch()
+        return run.job_id
+
+    def _dispatch(self, _finished=None):
+        with self.lock:
+            running = collections.Counter(r.owner for r in self.jobs.values() if r.status == "running")
+            for run in sorted((r for r in self.jobs.values() if r.status == "queued"), key=lambda r: r.created):
+                if running[run.owner] >= self.max_running: continue
+                running[run.owner] += 1
+                run.on_finish = self._dispatch
+                run.start()
+
+    def get(self, job_id):
+        if not job_id: return None
+        with self.lock:
+            if job_id in self.jobs: return self.jobs[job_id]
+        try: run = SearchRun.load(job_id)
+        except (OSError, ValueError, KeyError): return None
+        # 其他进程运行中的任务不缓存, 每次重新读取其最新进度
+        if run.external: return run
+        with self.lock: return self.jobs.setdefault(job_id, run)
+
+    def resume(self, job_id, cookie="", clash_secret=""):
+        """Re-queue an interrupted / partial / cancelled / failed job; finished tasks are replayed from checkpoints.
+
+        Credentials are not persisted, so the caller passes its current Nature
+        cookie and Clash secret for the resumed tasks.
+        """
+        with self.lock:
+            old = self.jobs.get(job_id)
+            if old and not old.done: return job_id
+            self.jobs.pop(job_id, None)
+        run = SearchRun.load(job_id, cookie, clash_secret)
+        if run.external: return job_id   # 仍由其他进程运行, 不重复启动
+        return self.submit(run)
+
+    def cancel(self, job_id):
+        run = self.get(job_id)
+        if run and not run.done and not run.external: run.cancel()
+
+    def list_jobs(self, limit=JOB_LIST_LIMIT, owner=None):
+        """Most recent jobs (in memory or on disk) as meta dicts, newest first; only `owner`'s jobs when given."""
+        metas = {}
+        if os.path.isdir(JOBS_DIR):
+            for job_id in sorted(os.listdir(JOBS_DIR), reverse=True):
+                if len(metas) >= limit: break
+                try:
+                    with open(os.path.join(JOBS_DIR, job_id, "job.json"), encoding="utf-8") as f: m = json.load(f)
+                except (OSError, ValueError): continue
+                if owner is not None and m.get("owner") != owner: continue
+                if m.get("status") not in JOB_FINAL_STATES:
+                    if job_owner_alive(m): m["external"] = True
+                    else: m["status"] = "interrupted"
+                metas[job_id] = m
+        with self.lock:
+            for job_id, run in self.jobs.items():
+                if run.external or (owner is not None and run.owner != owner): continue
+                with run.lock: metas[job_id] = run.meta()
+        return sorted(metas.values(), key=lambda m: m["created"], reverse=True)[:limit]
+
+job_manager = JobManager()
+
+# ================= 命令行批量检索 =================
+# 查询文件 (JSON / YAML) 的字段与默认值, 与界面侧边栏的默认设置一致
+QUERY_DEFAULTS = {
+    "keywords": "",                # "A/B; C/D" 或 [["A", "B"], ["C", "D"]]
+    "mode": "and",                 # and: 高级 (AND) 模式; or: 普通 (OR) 模式
+    "years": [2022, 2025],
+    "nature_journals": ["Nature Machine Intelligence", "Nature Computational Science", "Nature Communications"],
+    "api_journals": ["Science Advances", "AAAI", "ACL", "Findings of the Association for Computational Linguistics", "EMNLP", "ArXiv"],
+    "ignore_venue_filter": False,
+    "strict_filter": False,
+    "limit": 100,
+    "full_api": True,
+    "nature_pages": 2,
+    "full_abstract": True,
+    "enrich_citations": False,
+    "proxies": [],
+    "cookie": "",
+    "clash": None,                 # {"url": ..., "secret": ..., "group": ..., "nodes": [...]}; 启用节点轮换
+}
+OUTPUT_FORMATS = ("jsonl", "csv", "parquet")
+WATCH_SUFFIX = ".watch.json"
+
+def load_query_file(path):
+    """Read a JSON / YAML query file and fill in QUERY_DEFAULTS; raises ValueError on bad content."""
+    with open(path, encoding="utf-8") as f:
+        if path.endswith((".yaml", ".yml")):
+            if yaml is None: raise ValueError("读取 YAML 需要 PyYAML: pip install pyyaml")
+            spec = yaml.safe_load(f)
+        else:
+            spec = json.load(f)
+    if not isinstance(spec, dict): raise ValueError("查询文件应为一个对象 (键值对)")
+    unknown = set(spec) - set(QUERY_DEFAULTS)
+    if unknown: raise ValueError(f"未知字段: {', '.join(sorted(unknown))}")
+    spec = {**QUERY_DEFAULTS, **spec}
+    if not isinstance(spec["keywords"], str):
+        spec["keywords"] = "; ".join(g if isinstance(g, str) else "/".join(g) for g in spec["keywords"])
+    if isinstance(spec["proxies"], str): spec["proxies"] = [spec["proxies"]]
+    bad = [n for n in spec["nature_journals"] if n not in NATURE_JOURNALS_MAP]
+    if bad: raise ValueError(f"未知 Nature 期刊: {', '.join(bad)}")
+    return spec
+
+def search_run_from_spec(spec, label="", watch=None):
+    """Build the same SearchRun the online UI submits for these settings; `watch` limits it to papers after the marks."""
+    q_list_nat, q_list_api, filter_kws_struct = build_queries(spec["keywords"], str(spec["mode"]).lower() != "or")
+    if not q_list_nat: raise ValueError("请输入关键词")
+    s_y, e_y = (int(y) for y in spec["years"])
+    pm = ProxyManager()
+    pm.load_manual_proxies(";".join(spec["proxies"]))
+    use_proxy, prox_list = bool(pm.proxies), pm.proxies
+
+    clash = spec["clash"] or {}
+    clash_cfg = {"enabled": bool(clash), "url": clash.get("url", "http://127.0.0.1:9090").rstrip('/'),
+                 "secret": clash.get("secret", ""), "group": clash.get("group", "Proxy"), "nodes": list(clash.get("nodes") or [])}
+    if clash_cfg["enabled"] and not clash_cfg["nodes"]:
+        groups = ClashAPI(clash_cfg["url"], clash_cfg["secret"]).get_proxies()
+        clash_cfg["nodes"] = (groups.get(clash_cfg["group"]) or {}).get("all", [])
+
+    sel_nat_map = {n: NATURE_JOURNALS_MAP[n] for n in spec["nature_journals"]}
+    nature_tasks = []
+    if sel_nat_map:
+        nature_tasks = prepare_nature_tasks(q_list_nat, sel_nat_map, s_y, e_y, use_proxy, prox_list, spec["cookie"], clash_cfg,
+                                            spec["full_abstract"], filter_kws_struct, spec["nature_pages"], spec["strict_filter"])
+    api_tasks = []
+    if spec["ignore_venue_filter"] or spec["api_journals"]:
+        api_tasks = prepare_api_tasks(q_list_api, s_y, e_y, spec["limit"], spec["api_journals"], use_proxy, prox_list,
+                                      filter_kws_struct, spec["strict_filter"], spec["ignore_venue_filter"])
+    if watch:
+        nature_tasks, api_tasks = watch.apply("nature", nature_tasks), watch.apply("api", api_tasks)
+    label = label or f"{'; '.join(q_list_nat or q_list_api)[:60]} ({s_y}-{e_y})"
+    return SearchRun(nature_tasks, api_tasks, spec["full_api"], spec["enrich_citations"], list(prox_list) or None, filter_kws_struct, label,
+                     watch=watch)
+
+def write_results(records, out_path, fmt):
+    """Write the final (near-duplicate merged) rows; replaces out_path atomically."""
+    records = dedup_records(records)
+    tmp = out_path + ".tmp"
+    if fmt == "jsonl":
+        with open(tmp, "w", encoding="utf-8") as f:
+            for r in records: f.write(json.dumps(r, ensure_ascii=False, default=str) + "\n")
+        os.replace(tmp, out_path)
+        return len(records)
+    return write_frame(pd.DataFrame(records), out_path, fmt)
+
+def write_frame(df, out_path, fmt):
+    tmp = out_path + ".tmp"
+    if fmt == "parquet":
+        # 混合类型列 (如 Citations 的 "N/A") 统一按字符串写出
+        for col in df.columns[df.dtypes == object]: df[col] = df[col].map(lambda v: None if v is None else str(v))
+        df.to_parquet(tmp, index=False)
+    else:
+        df.to_csv(tmp, index=False, encoding="utf-8-sig")
+    os.replace(tmp, out_path)
+    return len(df)
+
+def append_results(records, out_path, fmt):
+    """Append the rows whose PaperID is not in the result store yet; returns how many were added."""
+    records = dedup_records(records)
+    known, old = set(), None
+    if os.path.exists(out_path):
+        if fmt == "jsonl":
+            with open(out_path, encoding="utf-8") as f: known = {json.loads(line).get("PaperID") for line in f if line.strip()}
+        else:
+            old = pd.read_parquet(out_path) if fmt == "parquet" else pd.read_csv(out_path, encoding="utf-8-sig")
+            known = set(old["PaperID"]) if "PaperID" in old else set()
+    delta = [r for r in records if r.get("PaperID") not in known]
+    if not delta: return 0
+    if fmt == "jsonl":
+        with open(out_path, "a", encoding="utf-8") as f:
+            for r in delta: f.write(json.dumps(r, ensure_ascii=False, default=str) + "\n")
+    else:
+        # CSV / Parquet 不能安全追加 (列可能不同), 合并后整体重写
+        new = pd.DataFrame(delta)
+        write_frame(new if old is None else pd.concat([old, new], ignore_index=True), out_path, fmt)
+    return len(delta)
+
+def follow_run(run, out_path, fmt, quiet=False, poll=0.5):
+    """Wait for a job while echoing its logs; JSONL rows are appended as they arrive.
+
+    The streamed JSONL only drops exact PaperID duplicates; once the job ends
+    every format is rewritten from the near-duplicate merged snapshot. Watch
+    jobs instead append only their new rows to the existing store, and save
+    their marks when the job completed.
+    """
+    stream = open(out_path, "w", encoding="utf-8") if fmt == "jsonl" and not run.watch else None
+    written, n_logs, last_pct = set(), 0, None
+    try:
+        while True:
+            finished = run.done
+            with run.lock: rows, logs = list(run.rows), run.logs[n_logs:]
+            n_logs += len(logs)
+            if not quiet:
+                for line in logs: print(line)
+            if stream:
+                for r in rows:
+                    # 恢复任务时 rows 会先清空再从检查点重放, 按 PaperID 去重即可
+                    if r.get("PaperID") in written: continue
+                    written.add(r.get("PaperID"))
+                    stream.write(json.dumps(r, ensure_ascii=False, default=str) + "\n")
+                stream.flush()
+            nat, api = run.progress()
+            pct = (int(nat * 100), int(api * 100), len(rows))
+            if not quiet and pct != last_pct:
+                print(f"[{run.job_id}] Nature {pct[0]}% | API {pct[1]}% | {pct[2]} 篇")
+                last_pct = pct
+            if finished: break
+            time.sleep(poll)
+    finally:
+        if stream: stream.close()
+    with run.lock: rows = list(run.rows)
+    if not run.watch: return write_results(rows, out_path, fmt)
+    n = append_results(rows, out_path, fmt)
+    # 只有完整跑完的任务才推进高水位; 否则下次从旧标记重新检索, 已入库的论文按 PaperID 跳过
+    if run.status == "done": run.watch.save()
+    return n
+
+def run_job(run, out_path, fmt, quiet=False):
+    """Follow one job to completion; Ctrl-C cancels it (resume later with --resume)."""
+    try:
+        return follow_run(run, out_path, fmt, quiet)
+    except KeyboardInterrupt:
+        print(f"\n⏹ 取消任务 {run.job_id}, 已完成的部分可用 --resume {run.job_id} 继续")
+        job_manager.cancel(run.job_id)
+        return follow_run(run, out_path, fmt, quiet=True)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Headless DeepSearch Pro runner: one search job per query file, rows written to JSONL / CSV / Parquet."
+    )
+    parser.add_argument("query_files", nargs="*", help="JSON or YAML query files (fields: see QUERY_DEFAULTS)")
+    parser.add_argument("--out-dir", default=".", help="Output directory; each file is named after its query file (default: .)")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, default="jsonl", help="Output format (default: jsonl)")
+    parser.add_argument("--proxy", default=None, help="Proxy URL(s) separated by ';', overriding the query files")
+    parser.add_argument("--watch", action="store_true",
+                        help="Incremental mode: only fetch papers newer than the last run and append them to the existing output")
+    parser.add_argument("--resume", action="append", default=[], metavar="JOB_ID", help="Resume an interrupted job from its checkpoints")
+    parser.add_argument("--cookie", default="", help="Nature cookie for --resume (credentials are not stored with the job)")
+    parser.add_argument("--clash-secret", default="", help="Clash controller secret for --resume")
+    parser.add_argument("--list", action="store_true", help="List recent jobs and exit")
+    parser.add_argument("-q", "--quiet", action="store_true", help="Only print a summary line per job")
+    args = parser.parse_args()
+
+    if args.list:
+        for m in job_manager.list_jobs():
+            print(f"{m['job_id']}  {m['status']:<11}  {m['n_rows']:>6} 篇  {m['label']}{'  (其他进程运行中)' if m.get('external') else ''}")
+        return 0
+    if not args.query_files and not args.resume:
+        parser.error("需要至少一个查询文件或 --resume JOB_ID")
+    os.makedirs(args.out_dir, exist_ok=True)
+
+    jobs = []
+    for path in args.query_files:
+        try:
+            spec = load_query_file(path)
+            if args.proxy is not None: spec["proxies"] = [args.proxy]
+            name = os.path.splitext(os.path.basename(path))[0]
+            out_path = os.path.join(args.out_dir, f"{name}.{args.format}")
+            watch = WatchState(out_path + WATCH_SUFFIX) if args.watch else None
+            run = search_run_from_spec(spec, label=os.path.basename(path), watch=watch)
+        except (OSError, ValueError) as e:
+            print(f"❌ {path}: {e}")
+            continue
+        if watch:
+            n_marked = sum(t[-1] is not None for t in run.nature_tasks + run.api_tasks)
+            print(f"👁 {path}: {n_marked}/{len(run.nature_tasks) + len(run.api_tasks)} 个任务从高水位之后检索")
+        jobs.append((run, out_path, args.format))
+    for job_id in args.resume:
+        try: run = job_manager.get(job_id)
+        except Exception: run = None
+        if run is None:
+            print(f"❌ 找不到任务 {job_id}")
+            continue
+        if run.external:
+            print(f"❌ 任务 {job_id} 仍在其他进程中运行")
+            continue
+        if run.watch:
+            # 增量任务写回原来的结果文件
+            out_path = run.watch.path[:-len(WATCH_SUFFIX)]
+            jobs.append((run, out_path, os.path.splitext(out_path)[1][1:]))
+        else:
+            jobs.append((run, os.path.join(args.out_dir, f"{job_id}.{args.format}"), args.format))
+
+    failed = len(args.query_files) + len(args.resume) - len(jobs)
+    for run, out_path, fmt in jobs:
+        # 已结束的任务 (中断 / 取消 / 失败) 从检查点重新排队; resume 会换成新载入的 SearchRun
+        run = job_manager.get(job_manager.resume(run.job_id, args.cookie, args.clash_secret) if run.done else job_manager.submit(run))
+        print(f"▶ {run.job_id}: {run.label} -> {out_path}")
+        n = run_job(run, out_path, fmt, args.quiet)
+        print(f"{'✅' if run.status == 'done' else '⚠️'} {run.job_id}: {run.status}, {'新增 ' if run.watch else ''}{n} 篇 -> {out_path}")
+        failed += run.status != "done"
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())